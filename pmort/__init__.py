@@ -6,18 +6,154 @@
 # See COPYING or http://www.opensource.org/licenses/mit-license.php.
 
 import logging
+import logging.config
 import os
+import re
+import sys
 import threading
-import signal
-
-logging.basicConfig(level = getattr(logging, os.environ.get('PMORT_LOG_LEVEL', 'warn').upper()))
 
 logger = logging.getLogger(__name__)
 
 from pmort.parameters import PARAMETERS
+from pmort.parameters import early_parameter
 from pmort.learners import LEARNERS
 from pmort.collectors import COLLECTORS
+from pmort.collectors import all_collectors
+from pmort.collectors import load_collectors
+from pmort.collectors import schedule
+from pmort.collectors import parse_schedules
+from pmort.collectors import parse_cost_multipliers
 from pmort import output
+from pmort import records
+from pmort.metrics import REGISTRY
+from pmort.metrics import start_metrics
+from pmort.executor import AsyncCollectorExecutor
+from pmort.executor import CollectorExecutor
+from pmort.retention import start_retention
+from pmort.ring import start_ring
+from pmort.scheduler import CollectorScheduler
+from pmort.throttle import start_throttle
+
+LEARNER_INTERVAL = REGISTRY.gauge('pmort_learner_interval_seconds', 'Last interval computed by each learner.')
+
+def write(name, collected, snapshot = None):
+    '''Write the output a collector returned under ``name``.
+
+    Records (a dictionary or a list of them) are written in a structured
+    format (cf. ``pmort.output.write_records``); anything else (text or
+    bytes) as is.
+
+    '''
+
+    if records.is_structured(collected):
+        output.write_records(name, collected, snapshot)
+    else:
+        output.write_output(name, collected, snapshot)
+
+def collect(name, collector, snapshot = None):
+    '''Run ``collector`` and write its output under ``name``.
+
+    Collectors that write their own output (e.g. scripts) return None;
+    those with a true ``writes_output`` attribute are given ``snapshot``.
+
+    '''
+
+    if getattr(collector, 'writes_output', False):
+        return collector(snapshot)
+
+    _ = collector()
+
+    if _ is None:
+        return
+
+    write(name, _, snapshot)
+
+def manifest_cache(registry):
+    '''Path of the manifest cache of ``registry`` (cf.
+    ``pmort.manifest.LazyRegistry.write_cache``).'''
+
+    return os.path.join(early_parameter('pmort.cache_directory'), 'manifest', registry.variable.lower() + '.json')
+
+def load_modules():
+    '''Import the collector and learner modules pmort uses.
+
+    The modules declare parameters; thus, this is done before parsing the
+    command line.  Every collector (including those in collectors.directory)
+    runs and is imported; of the learners, only the active one and those
+    collectors.schedules names are (all of them for --help).
+
+    '''
+
+    for registry in ( COLLECTORS, LEARNERS ):
+        registry.read_cache(manifest_cache(registry))
+
+    directory = early_parameter('collectors.directory')
+
+    if os.access(directory, os.R_OK):
+        load_collectors(module_basename = '', directory = directory, update_path = True)
+
+    COLLECTORS.load()
+
+    if any([ re.match('-h$|--help$', _) for _ in sys.argv[1:] ]):
+        LEARNERS.load()
+    else:
+        names = set([ early_parameter('learner.active') ] + re.findall(r'learner\s*=\s*([^\s,;]+)', early_parameter('collectors.schedules')))
+
+        for name in sorted(names):
+            try:
+                LEARNERS[name]
+            except KeyError:
+                logger.warning('unknown learner %s', name)
+
+    for registry in ( COLLECTORS, LEARNERS ):
+        registry.write_cache(manifest_cache(registry))
+
+def create_executor():
+    '''Collector executor of the engine selected by collectors.engine.'''
+
+    engine = PARAMETERS['collectors.engine']
+
+    if engine == 'asyncio':
+        return AsyncCollectorExecutor(PARAMETERS['collectors.workers'], write)
+
+    if engine != 'threads':
+        logger.warning('unknown collectors engine %s: using threads', engine)
+
+    return CollectorExecutor(PARAMETERS['collectors.workers'], write)
+
+def interval(schedule, intervals, multipliers):
+    '''Seconds until a collector with ``schedule`` should run again.
+
+    A fixed interval is used as is; otherwise, the interval of the
+    schedule's learner (or the active one) is multiplied by the multiplier
+    of the schedule's cost.
+
+    Arguments
+    ---------
+
+    :``schedule``:    ``pmort.collectors.Schedule`` of the collector.
+    :``intervals``:   Dictionary of learner intervals already computed this
+                      cycle (filled in as learners are consulted).
+    :``multipliers``: Dictionary of cost multipliers.
+
+    '''
+
+    if schedule.interval is not None:
+        return schedule.interval
+
+    learner = schedule.learner or PARAMETERS['learner.active']
+
+    if learner not in LEARNERS:
+        logger.warning('unknown learner %s: using %s', learner, PARAMETERS['learner.active'])
+
+        learner = PARAMETERS['learner.active']
+
+    if learner not in intervals:
+        intervals[learner] = LEARNERS[learner].time()
+
+        LEARNER_INTERVAL.set(intervals[learner], learner = learner)
+
+    return intervals[learner] * multipliers.get(schedule.cost, 1.0)
 
 def main():
     '''Main function for pmort.  Does all the things…sort of.
@@ -35,28 +171,87 @@ def main():
 
     error = 0
 
-    global PARAMETERS
-    PARAMETERS = PARAMETERS.parse()
+    logging.basicConfig(level = getattr(logging, os.environ.get('PMORT_LOG_LEVEL', 'warn').upper()))
+
+    load_modules()
+
+    PARAMETERS.parse()
 
     if os.access(PARAMETERS['logging.configuration_file_path'], os.R_OK):
         logging.config.fileConfig(PARAMETERS['logging.configuration_file_path'])
 
     # TODO Add last crash symlink.
 
+    overrides = parse_schedules(PARAMETERS['collectors.schedules'])
+
+    try:
+        multipliers = parse_cost_multipliers(PARAMETERS['collectors.cost_multipliers'])
+    except ValueError as e:
+        logger.error('%s', e)
+
+        return 1
+
+    # Imported with the collectors (cf. load_modules); importing it with pmort
+    # would run it twice with python -m pmort.collectors.execute.
+    from pmort.collectors.execute import install_sighup_handler
+
+    install_sighup_handler()
+
+    start_retention()
+
+    capture = start_ring()
+
+    throttle = start_throttle()
+
+    start_metrics()
+
+    executor = create_executor()
+    scheduler = CollectorScheduler()
+
+    REGISTRY.gauge('pmort_threads', 'Threads alive in pmort.', threading.active_count)
+    REGISTRY.gauge('pmort_cycle_lag_seconds', 'Seconds the last cycle woke after its deadline.', lambda: scheduler.lag)
+    REGISTRY.gauge('pmort_cycles_missed', 'Cycles skipped because an earlier one ran past them since start.', lambda: scheduler.missed)
+    REGISTRY.gauge('pmort_collectors_running', 'Collectors currently executing.', lambda: executor.running)
+    REGISTRY.gauge('pmort_collectors_queued', 'Collectors waiting for a free worker.', lambda: executor.queued)
+
     while True:
-        for collector in COLLECTORS:
-            thread = threading.Thread(
-                    target = output.write_output,
-                    group = 'pmort.collectors',
-                    name = collector.__name__,
-                    args = (collector.__name__.replace('_collector', ''), collector())
-                    )
-            thread.start()
-
-        logging.info('started %s threads', len(COLLECTORS))
-        logging.info('active threads: %s', threading.active_count())
-
-        signal.alarm(LEARNERS[PARAMETERS['learner.active']].time())
-        signal.pause()
+        collectors = all_collectors()
+
+        scheduler.update(collectors.keys())
+
+        if capture is not None:
+            snapshot = capture.begin_snapshot()
+        else:
+            snapshot = output.begin_snapshot()
+
+        intervals = {}
+
+        for name in scheduler.due():
+            collector_schedule = schedule(name, collectors[name], overrides)
+            seconds = interval(collector_schedule, intervals, multipliers)
+
+            if throttle is not None:
+                seconds = throttle.stretch(seconds)
+
+            if throttle is None or throttle.allows(collector_schedule):
+                executor.collect(name, collectors[name], snapshot)
+            else:
+                logger.info('throttle: skipping %s', name)
+
+            scheduler.reschedule(name, seconds)
+
+        logger.info('learner intervals: %s', intervals)
+
+        executor.wait(max(min(PARAMETERS['collectors.deadline'], scheduler.remaining()), 0))
+
+        snapshot.commit()
+
+        logger.info('collector statistics: %s', executor.statistics())
+        logger.info('active threads: %s', threading.active_count())
+
+        if throttle is not None:
+            throttle.update()
+
+        scheduler.sleep()
 
     return error
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import logging
+import os
+import struct
+import threading
+import datetime
+import time
+import collections
+import io
+import itertools
+import shutil
+
+from pmort import compression
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'PMRT'
+HEADER = struct.Struct('>4sdBHQ')
+
+SEGMENT_EXTENSION = '.seg'
+INDEX_EXTENSION = '.idx'
+
+CHUNK_SIZE = 65536
+
+Record = collections.namedtuple('Record', [ 'timestamp', 'name', 'segment', 'offset', 'length' ])
+
+class ArchiveError(Exception):
+    pass
+
+def index_line(record):
+    '''Line of a segment's index describing ``record``.'''
+
+    return '{0:.6f}\t{1}\t{2}\t{3}\n'.format(record.timestamp, record.offset, record.length, record.name)
+
+def record_size(record):
+    '''Bytes ``record`` takes in its segment and index.'''
+
+    return HEADER.size + len(record.name.encode('utf-8')) + record.length + len(index_line(record).encode('utf-8'))
+
+class SegmentArchive(object):
+    '''Append-only segmented storage for collection output.
+
+    Rather than a directory per snapshot and a file per collector, every
+    collector's output is appended as a framed record to the active segment
+    file in ``directory`` (for example, /var/spool/pmort/segments):
+
+    =======  ======  =======================================================
+    Field    Format  Description
+    =======  ======  =======================================================
+    magic    4s      b'PMRT'
+    time     d       Snapshot time in seconds since the epoch
+    codec    B       Compression identifier (cf. ``pmort.compression``)
+    name     H       Length of the collector name
+    payload  Q       Length of the (possibly compressed) payload
+    =======  ======  =======================================================
+
+    The header (big endian) is followed by the UTF-8 collector name and the
+    payload.  Each segment has a companion index (same name with an .idx
+    extension) with one tab separated line per record: time, offset of the
+    record in the segment, length of the payload and collector name.
+
+    Segments are named by the time of the snapshot starting them (with a
+    _NNNN suffix if that name is taken) and rotated once they exceed a size
+    or age; thus, writes are
+    always sequential, the number of files stays small, and expiring old
+    output means deleting whole segments.
+
+    Arguments
+    ---------
+
+    :``directory``:        Directory holding the segment and index files.
+    :``segment_size``:     Bytes after which the active segment is rotated.
+    :``segment_duration``: Seconds after which the active segment is rotated.
+
+    '''
+
+    def __init__(self, directory, segment_size = 67108864, segment_duration = 3600):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.segment_duration = segment_duration
+
+        self._lock = threading.Lock()
+
+        self._segment = None
+        self._segment_fh = None
+        self._index_fh = None
+        self._segment_started = None
+
+    def _rotate(self, timestamp):
+        self.close()
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        name = datetime.datetime.fromtimestamp(timestamp).strftime('%Y%m%d%H%M%S%f')
+
+        # Rotating within one snapshot (e.g. on size) needs a new name; the
+        # suffix sorts after the plain name.
+        for sequence in itertools.count(1):
+            if not any([ os.path.exists(os.path.join(self.directory, name + _)) for _ in ( SEGMENT_EXTENSION, INDEX_EXTENSION ) ]):
+                break
+
+            name = '{0}_{1:04d}'.format(name.split('_', 1)[0], sequence)
+
+        self._segment = os.path.join(self.directory, name + SEGMENT_EXTENSION)
+
+        logger.info('starting segment %s', self._segment)
+
+        self._segment_fh = open(self._segment, 'ab')
+        self._index_fh = open(os.path.join(self.directory, name + INDEX_EXTENSION), 'a')
+        self._segment_started = time.time()
+
+    def _rotate_needed(self):
+        if self._segment_fh is None:
+            return True
+
+        if self._segment_fh.tell() >= self.segment_size:
+            return True
+
+        return time.time() - self._segment_started >= self.segment_duration
+
+    def append(self, timestamp, name, payload, codec = None):
+        '''Append a record to the active segment.
+
+        Arguments
+        ---------
+
+        :``timestamp``: Seconds since the epoch the record belongs to.
+        :``name``:      Name of the collector that produced ``payload``.
+        :``payload``:   Bytes (already compressed with ``codec``) to record or
+                        a seekable binary file object holding them (copied
+                        from its start in pieces).
+        :``codec``:     ``pmort.compression.Codec`` used on ``payload`` or
+                        None.
+
+        Returns
+        -------
+
+        The ``Record`` appended.
+
+        '''
+
+        encoded_name = name.encode('utf-8')
+
+        if hasattr(payload, 'read'):
+            length = payload.seek(0, os.SEEK_END)
+            payload.seek(0)
+        else:
+            length = len(payload)
+            payload = io.BytesIO(payload)
+
+        header = HEADER.pack(MAGIC, timestamp, codec.identifier if codec is not None else 0, len(encoded_name), length)
+
+        with self._lock:
+            if self._rotate_needed():
+                self._rotate(timestamp)
+
+            offset = self._segment_fh.tell()
+
+            self._segment_fh.write(header + encoded_name)
+            shutil.copyfileobj(payload, self._segment_fh, CHUNK_SIZE)
+            self._segment_fh.flush()
+
+            record = Record(timestamp, name, self._segment, offset, length)
+
+            self._index_fh.write(index_line(record))
+            self._index_fh.flush()
+
+            return record
+
+    def close(self):
+        '''Close the active segment (the next append starts a new one).'''
+
+        if self._segment_fh is not None:
+            self._segment_fh.close()
+            self._index_fh.close()
+
+        self._segment = self._segment_fh = self._index_fh = None
+
+    def segments(self):
+        '''Paths of all segments, oldest first.'''
+
+        if not os.path.isdir(self.directory):
+            return []
+
+        return sorted([ os.path.join(self.directory, _) for _ in os.listdir(self.directory) if _.endswith(SEGMENT_EXTENSION) ])
+
+    def remove_segment(self, segment):
+        '''Delete ``segment`` and its index; returns the bytes freed.'''
+
+        freed = 0
+
+        with self._lock:
+            if segment == self._segment:
+                self.close()
+
+            for path in ( segment, segment[:-len(SEGMENT_EXTENSION)] + INDEX_EXTENSION ):
+                try:
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning('could not remove %s', path)
+                    logger.exception(e)
+
+        return freed
+
+    def records(self, segment):
+        '''Records in ``segment`` according to its index.'''
+
+        with open(segment[:-len(SEGMENT_EXTENSION)] + INDEX_EXTENSION, 'r') as index_fh:
+            for line in index_fh:
+                _ = line.rstrip('\n').split('\t', 3)
+
+                if len(_) != 4:
+                    logger.warning('skipping damaged index line in %s', segment)
+                    continue
+
+                yield Record(float(_[0]), _[3], segment, int(_[1]), int(_[2]))
+
+def read_record(record):
+    '''Read and decompress the payload of ``record``.
+
+    Raises
+    ------
+
+    ArchiveError if the segment doesn't hold a valid record at the offset.
+
+    '''
+
+    with open(record.segment, 'rb') as segment_fh:
+        segment_fh.seek(record.offset)
+
+        header = segment_fh.read(HEADER.size)
+
+        if len(header) != HEADER.size:
+            raise ArchiveError('truncated record in {0} at {1}'.format(record.segment, record.offset))
+
+        magic, timestamp, codec, name_length, payload_length = HEADER.unpack(header)
+
+        if magic != MAGIC:
+            raise ArchiveError('bad record in {0} at {1}'.format(record.segment, record.offset))
+
+        segment_fh.seek(name_length, os.SEEK_CUR)
+
+        payload = segment_fh.read(payload_length)
+
+    codec = compression.codec_by_identifier(codec)
+
+    if codec is not None:
+        payload = codec.decompress(payload)
+
+    return payload
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+def get_archive(directory, segment_size = 67108864, segment_duration = 3600):
+    '''Shared ``SegmentArchive`` for ``directory`` (created on first use).'''
+
+    with _archives_lock:
+        if directory not in _archives:
+            _archives[directory] = SegmentArchive(directory, segment_size, segment_duration)
+
+        return _archives[directory]
@@ -7,14 +7,15 @@
 
 __all__ = [
         'COLLECTORS',
+        'GENERATORS',
         ]
 
 import logging
+import math
 import os
-import sys
-import itertools
-import importlib
+import collections
 
+from pmort.manifest import LazyRegistry
 from pmort.parameters import PARAMETERS
 from pmort.parameters import CONFIGURATION_DIRECTORY
 
@@ -30,66 +31,245 @@ PARAMETERS.add_parameter(
                 'Default: %(default)s'
         )
 
-COLLECTORS = {}
+PARAMETERS.add_parameter(
+        options = [ '--workers', ],
+        group = 'collectors',
+        default = 4,
+        type = int,
+        help = \
+                'Number of threads used to run collectors.  Collectors ' \
+                'beyond this number wait for a free thread.  Default: ' \
+                '%(default)s'
+        )
 
-# TODO Clean up this module …
+PARAMETERS.add_parameter(
+        options = [ '--engine', ],
+        group = 'collectors',
+        metavar = 'ENGINE',
+        default = 'threads',
+        help = \
+                'How collectors are run: threads (a pool of ' \
+                'collectors.workers threads) or asyncio (an event loop ' \
+                'running script collectors as asyncio subprocesses and ' \
+                'other collectors in a pool of collectors.workers threads, ' \
+                'with output written by a single writer).  ' \
+                'Default: %(default)s'
+        )
 
-def load_collectors(module_basename = __name__, directory = os.path.dirname(__file__), update_path = False):
-    '''Load all modules (allowing collectors to register) in directory.
+PARAMETERS.add_parameter(
+        options = [ '--deadline', ],
+        group = 'collectors',
+        default = 60.0,
+        type = float,
+        help = \
+                'Maximum number of seconds a cycle waits for its ' \
+                'collectors.  Collectors still running at the deadline are ' \
+                'skipped in later cycles until they finish.  Default: ' \
+                '%(default)s'
+        )
 
-    All python modules in the given directory will be imported.  Collectors
-    should be registering themselves by adding themselves to the COLLECTORS
-    dict provided by this module.
+PARAMETERS.add_parameter(
+        options = [ '--schedules', ],
+        group = 'collectors',
+        default = '',
+        help = \
+                'Per collector schedules overriding what collectors ' \
+                'declare.  Entries are separated by semicolons and have the ' \
+                'form NAME: KEY=VALUE, ... where KEY is interval (fixed ' \
+                'seconds), cost (a class in cost_multipliers) or learner ' \
+                '(a learner name); e.g. "load_average: interval=5; bash ' \
+                'ps.sh: cost=expensive".  Default: %(default)s'
+        )
 
-    Parameters
-    ----------
+PARAMETERS.add_parameter(
+        options = [ '--cost-multipliers', ],
+        group = 'collectors',
+        default = 'cheap=1, normal=1, expensive=5',
+        help = \
+                'Multiple of the learner\'s interval each cost class of ' \
+                'collector runs at.  Default: %(default)s'
+        )
 
-    :``module_basename``: Module name prefix for loaded modules. Defaults to
-                          the name of this module.
-    :``directory``:       Directory to recursively load python modules from.
-                          Defaults to this module's directory.
-    :``update_path``:     If True, the system path for modules is updated to
-                          include ``directory``; otherwise, it is left alone.
+# Collectors (name → callable); modules are imported when first looked up
+# (cf. ``load_collectors``).
+COLLECTORS = LazyRegistry('COLLECTORS', markers = ( 'GENERATORS', ))
+
+# Functions returning a dict of collectors (name → callable) discovered at
+# run time (e.g. collector scripts) to be scheduled alongside COLLECTORS.
+GENERATORS = []
+
+Schedule = collections.namedtuple('Schedule', [ 'interval', 'cost', 'learner' ])
+
+def all_collectors():
+    '''All collectors: those in COLLECTORS and those from GENERATORS.'''
+
+    collectors = COLLECTORS.load().loaded()
+
+    for generator in GENERATORS:
+        try:
+            collectors.update(generator())
+        except Exception as e:
+            logger.warning('failed generating collectors from %s', generator)
+            logger.exception(e)
+
+    return collectors
+
+def _parse_options(text):
+    '''KEY=VALUE pairs separated by commas or whitespace as a dict.'''
+
+    options = {}
+
+    for _ in text.replace(',', ' ').split():
+        if '=' not in _:
+            logger.warning('ignoring malformed option: %s', _)
+            continue
+
+        key, value = _.split('=', 1)
+
+        options[key.strip()] = value.strip()
+
+    return options
+
+def parse_interval(value, source = 'collector'):
+    '''Fixed interval (positive seconds) from ``value`` or None.
+
+    Values that aren't positive numbers (e.g. 5m) are logged (naming
+    ``source``) and ignored; the collector then follows its learner.
 
     '''
 
-    if update_path:
-        update_path = bool(sys.path.count(directory))
-        sys.path.append(directory)
+    if value is None:
+        return None
 
-    logger.info('loading submodules of %s', module_basename)
-    directory = os.path.dirname(__file__)
+    try:
+        interval = float(value)
+    except (TypeError, ValueError):
+        interval = None
 
-    filenames = itertools.chain(*[ [ os.path.join(_[0], filename) for filename in _[2] ] for _ in os.walk(directory) if len(_[2]) ])
+    if interval is None or not math.isfinite(interval) or interval <= 0:
+        logger.warning('ignoring invalid interval of %s: %s (using its learner)', source, value)
 
-    module_names = []
-    for filename in filenames:
-        if filename.endswith('.py'):
-            _ = filename
+        return None
 
-            _ = _.replace(directory + '/', '')
-            _ = _.replace('__init__.py', '')
-            _ = _.replace('.py', '')
+    return interval
 
-            if len(_):
-                module_names.append(module_basename + '.' + _)
+def parse_schedules(text):
+    '''Parse a collectors.schedules value into {name: {key: value}}.
 
-    logger.debug('modules found: %s', list(module_names))
+    Invalid intervals are dropped (cf. ``parse_interval``).
 
-    for module_name in module_names:
-        logger.info('loading collector %s', module_name)
+    '''
+
+    schedules = {}
+
+    for entry in text.split(';'):
+        if not len(entry.strip()):
+            continue
+
+        if ':' not in entry:
+            logger.warning('ignoring malformed schedule: %s', entry)
+            continue
+
+        name, options = entry.split(':', 1)
+
+        options = _parse_options(options)
+
+        if 'interval' in options and parse_interval(options['interval'], name.strip()) is None:
+            del options['interval']
+
+        schedules[name.strip()] = options
+
+    return schedules
+
+def parse_cost_multipliers(text):
+    '''Parse a collectors.cost_multipliers value into {cost: multiplier}.
+
+    Raises
+    ------
 
+    ValueError if a multiplier isn't a positive number.
+
+    '''
+
+    multipliers = {}
+
+    for cost, multiplier in _parse_options(text).items():
         try:
-            importlib.import_module(module_name)
-        except ImportError as e:
-            logger.warning('failed loading %s', module_name)
-            logger.exception(e)
-        else:
-            logger.info('successfully loaded %s', module_name)
+            multipliers[cost] = float(multiplier)
+        except ValueError:
+            multipliers[cost] = None
+
+        if multipliers[cost] is None or not math.isfinite(multipliers[cost]) or multipliers[cost] <= 0:
+            raise ValueError('invalid collectors.cost_multipliers: multiplier of {0} must be a positive number, not {1}'.format(cost, multiplier))
+
+    return multipliers
+
+def schedule(name, collector, overrides = None):
+    '''Schedule for a collector.
+
+    Collectors declare their schedule with the attributes ``interval``
+    (fixed seconds between runs), ``cost`` (cheap, normal or expensive) and
+    ``learner`` (name of the learner to follow).  The ``overrides`` (cf.
+    ``parse_schedules``) take precedence over what's declared.  Anything left
+    unspecified defaults to no fixed interval, normal cost and the active
+    learner (None).
+
+    Arguments
+    ---------
+
+    :``name``:      Name of the collector.
+    :``collector``: Collector (callable) being scheduled.
+    :``overrides``: Result of ``parse_schedules``.  Default: parsed
+                    collectors.schedules.
+
+    Returns
+    -------
+
+    The ``Schedule`` for the collector.
+
+    '''
+
+    if overrides is None:
+        overrides = parse_schedules(PARAMETERS['collectors.schedules'])
+
+    options = {
+            'interval': getattr(collector, 'interval', None),
+            'cost': getattr(collector, 'cost', 'normal'),
+            'learner': getattr(collector, 'learner', None),
+            }
+
+    options.update(overrides.get(name, {}))
+
+    return Schedule(parse_interval(options['interval'], name), options['cost'], options['learner'])
+
+def load_collectors(module_basename = __name__, directory = os.path.dirname(__file__), update_path = False, lazy = False):
+    '''Add the modules (allowing collectors to register) in directory to the
+    manifest of COLLECTORS.
+
+    Modules aren't imported here: a module is imported the first time one of
+    the collectors it registers (by adding itself to the COLLECTORS dict
+    provided by this module) is looked up or when all collectors are needed
+    (cf. ``all_collectors``).
+
+    Parameters
+    ----------
+
+    :``module_basename``: Module name prefix for loaded modules. Defaults to
+                          the name of this module.
+    :``directory``:       Directory to recursively load python modules from.
+                          Defaults to this module's directory.
+    :``update_path``:     If True, the system path for modules is updated to
+                          include ``directory`` while its modules are
+                          imported; otherwise, it is left alone.
+    :``lazy``:            If True, ``directory`` is only scanned when
+                          COLLECTORS is first used.
+
+    '''
+
+    logger.info('loading submodules of %s from %s', module_basename or 'collectors', directory)
 
-    if update_path:
-        sys.path.remove(directory)
+    COLLECTORS.scan(module_basename, directory, update_path = update_path, lazy = lazy)
 
-load_collectors()
-if os.access(PARAMETERS['collectors.directory'], os.R_OK):
-    load_collectors(module_basename = '', directory = PARAMETERS['collectors.directory'], update_path = True)
+# The collectors.directory modules are added by ``pmort.main`` once the
+# parameters are known.
+load_collectors(lazy = True)
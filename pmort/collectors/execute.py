@@ -5,19 +5,31 @@
 # pmort is freely distributable under the terms of an MIT-style license.
 # See COPYING or http://www.opensource.org/licenses/mit-license.php.
 
+import asyncio
+import atexit
 import logging
 import os
-import itertools
 import subprocess
 import re
+import itertools
+import signal
+import threading
+import functools
 
 from pmort.parameters import PARAMETERS
 from pmort.parameters import CONFIGURATION_DIRECTORY
-from pmort.collectors import COLLECTORS
-from pmort.output import write_output
+from pmort.collectors import GENERATORS
+from pmort.collectors import parse_interval
+from pmort.helper import Helper
+from pmort.output import open_output
+from pmort.output import current_snapshot
+from pmort.output import OUTPUT_BYTES
+from pmort.metrics import REGISTRY
 
 logger = logging.getLogger(__name__)
 
+SCRIPT_RUNS = REGISTRY.counter('pmort_script_runs_total', 'Collector script runs by status (ok, error, timeout or truncated).')
+
 PARAMETERS.add_parameter(
         options = [ '--directory' ],
         group = 'collector_execute',
@@ -27,12 +39,179 @@ PARAMETERS.add_parameter(
                 'Default: %(default)s'
         )
 
+PARAMETERS.add_parameter(
+        options = [ '--timeout' ],
+        group = 'collector_execute',
+        default = 30.0,
+        type = float,
+        help = \
+                'Number of seconds a script may run before it (and any ' \
+                'processes it started) is killed.  Output produced before ' \
+                'the kill is still recorded.  Default: %(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--maximum-output-size' ],
+        group = 'collector_execute',
+        default = 16777216,
+        type = int,
+        help = \
+                'Maximum number of bytes recorded from a single script.  A ' \
+                'script producing more output is killed and its output ' \
+                'truncated.  Zero disables the limit.  Default: %(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--restart-delay' ],
+        group = 'collector_execute',
+        default = 1.0,
+        type = float,
+        help = \
+                'Seconds before a persistent script (declaring ' \
+                'mode=persistent) that exited or failed is restarted; ' \
+                'doubled for each consecutive failure.  Default: %(default)s'
+        )
+
+CHUNK_SIZE = 65536
+
+HEADER_LINES = 5
+
+_SCRIPTS_CACHE = {}
+_SCRIPTS_CACHE_LOCK = threading.Lock()
+
+_HELPERS = {}
+_HELPERS_LOCK = threading.Lock()
+
+def _stamp(path):
+    '''Modification time and mode of path (None if it's gone).'''
+
+    try:
+        _ = os.stat(path)
+    except OSError:
+        return None
+
+    return ( _.st_mtime, _.st_mode )
+
+def clear_scripts_cache(*args):
+    '''Forget all cached ``find_scripts`` results.
+
+    Accepts (and ignores) any arguments so it can be used directly as a
+    signal handler.
+
+    '''
+
+    logger.info('clearing scripts cache')
+
+    with _SCRIPTS_CACHE_LOCK:
+        _SCRIPTS_CACHE.clear()
+
+def parse_script_options(line, source = 'script'):
+    '''Options from a "# pmort: KEY=VALUE ..." script header line (or None).
+
+    An invalid interval is dropped (cf.
+    ``pmort.collectors.parse_interval``).
+
+    '''
+
+    _ = re.match(r'^\s*#\s*pmort:\s*(.*)$', line)
+
+    if _ is None:
+        return None
+
+    options = dict([ option.split('=', 1) for option in _.group(1).replace(',', ' ').split() if '=' in option ])
+
+    if 'interval' in options and parse_interval(options['interval'], source) is None:
+        del options['interval']
+
+    return options
+
+def _scan_scripts(directory):
+    '''Walk directory for scripts, their options and the stamps examined.'''
+
+    logger.info('scanning %s for scripts', directory)
+
+    stamps = [ ( directory, _stamp(directory) ) ]
+    filenames = []
+
+    for dirpath, dirnames, _ in os.walk(directory):
+        if dirpath != directory:
+            stamps.append(( dirpath, _stamp(dirpath) ))
+
+        filenames.extend([ os.path.join(dirpath, filename) for filename in _ ])
+
+    filenames = [ _ for _ in filenames if not re.search(r'\.py[co]?$', _) ]
+
+    stamps.extend([ ( _, _stamp(_) ) for _ in filenames ])
+
+    filenames = [ _ for _ in filenames if os.access(_, os.X_OK) ]
+
+    scripts = []
+    options = {}
+
+    for filename in filenames:
+        with open(filename, 'r') as script_fh:
+            _ = script_fh.readline().strip()
+
+            if not _.startswith('#!'):
+                continue
+
+            scripts.append(_[2:].split() + [ filename ])
+
+            for line in itertools.islice(script_fh, HEADER_LINES):
+                _ = parse_script_options(line, filename)
+
+                if _ is not None:
+                    options[filename] = _
+                    break
+
+    return scripts, stamps, options
+
+def _cached_scan(directory):
+    with _SCRIPTS_CACHE_LOCK:
+        cached = _SCRIPTS_CACHE.get(directory)
+
+    if cached is not None and all([ _stamp(path) == stamp for path, stamp in cached[1] ]):
+        logger.debug('using cached scripts for %s', directory)
+    else:
+        cached = _scan_scripts(directory)
+
+        with _SCRIPTS_CACHE_LOCK:
+            _SCRIPTS_CACHE[directory] = cached
+
+    return cached
+
+def script_options(directory = os.path.dirname(__file__)):
+    '''Options declared by the scripts in directory.
+
+    Scripts declare options in a comment within the first few lines after
+    the shebang, for example::
+
+        #!/bin/bash
+        # pmort: cost=expensive interval=300
+
+    Returns
+    -------
+
+    Dictionary mapping script file names to dictionaries of their options.
+    Shares ``find_scripts``'s cache.
+
+    '''
+
+    return dict([ ( filename, dict(options) ) for filename, options in _cached_scan(directory)[2].items() ])
+
 def find_scripts(directory = os.path.dirname(__file__)):
     '''Find executable scripts (with shebang) in specified directory.
 
     Finds the scripts that can be executed in the specified directory.  Any
     scripts that are missing a shebang or the executable bit will be skipped.
 
+    Results are cached per directory and only recomputed when the
+    modification time or mode of a directory or file seen by the previous
+    scan changes (a new file changes its directory's modification time), or
+    after ``clear_scripts_cache`` (bound to SIGHUP).  Checking the cache costs
+    one ``stat`` per directory and file rather than a walk and an open of
+    every executable.
+
     .. note::
         All python files are excluded as it's assumed that the main collector
         loading function will load those and run them.
@@ -51,58 +230,343 @@ def find_scripts(directory = os.path.dirname(__file__)):
 
     logger.info('finding scripts')
 
-    filenames = itertools.chain(*[ [ os.path.join(_[0], filename) for filename in _[2] ] for _ in os.walk(directory) if len(_[2]) ])
+    scripts = [ list(_) for _ in _cached_scan(directory)[0] ]
 
-    filenames = [ _ for _ in filenames if not re.search('\.py[co]?$', _) ]
-    filenames = [ _ for _ in filenames if os.access(_, os.X_OK) ]
+    logger.debug('scripts: %s', scripts)
 
-    scripts = []
+    return scripts
 
-    for filename in filenames:
-        with open(filename, 'r') as script_fh:
-            _ = script_fh.readline().strip()
+def script_name(script):
+    '''Output name for the given script command line.'''
 
-            if _.startswith('#!'):
-                scripts.append(_[2:].split() + [ filename ])
+    return ' '.join([ _.rsplit('/', 1)[-1] for _ in script ])
 
-    logger.debug('scripts: %s', scripts)
+def _kill(process, expired = None):
+    '''Kill process and its session; set expired (if given) first.'''
 
-    return scripts
+    if expired is not None:
+        expired.set()
 
-def execute_collector():
-    '''Collector—Execute'''
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
 
-    logger.info('running execute')
+def execute_script(script, timeout = None, maximum_size = None, snapshot = None):
+    '''Execute script and stream its output.
 
-    scripts = []
-    scripts.extend(find_scripts())
-    scripts.extend(find_scripts(PARAMETERS['collector_execute.directory']))
+    The script is started in its own session so that, if it's still running
+    after ``timeout`` seconds or exceeds ``maximum_size`` bytes of output, it
+    and every process it spawned can be killed together.
 
-    errors = 0
+    The script's standard output is copied in ``CHUNK_SIZE`` pieces straight
+    into the handle from ``open_output``; thus, memory use does not depend on
+    how much the script writes.  Whatever the script wrote before finishing
+    (or being killed) is recorded.
 
-    for script in scripts:
-        logger.info('executing %s', script)
+    Arguments
+    ---------
 
-        try:
-            output = subprocess.check_output(script)
-        except subprocess.CalledProcessError as e:
-            logger.warning('error in %s', script)
-            logger.exception(e)
+    :``script``:       Command line (as returned by ``find_scripts``) to
+                       execute.
+    :``timeout``:      Seconds before the script is killed; None never kills
+                       it.
+    :``maximum_size``: Bytes of output recorded before the script is killed;
+                       None never kills it.
+    :``snapshot``:     ``Snapshot`` the output is written into.  Default:
+                       current snapshot.
+
+    Returns
+    -------
+
+    'ok', 'error' (non-zero exit status), 'timeout', or 'truncated'.
+
+    '''
+
+    logger.info('executing %s', script)
+
+    status = 'ok'
+    size = 0
+
+    process = subprocess.Popen(script, stdout = subprocess.PIPE, start_new_session = True)
 
-            errors += 1
+    expired = threading.Event()
 
-            continue
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, _kill, ( process, expired ))
+        timer.daemon = True
+        timer.start()
 
-        _ = ' '.join([ _.rsplit('/', 1)[-1] for _ in script ])
-        write_output(_, output.decode('utf-8'))
+    try:
+        with open_output(script_name(script), snapshot) as output_fh:
+            for chunk in iter(functools.partial(process.stdout.read1, CHUNK_SIZE), b''):
+                if maximum_size is not None and size + len(chunk) > maximum_size:
+                    output_fh.write(chunk[:maximum_size - size])
+                    size = maximum_size
 
-    return '\n'.join([
-        'ran {0} execute plugins'.format(len(scripts)),
-        '  {0} errors'.format(errors),
-        ])
+                    logger.warning('killing %s after %s bytes of output', script, maximum_size)
 
-COLLECTORS['execute'] = execute_collector
+                    _kill(process)
+
+                    status = 'truncated'
+
+                    break
+
+                output_fh.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        _kill(process)
+
+        raise
+    finally:
+        # The timer keeps running until the script is reaped: it may close
+        # its standard output and keep running.
+        process.stdout.close()
+        process.wait()
+
+        if timer is not None:
+            timer.cancel()
+
+    if expired.is_set():
+        logger.warning('killed %s after %s seconds', script, timeout)
+
+        status = 'timeout'
+    elif status == 'ok' and process.returncode != 0:
+        logger.warning('error in %s: exit status %s', script, process.returncode)
+
+        status = 'error'
+
+    logger.debug('%s wrote %s bytes', script, size)
+
+    OUTPUT_BYTES.increment(size, collector = script_name(script))
+    SCRIPT_RUNS.increment(script = script_name(script), status = status)
+
+    return status
+
+async def execute_script_async(script, timeout = None, maximum_size = None):
+    '''Execute script as an asyncio subprocess and return its output.
+
+    The asynchronous counterpart of ``execute_script`` (for the asyncio
+    collection engine): the script is killed with its session after
+    ``timeout`` seconds or ``maximum_size`` bytes of output, and what it
+    wrote until then is kept.  Output is returned rather than streamed so
+    it can be handed to the engine's writer; it's bounded by
+    ``maximum_size``.
+
+    Arguments are the same as for ``execute_script``.
+
+    Returns
+    -------
+
+    ( status, output bytes ) where status is as for ``execute_script``.
+
+    '''
+
+    logger.info('executing %s', script)
+
+    status = 'ok'
+    chunks = []
+    size = 0
+
+    process = await asyncio.create_subprocess_exec(*script, stdout = subprocess.PIPE, start_new_session = True)
+
+    async def read():
+        nonlocal size, status
+
+        while True:
+            chunk = await process.stdout.read(CHUNK_SIZE)
+
+            if not len(chunk):
+                break
+
+            if maximum_size is not None and size + len(chunk) > maximum_size:
+                chunks.append(chunk[:maximum_size - size])
+                size = maximum_size
+
+                logger.warning('killing %s after %s bytes of output', script, maximum_size)
+
+                _kill(process)
+
+                status = 'truncated'
+
+                break
+
+            chunks.append(chunk)
+            size += len(chunk)
+
+        # The script may close its standard output and keep running.
+        await process.wait()
+
+    try:
+        await asyncio.wait_for(read(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning('killed %s after %s seconds', script, timeout)
+
+        _kill(process)
+
+        status = 'timeout'
+    except BaseException:
+        _kill(process)
+
+        raise
+    finally:
+        # Prompt: the script was reaped or killed above.
+        await process.wait()
+
+    if status == 'ok' and process.returncode != 0:
+        logger.warning('error in %s: exit status %s', script, process.returncode)
+
+        status = 'error'
+
+    logger.debug('%s wrote %s bytes', script, size)
+
+    SCRIPT_RUNS.increment(script = script_name(script), status = status)
+
+    return status, b''.join(chunks)
+
+def run_script(script, snapshot = None):
+    '''Collector running a single script (output is streamed by it into
+    ``snapshot``; default: the current snapshot).'''
+
+    status = execute_script(script, PARAMETERS['collector_execute.timeout'] or None, PARAMETERS['collector_execute.maximum_output_size'] or None, snapshot)
+
+    if status != 'ok':
+        raise RuntimeError('{0}: {1}'.format(script_name(script), status))
+
+def get_helper(script):
+    '''The (shared) ``pmort.helper.Helper`` running script.'''
+
+    with _HELPERS_LOCK:
+        if tuple(script) not in _HELPERS:
+            _HELPERS[tuple(script)] = Helper(script, PARAMETERS['collector_execute.timeout'] or None, PARAMETERS['collector_execute.maximum_output_size'] or None, PARAMETERS['collector_execute.restart_delay'])
+
+        return _HELPERS[tuple(script)]
+
+def close_helpers(keep = ()):
+    '''Stop the helpers of all scripts but those in ``keep``.'''
+
+    keep = set([ tuple(_) for _ in keep ])
+
+    with _HELPERS_LOCK:
+        helpers = [ _HELPERS.pop(script) for script in list(_HELPERS.keys()) if script not in keep ]
+
+    for helper in helpers:
+        helper.close()
+
+def run_helper(script, snapshot = None):
+    '''Collector sampling a persistent script (cf. ``pmort.helper.Helper``).
+
+    The script is started on its first run and kept running; each run sends
+    it a tick and records the sample it answers with.  A helper that failed
+    is restarted (after a delay) by a later run.  The sample is recorded in
+    ``snapshot`` (default: the snapshot current when the run started).
+
+    '''
+
+    if snapshot is None:
+        snapshot = current_snapshot()
+
+    status, output = get_helper(script).sample()
+
+    if status == 'waiting':
+        logger.info('%s is waiting to be restarted', script)
+
+        return
+
+    with open_output(script_name(script), snapshot) as output_fh:
+        output_fh.write(output)
+
+    OUTPUT_BYTES.increment(len(output), collector = script_name(script))
+    SCRIPT_RUNS.increment(script = script_name(script), status = status)
+
+    if status != 'ok':
+        raise RuntimeError('{0}: {1}'.format(script_name(script), status))
+
+async def run_script_async(script, write):
+    '''Coroutine collecting a single script's output (cf. ``run_script``).
+
+    The output is recorded with ``write`` (a coroutine function, cf.
+    ``pmort.executor.AsyncCollectorExecutor``); as for ``run_script``, a
+    script that fails still has its output recorded and then raises.
+
+    '''
+
+    status, output = await execute_script_async(script, PARAMETERS['collector_execute.timeout'] or None, PARAMETERS['collector_execute.maximum_output_size'] or None)
+
+    await write(output)
+
+    if status != 'ok':
+        raise RuntimeError('{0}: {1}'.format(script_name(script), status))
+
+def script_collectors():
+    '''Collectors (name → callable) for every script found.
+
+    Each script is its own collector (named by ``script_name``) so it can be
+    scheduled on its own; its ``coroutine`` attribute runs it on an event
+    loop instead (cf. ``pmort.executor.AsyncCollectorExecutor``).  Scripts
+    declaring mode=persistent are kept running and sampled (cf.
+    ``run_helper``); helpers of scripts that are gone are stopped.  Schedule
+    options declared in a script's header (cf. ``script_options``) become
+    attributes of its collector.
+
+    '''
+
+    collectors = {}
+    helpers = []
+
+    for directory in ( os.path.dirname(__file__), PARAMETERS['collector_execute.directory'] ):
+        options = script_options(directory)
+
+        for script in find_scripts(directory):
+            if options.get(script[-1], {}).get('mode') == 'persistent':
+                collector = functools.partial(run_helper, script)
+
+                helpers.append(script)
+            else:
+                collector = functools.partial(run_script, script)
+                collector.coroutine = functools.partial(run_script_async, script)
+
+            collector.__name__ = script_name(script)
+            collector.writes_output = True
+
+            for key, value in options.get(script[-1], {}).items():
+                setattr(collector, key, value)
+
+            collectors[script_name(script)] = collector
+
+    close_helpers(keep = helpers)
+
+    return collectors
+
+GENERATORS.append(script_collectors)
+
+atexit.register(close_helpers)
+
+def install_sighup_handler():
+    '''Clear the scripts cache on SIGHUP (chaining any previous handler).
+
+    Must be called from the main thread.
+
+    '''
+
+    previous = signal.getsignal(signal.SIGHUP)
+
+    def _sighup_handler(signum, frame):
+        clear_scripts_cache()
+
+        if callable(previous):
+            previous(signum, frame)
+
+    signal.signal(signal.SIGHUP, _sighup_handler)
 
 if __name__ == '__main__':
     PARAMETERS.parse()
-    print(execute_collector())
+
+    for name, collector in sorted(script_collectors().items()):
+        try:
+            collector()
+        except RuntimeError as e:
+            logger.warning('%s', e)
+
+    close_helpers()
@@ -16,7 +16,9 @@ logger = logging.getLogger(__name__)
 def load_average_collector():
     '''Collector—Load Average'''
 
-    return ', '.join([ str(_) for _ in os.getloadavg() ])
+    return dict(zip(( 'load1', 'load5', 'load15' ), os.getloadavg()))
+
+load_average_collector.cost = 'cheap'
 
 COLLECTORS['load_average'] = load_average_collector
 
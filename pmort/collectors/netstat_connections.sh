@@ -1,4 +1,5 @@
 #!/bin/bash
+# pmort: cost=expensive
 
 netstat -nape
 
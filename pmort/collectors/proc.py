@@ -0,0 +1,544 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import collections
+import datetime
+import logging
+import os
+import pwd
+import threading
+import time
+
+from pmort.collectors import COLLECTORS
+from pmort.parameters import PARAMETERS
+from pmort import delta
+from pmort.procfs import PROC
+from pmort.procfs import ProcFile
+from pmort.procfs import parse_meminfo
+from pmort.procfs import parse_stat
+from pmort.procfs import parse_vmstat
+from pmort.procfs import parse_diskstats
+from pmort.procfs import parse_net_dev
+from pmort.procfs import parse_net_snmp
+
+logger = logging.getLogger(__name__)
+
+PARAMETERS.add_parameter(
+        options = [ '--process-handles', ],
+        group = 'collector_proc',
+        default = 512,
+        type = int,
+        help = \
+                'Maximum number of /proc/PID/stat files kept open between ' \
+                'process table collections.  Processes beyond this number ' \
+                'have their stat file opened on every collection.  ' \
+                'Default: %(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--keyframe-interval', ],
+        group = 'collector_proc',
+        default = 60,
+        type = int,
+        help = \
+                'Number of process tables between full ones.  The tables in ' \
+                'between only record processes started and exited and ' \
+                'fields changed (pmort-query reconstructs them).  Zero ' \
+                'writes the plain ps awfux style table every time.  ' \
+                'Default: %(default)s'
+        )
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+SECTOR_SIZE = 512
+
+def _proc_file(name):
+    return ProcFile(os.path.join(PROC, name))
+
+_MEMINFO = _proc_file('meminfo')
+_STAT = _proc_file('stat')
+_VMSTAT = _proc_file('vmstat')
+_DISKSTATS = _proc_file('diskstats')
+_UPTIME = _proc_file('uptime')
+_LOADAVG = _proc_file('loadavg')
+_NET_DEV = _proc_file('net/dev')
+_NET_SNMP = _proc_file('net/snmp')
+_NET_NETSTAT = _proc_file('net/netstat')
+
+def _table(header, rows, left = ( 0, )):
+    '''Right aligned columns (those in ``left`` left aligned) like procps.'''
+
+    rows = [ header ] + [ [ str(_) for _ in row ] for row in rows ]
+
+    widths = [ max([ len(row[column]) for row in rows if column < len(row) ]) for column in range(len(header)) ]
+
+    lines = []
+
+    for row in rows:
+        _ = [ value.ljust(width) if column in left else value.rjust(width) for column, ( value, width ) in enumerate(zip(row, widths)) ]
+
+        lines.append('  '.join(_).rstrip())
+
+    return '\n'.join(lines)
+
+class _Deltas(object):
+    '''Change of counters since the previous call.
+
+    The first call returns the counters themselves and the seconds since boot
+    (i.e., averages since boot as vmstat and iostat report in their first
+    line).
+
+    '''
+
+    def __init__(self):
+        self._previous = None
+        self._lock = threading.Lock()
+
+    def __call__(self, counters, now):
+        with self._lock:
+            previous, self._previous = self._previous, ( counters, now )
+
+        if previous is None:
+            return counters, uptime()[0]
+
+        deltas = {}
+
+        for key, values in counters.items():
+            _ = previous[0].get(key)
+
+            if isinstance(values, list):
+                deltas[key] = [ value - old for value, old in zip(values, _ or [ 0 ] * len(values)) ]
+            else:
+                deltas[key] = values - ( _ or 0 )
+
+        return deltas, max(now - previous[1], 1e-6)
+
+def uptime():
+    '''Seconds since boot and seconds idle from /proc/uptime.'''
+
+    return tuple([ float(_) for _ in _UPTIME.read().split()[:2] ])
+
+def free_collector():
+    '''Collector—Memory Usage (free)'''
+
+    meminfo = parse_meminfo(_MEMINFO.read())
+
+    cache = meminfo.get('Cached', 0) + meminfo.get('SReclaimable', 0)
+    used = meminfo['MemTotal'] - meminfo['MemFree'] - meminfo.get('Buffers', 0) - cache
+
+    return _table(
+            [ '', 'total', 'used', 'free', 'shared', 'buff/cache', 'available' ],
+            [
+                [ 'Mem:', meminfo['MemTotal'], used, meminfo['MemFree'], meminfo.get('Shmem', 0), meminfo.get('Buffers', 0) + cache, meminfo.get('MemAvailable', meminfo['MemFree']) ],
+                [ 'Swap:', meminfo.get('SwapTotal', 0), meminfo.get('SwapTotal', 0) - meminfo.get('SwapFree', 0), meminfo.get('SwapFree', 0) ],
+                ]
+            ) + '\n'
+
+free_collector.cost = 'cheap'
+
+def uptime_collector():
+    '''Collector—Uptime and Load Average (uptime)'''
+
+    seconds = int(uptime()[0])
+
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes = seconds // 60
+
+    up = '{0}:{1:02d}'.format(hours, minutes)
+    if days:
+        up = '{0} day{1}, {2}'.format(days, 's' if days != 1 else '', up)
+
+    loadavg = _LOADAVG.read().split()
+
+    return ' {0} up {1},  load average: {2}\n'.format(datetime.datetime.now().strftime('%H:%M:%S'), up, ', '.join(loadavg[:3]))
+
+uptime_collector.cost = 'cheap'
+
+_vmstat_deltas = _Deltas()
+
+def vmstat_collector():
+    '''Collector—Virtual Memory Statistics (vmstat)
+
+    Rates are since the previous run (since boot on the first run).
+
+    '''
+
+    meminfo = parse_meminfo(_MEMINFO.read())
+    stat = parse_stat(_STAT.read())
+    vmstat = parse_vmstat(_VMSTAT.read())
+
+    counters = {
+            'cpu': stat['cpu'],
+            'intr': stat.get('intr', [ 0 ])[0],
+            'ctxt': stat.get('ctxt', [ 0 ])[0],
+            'pswpin': vmstat.get('pswpin', 0),
+            'pswpout': vmstat.get('pswpout', 0),
+            'pgpgin': vmstat.get('pgpgin', 0),
+            'pgpgout': vmstat.get('pgpgout', 0),
+            }
+
+    deltas, elapsed = _vmstat_deltas(counters, time.monotonic())
+
+    # user nice system idle iowait irq softirq steal …
+    cpu = deltas['cpu'] + [ 0 ] * ( 8 - len(deltas['cpu']) )
+    ticks = float(sum(cpu[:8])) or 1.0
+
+    def rate(name, scale = 1.0):
+        return int(round(deltas[name] * scale / elapsed))
+
+    def percent(*columns):
+        return int(round(100 * sum([ cpu[_] for _ in columns ]) / ticks))
+
+    return _table(
+            [ 'r', 'b', 'swpd', 'free', 'buff', 'cache', 'si', 'so', 'bi', 'bo', 'in', 'cs', 'us', 'sy', 'id', 'wa', 'st' ],
+            [ [
+                stat.get('procs_running', [ 0 ])[0],
+                stat.get('procs_blocked', [ 0 ])[0],
+                meminfo.get('SwapTotal', 0) - meminfo.get('SwapFree', 0),
+                meminfo['MemFree'],
+                meminfo.get('Buffers', 0),
+                meminfo.get('Cached', 0) + meminfo.get('SReclaimable', 0),
+                rate('pswpin', PAGE_SIZE / 1024.0),
+                rate('pswpout', PAGE_SIZE / 1024.0),
+                rate('pgpgin'),
+                rate('pgpgout'),
+                rate('intr'),
+                rate('ctxt'),
+                percent(0, 1),
+                percent(2, 5, 6),
+                percent(3),
+                percent(4),
+                percent(7),
+                ] ]
+            ) + '\n'
+
+vmstat_collector.cost = 'cheap'
+
+_iostat_deltas = _Deltas()
+
+def iostat_collector():
+    '''Collector—Block Device I/O Statistics (iostat)
+
+    Rates are since the previous run (since boot on the first run).  Devices
+    that have never done any I/O are left out.
+
+    '''
+
+    diskstats = parse_diskstats(_DISKSTATS.read())
+
+    deltas, elapsed = _iostat_deltas(diskstats, time.monotonic())
+
+    rows = []
+
+    for device in sorted(diskstats.keys()):
+        total = diskstats[device]
+
+        # reads merged sectors ms writes merged sectors ms in_flight io_ms …
+        if not total[0] and not total[4]:
+            continue
+
+        delta = deltas[device]
+
+        rows.append([
+            device,
+            '{0:.2f}'.format(( delta[0] + delta[4] ) / elapsed),
+            '{0:.2f}'.format(delta[2] * SECTOR_SIZE / 1024.0 / elapsed),
+            '{0:.2f}'.format(delta[6] * SECTOR_SIZE / 1024.0 / elapsed),
+            total[2] * SECTOR_SIZE // 1024,
+            total[6] * SECTOR_SIZE // 1024,
+            total[8],
+            '{0:.2f}'.format(min(100.0, delta[9] / 10.0 / elapsed)),
+            ])
+
+    return _table([ 'Device', 'tps', 'kB_read/s', 'kB_wrtn/s', 'kB_read', 'kB_wrtn', 'in_flight', '%util' ], rows) + '\n'
+
+iostat_collector.cost = 'cheap'
+
+def netstat_summary_collector():
+    '''Collector—Network Protocol Statistics (netstat -s)'''
+
+    lines = []
+
+    for _ in ( _NET_SNMP, _NET_NETSTAT ):
+        for protocol, values in parse_net_snmp(_.read()):
+            lines.append(protocol + ':')
+            lines.extend([ '    {0}: {1}'.format(name, value) for name, value in values ])
+
+    return '\n'.join(lines) + '\n'
+
+netstat_summary_collector.cost = 'cheap'
+
+def netstat_interfaces_collector():
+    '''Collector—Network Interface Statistics (netstat -i)'''
+
+    rows = []
+
+    for name, _ in sorted(parse_net_dev(_NET_DEV.read()).items()):
+        rows.append([ name, _[1], _[0], _[2], _[3], _[9], _[8], _[10], _[11] ])
+
+    return _table([ 'Iface', 'RX-OK', 'RX-bytes', 'RX-ERR', 'RX-DRP', 'TX-OK', 'TX-bytes', 'TX-ERR', 'TX-DRP' ], rows) + '\n'
+
+netstat_interfaces_collector.cost = 'cheap'
+
+Process = collections.namedtuple('Process', [ 'pid', 'ppid', 'uid', 'state', 'threads', 'cpu_ticks', 'start_ticks', 'vsz', 'rss', 'command' ])
+
+def parse_process_stat(text, uid = None, cmdline = ''):
+    '''A /proc/PID/stat line as a ``Process`` (vsz and rss in KiB).
+
+    The command is the process' ``cmdline`` (/proc/PID/cmdline) with its
+    arguments separated by spaces like ps; kernel threads and zombies (empty
+    ``cmdline``) show the stat file's command in brackets.
+
+    '''
+
+    # The command is in parentheses and may itself contain spaces or them.
+    head, _, tail = text.rpartition(')')
+    pid, _, command = head.partition(' (')
+
+    if len(cmdline.strip('\0')):
+        command = cmdline.rstrip('\0').replace('\0', ' ')
+    else:
+        command = '[' + command + ']'
+
+    _ = tail.split()
+
+    return Process(
+            pid = int(pid),
+            ppid = int(_[1]),
+            uid = uid,
+            state = _[0],
+            threads = int(_[17]),
+            cpu_ticks = int(_[11]) + int(_[12]),
+            start_ticks = int(_[19]),
+            vsz = int(_[20]) // 1024,
+            rss = int(_[21]) * PAGE_SIZE // 1024,
+            command = command,
+            )
+
+class ProcessTable(object):
+    '''Processes read from /proc/PID/stat and cmdline through files kept open.
+
+    The stat and cmdline files of each process stay open between
+    ``processes`` calls (for up to ``maximum_handles`` processes) and are
+    re-read from their start; a process that exited fails the read and has
+    its files closed (and reopened once in case its PID was reused).  Owners come from ``fstat`` of the open stat file
+    rather than another path lookup.
+
+    Arguments
+    ---------
+
+    :``maximum_handles``: Maximum number of processes whose files are kept
+                          open.
+
+    '''
+
+    def __init__(self, maximum_handles = 512):
+        self.maximum_handles = maximum_handles
+
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def _read(self, pid):
+        '''( stat text, uid, cmdline text ) of the process with ``pid``.'''
+
+        files = self._files.get(pid)
+
+        if files is not None:
+            try:
+                return files[0].read(), files[0].fstat().st_uid, files[1].read()
+            except (IOError, OSError):
+                # The process exited; its PID may belong to a new one.
+                for _ in self._files.pop(pid):
+                    _.close()
+
+        files = tuple([ ProcFile(os.path.join(PROC, str(pid), _)) for _ in ( 'stat', 'cmdline' ) ])
+
+        try:
+            return files[0].read(), files[0].fstat().st_uid, files[1].read()
+        finally:
+            if len(self._files) < self.maximum_handles:
+                self._files[pid] = files
+            else:
+                for _ in files:
+                    _.close()
+
+    def processes(self):
+        '''Current processes as a list of ``Process`` ordered by PID.'''
+
+        pids = sorted([ int(_) for _ in os.listdir(PROC) if _.isdigit() ])
+
+        processes = []
+
+        with self._lock:
+            for pid in set(self._files.keys()) - set(pids):
+                for _ in self._files.pop(pid):
+                    _.close()
+
+            for pid in pids:
+                try:
+                    text, uid, cmdline = self._read(pid)
+                except (IOError, OSError):
+                    for _ in self._files.pop(pid, ()):
+                        _.close()
+
+                    continue
+
+                if not len(text):
+                    continue
+
+                processes.append(parse_process_stat(text, uid, cmdline))
+
+        return processes
+
+    def close(self):
+        with self._lock:
+            for files in self._files.values():
+                for _ in files:
+                    _.close()
+
+            self._files.clear()
+
+_process_table = None
+_process_table_lock = threading.Lock()
+
+def process_table():
+    '''Shared ``ProcessTable`` (created on first use).'''
+
+    global _process_table
+
+    with _process_table_lock:
+        if _process_table is None:
+            _process_table = ProcessTable(PARAMETERS['collector_proc.process_handles'])
+
+        return _process_table
+
+_users = {}
+
+def user_name(uid):
+    '''Name of the user with ``uid`` (the uid itself if it has none).'''
+
+    if uid not in _users:
+        try:
+            _users[uid] = pwd.getpwuid(uid).pw_name
+        except KeyError:
+            _users[uid] = str(uid)
+
+    return _users[uid]
+
+def forest(processes):
+    '''Processes in tree order as ( depth, ``Process`` ) pairs like ps f.'''
+
+    pids = set([ _.pid for _ in processes ])
+    children = collections.defaultdict(list)
+
+    for process in processes:
+        children[process.ppid if process.ppid in pids and process.ppid != process.pid else 0].append(process)
+
+    ordered = []
+    stack = [ ( 0, _ ) for _ in reversed(children[0]) ]
+
+    while len(stack):
+        depth, process = stack.pop()
+
+        ordered.append(( depth, process ))
+
+        stack.extend([ ( depth + 1, _ ) for _ in reversed(children.get(process.pid, [])) ])
+
+    return ordered
+
+_ps_cpu = {}
+_ps_cpu_lock = threading.Lock()
+
+def format_processes(processes, previous = None, elapsed = None):
+    '''Process table like ps awfux.
+
+    Arguments
+    ---------
+
+    :``processes``: List of ``Process``.
+    :``previous``:  {pid: cpu_ticks} from the previous sample; %CPU is over
+                    ``elapsed`` seconds since then.  Processes not in it (or
+                    all if it's None) show their average since they started.
+    :``elapsed``:   Seconds since ``previous``.
+
+    '''
+
+    now = uptime()[0]
+
+    rows = []
+
+    for depth, process in forest(processes):
+        if previous is not None and process.pid in previous and elapsed:
+            cpu = ( process.cpu_ticks - previous[process.pid] ) / float(CLOCK_TICKS) / elapsed
+        else:
+            cpu = process.cpu_ticks / float(CLOCK_TICKS) / max(now - process.start_ticks / float(CLOCK_TICKS), 1.0)
+
+        seconds = process.cpu_ticks // CLOCK_TICKS
+
+        rows.append([
+            user_name(process.uid) if process.uid is not None else '?',
+            process.pid,
+            process.ppid,
+            '{0:.1f}'.format(100 * cpu),
+            process.vsz,
+            process.rss,
+            process.state,
+            process.threads,
+            '{0}:{1:02d}'.format(seconds // 60, seconds % 60),
+            ' ' * ( 4 * depth - 4 ) + ' \\_ ' + process.command if depth else process.command,
+            ])
+
+    return _table([ 'USER', 'PID', 'PPID', '%CPU', 'VSZ', 'RSS', 'STAT', 'NLWP', 'TIME', 'COMMAND' ], rows, left = ( 0, 9 )) + '\n'
+
+_ps_encoder = None
+
+def ps_collector():
+    '''Collector—Process Table (ps awfux)
+
+    With collector_proc.keyframe_interval set, the process table is delta
+    encoded (cf. ``pmort.delta``) with a full table every that many runs;
+    otherwise, %CPU is over the time since the previous run (averages since
+    each process started on the first run).
+
+    '''
+
+    global _ps_encoder
+
+    processes = process_table().processes()
+
+    if PARAMETERS['collector_proc.keyframe_interval'] > 0:
+        with _ps_cpu_lock:
+            if _ps_encoder is None:
+                _ps_encoder = delta.DeltaEncoder(Process._fields, PARAMETERS['collector_proc.keyframe_interval'])
+
+        return _ps_encoder.encode(processes)
+
+    now = time.monotonic()
+
+    with _ps_cpu_lock:
+        previous, elapsed = _ps_cpu.get('cpu'), now - _ps_cpu.get('time', now)
+
+        _ps_cpu['cpu'] = dict([ ( _.pid, _.cpu_ticks ) for _ in processes ])
+        _ps_cpu['time'] = now
+
+    return format_processes(processes, previous, elapsed)
+
+COLLECTORS['free'] = free_collector
+COLLECTORS['uptime'] = uptime_collector
+COLLECTORS['vmstat'] = vmstat_collector
+COLLECTORS['iostat'] = iostat_collector
+COLLECTORS['netstat_summary'] = netstat_summary_collector
+COLLECTORS['netstat_interfaces'] = netstat_interfaces_collector
+COLLECTORS['ps'] = ps_collector
+
+if __name__ == '__main__':
+    PARAMETERS.parse()
+
+    for name, collector in sorted(COLLECTORS.items()):
+        print('==> {0} <=='.format(name))
+        print(collector())
@@ -1,4 +0,0 @@
-#!/bin/bash
-
-uptime
-
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+__all__ = [
+        'CODECS',
+        ]
+
+import logging
+import gzip
+import bz2
+import lzma
+import contextlib
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    logger.info('could not load zstandard—zstd compression unavailable')
+
+    zstandard = None
+
+class Codec(object):
+    '''Compression format usable for collector output.
+
+    Arguments
+    ---------
+
+    :``name``:       Name of the codec (as given in pmort.compression).
+    :``extension``:  File name extension (including the '.') of compressed
+                     files.
+    :``identifier``: Small integer identifying the codec in binary formats
+                     (cf. ``pmort.archive``).  Zero is reserved for
+                     uncompressed data.
+
+    '''
+
+    def __init__(self, name, extension, identifier):
+        self.name = name
+        self.extension = extension
+        self.identifier = identifier
+
+    def writer(self, fh, level = None):
+        '''Binary file-like object compressing into ``fh``.
+
+        Closing the returned object finishes the compressed stream but leaves
+        ``fh`` open.
+
+        '''
+
+        raise NotImplementedError
+
+    def open(self, path):
+        '''Open the compressed file ``path`` for (decompressed) reading.'''
+
+        raise NotImplementedError
+
+    def decompress(self, data):
+        '''Decompress the complete compressed stream ``data``.'''
+
+        raise NotImplementedError
+
+class GzipCodec(Codec):
+    def writer(self, fh, level = None):
+        return gzip.GzipFile(fileobj = fh, mode = 'wb', compresslevel = level or 6)
+
+    def open(self, path):
+        return gzip.open(path, 'rb')
+
+    def decompress(self, data):
+        return gzip.decompress(data)
+
+class Bzip2Codec(Codec):
+    def writer(self, fh, level = None):
+        return bz2.BZ2File(fh, mode = 'wb', compresslevel = level or 9)
+
+    def open(self, path):
+        return bz2.open(path, 'rb')
+
+    def decompress(self, data):
+        return bz2.decompress(data)
+
+class XzCodec(Codec):
+    def writer(self, fh, level = None):
+        return lzma.LZMAFile(fh, mode = 'wb', preset = level)
+
+    def open(self, path):
+        return lzma.open(path, 'rb')
+
+    def decompress(self, data):
+        return lzma.decompress(data)
+
+class ZstdCodec(Codec):
+    class _Writer(object):
+        def __init__(self, writer):
+            self._writer = writer
+
+        def write(self, data):
+            return self._writer.write(data)
+
+        def flush(self):
+            self._writer.flush(zstandard.FLUSH_BLOCK)
+
+        def close(self):
+            self._writer.flush(zstandard.FLUSH_FRAME)
+
+    def writer(self, fh, level = None):
+        return self._Writer(zstandard.ZstdCompressor(level = level or 3).stream_writer(fh))
+
+    def open(self, path):
+        return zstandard.open(path, 'rb')
+
+    def decompress(self, data):
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+CODECS = {
+        'gzip': GzipCodec('gzip', '.gz', 1),
+        'bzip2': Bzip2Codec('bzip2', '.bz2', 2),
+        'xz': XzCodec('xz', '.xz', 3),
+        }
+
+if zstandard is not None:
+    CODECS['zstd'] = ZstdCodec('zstd', '.zst', 4)
+
+def codec(name):
+    '''Codec registered as ``name``; None for 'none' (or an empty name).
+
+    Raises
+    ------
+
+    ValueError if ``name`` isn't a known (and available) codec.
+
+    '''
+
+    if name in ( None, '', 'none' ):
+        return None
+
+    if name not in CODECS:
+        raise ValueError('unknown or unavailable compression: {0}'.format(name))
+
+    return CODECS[name]
+
+def codec_by_identifier(identifier):
+    '''Codec with the given identifier; None for zero.
+
+    Raises
+    ------
+
+    ValueError if no (available) codec has ``identifier``.
+
+    '''
+
+    if identifier == 0:
+        return None
+
+    for _ in CODECS.values():
+        if _.identifier == identifier:
+            return _
+
+    raise ValueError('unknown or unavailable compression identifier: {0}'.format(identifier))
+
+def codec_for(path):
+    '''Codec whose extension ``path`` ends with (or None).'''
+
+    for _ in CODECS.values():
+        if path.endswith(_.extension):
+            return _
+
+    return None
+
+@contextlib.contextmanager
+def compressed(fh, codec, level = None):
+    '''Wrap the binary writable ``fh`` with ``codec``'s compressor.
+
+    The compressed stream is finished when the context exits; ``fh`` is left
+    open.  A ``codec`` of None yields ``fh`` unchanged.
+
+    '''
+
+    if codec is None:
+        yield fh
+
+        return
+
+    writer = codec.writer(fh, level)
+
+    try:
+        yield writer
+    finally:
+        writer.close()
+
+def open_decompressed(path):
+    '''Open ``path`` for binary reading, decompressing it by extension.'''
+
+    _ = codec_for(path)
+
+    if _ is None:
+        return open(path, 'rb')
+
+    return _.open(path)
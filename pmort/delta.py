@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import logging
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+MAGIC = '#pmort-delta'
+
+KEYFRAME = 'keyframe'
+DELTA = 'delta'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+def _unescape(value):
+    characters = []
+
+    _ = iter(value)
+    for character in _:
+        if character == '\\':
+            character = { 't': '\t', 'n': '\n' }.get(next(_, ''), '\\')
+
+        characters.append(character)
+
+    return ''.join(characters)
+
+# Every DeltaEncoder (cf. ``reset_encoders``).
+_ENCODERS = weakref.WeakSet()
+
+def reset_encoders():
+    '''Make the next table of every ``DeltaEncoder`` a keyframe.
+
+    Used when the tables before can't be relied upon to be kept (e.g. a ring
+    starts buffering output again).
+
+    '''
+
+    for encoder in list(_ENCODERS):
+        encoder.reset()
+
+def _keyframe(fields, rows, sequence):
+    lines = [
+            '\t'.join([ MAGIC, KEYFRAME, str(sequence) ]),
+            '\t'.join([ '#fields' ] + [ _escape(_) for _ in fields ]),
+            ]
+    lines.extend([ '\t'.join(row) for row in rows ])
+
+    return '\n'.join(lines) + '\n'
+
+def keyframe(fields, rows, sequence):
+    '''Keyframe (string) of table ``sequence`` holding ``rows``.
+
+    Turns a table reconstructed by a ``DeltaDecoder`` back into a
+    self-contained one.
+
+    '''
+
+    return _keyframe(fields, [ [ _escape(value) for value in row ] for row in rows ], sequence)
+
+def header(output):
+    '''( kind, sequence ) of an encoded table or None if ``output`` isn't one.'''
+
+    if isinstance(output, bytes):
+        output = output[:output.find(b'\n') if b'\n' in output else len(output)].decode('utf-8', 'replace')
+
+    _ = output.partition('\n')[0].split('\t')
+
+    if len(_) != 3 or _[0] != MAGIC or not _[2].isdigit():
+        return None
+
+    return _[1], int(_[2])
+
+def is_encoded(output):
+    '''True if ``output`` (bytes or string) was written by a ``DeltaEncoder``.'''
+
+    if isinstance(output, bytes):
+        return output.startswith(MAGIC.encode('utf-8'))
+
+    return output.startswith(MAGIC)
+
+class DeltaEncoder(object):
+    '''Encode successive tables as keyframes and differences.
+
+    Every ``keyframe_interval`` tables (and the first) are written in full;
+    the ones in between only list the rows added (+), removed (-) and the
+    fields that changed (~) since the previous table:
+
+    ::
+
+        #pmort-delta	keyframe	0
+        #fields	pid	state	command
+        1	S	init
+        42	R	bash
+
+        #pmort-delta	delta	1
+        ~	42	state=S
+        +	43	R	ps
+        -	1
+
+    Fields are tab separated (tabs, newlines and backslashes in values are
+    escaped) and the first field of every row is its key.  Tables are
+    numbered so a decoder notices one missing and waits for the next
+    keyframe rather than reconstructing wrong tables (cf. ``DeltaDecoder``).
+
+    Arguments
+    ---------
+
+    :``fields``:            Names of the fields of every row (key first).
+    :``keyframe_interval``: Number of tables between keyframes.
+
+    '''
+
+    def __init__(self, fields, keyframe_interval = 60):
+        self.fields = list(fields)
+        self.keyframe_interval = keyframe_interval
+
+        self.sequence = -1
+
+        self._rows = None
+        self._since_keyframe = 0
+
+        self._lock = threading.Lock()
+
+        _ENCODERS.add(self)
+
+    def reset(self):
+        '''Make the next table a keyframe.'''
+
+        with self._lock:
+            self._rows = None
+
+    def encode(self, rows):
+        '''Encode the next table.
+
+        Arguments
+        ---------
+
+        :``rows``: Sequences of field values (converted with ``str``).
+
+        Returns
+        -------
+
+        The encoded table as a string.
+
+        '''
+
+        rows = [ tuple([ _escape(value) for value in row ]) for row in rows ]
+        current = dict([ ( row[0], row ) for row in rows ])
+
+        with self._lock:
+            previous, self._rows = self._rows, current
+
+            self.sequence += 1
+
+            if previous is None or self._since_keyframe + 1 >= self.keyframe_interval:
+                self._since_keyframe = 0
+
+                return _keyframe(self.fields, rows, self.sequence)
+
+            self._since_keyframe += 1
+
+            lines = [ '\t'.join([ MAGIC, DELTA, str(self.sequence) ]) ]
+
+            for row in rows:
+                old = previous.get(row[0])
+
+                if old is None:
+                    lines.append('\t'.join(( '+', ) + row))
+                elif old != row:
+                    lines.append('\t'.join([ '~', row[0] ] + [ '{0}={1}'.format(self.fields[index], value) for index, ( value, _ ) in enumerate(zip(row, old)) if value != _ ]))
+
+            lines.extend([ '-\t' + key for key in previous.keys() if key not in current ])
+
+            return '\n'.join(lines) + '\n'
+
+class DeltaDecoder(object):
+    '''Reconstruct tables encoded by a ``DeltaEncoder``.
+
+    Tables must be decoded in the order they were encoded.  Until a keyframe
+    is seen (and after a table is found missing) ``decode`` returns None.
+
+    '''
+
+    def __init__(self):
+        self.fields = None
+        self.sequence = None
+
+        self._rows = None
+
+    def decode(self, output):
+        '''Reconstruct the table in ``output`` (bytes or string).
+
+        Returns
+        -------
+
+        List of rows (tuples of strings in encoding order for keyframes, with
+        added rows appended for deltas) or None if the table can't be
+        reconstructed.
+
+        '''
+
+        if isinstance(output, bytes):
+            output = output.decode('utf-8', 'replace')
+
+        lines = output.splitlines()
+
+        _ = lines[0].split('\t') if len(lines) else []
+
+        if len(_) != 3 or _[0] != MAGIC:
+            raise ValueError('not a delta encoded table')
+
+        kind, sequence = _[1], int(_[2])
+
+        if kind == KEYFRAME:
+            self.fields = [ _unescape(_) for _ in lines[1].split('\t')[1:] ]
+            self.sequence = sequence
+
+            rows = [ tuple([ _unescape(value) for value in line.split('\t') ]) for line in lines[2:] ]
+
+            self._rows = dict([ ( row[0], row ) for row in rows ])
+
+            return list(self._rows.values())
+
+        if self._rows is None or sequence != self.sequence + 1:
+            if self._rows is not None:
+                logger.warning('table %s missing: waiting for a keyframe', self.sequence + 1)
+
+            self._rows = None
+
+            return None
+
+        self.sequence = sequence
+
+        for line in lines[1:]:
+            operation, _, line = line.partition('\t')
+
+            if operation == '+':
+                row = tuple([ _unescape(value) for value in line.split('\t') ])
+
+                self._rows[row[0]] = row
+            elif operation == '-':
+                self._rows.pop(_unescape(line), None)
+            elif operation == '~':
+                changes = line.split('\t')
+
+                key = _unescape(changes[0])
+                row = list(self._rows[key])
+
+                for change in changes[1:]:
+                    field, _, value = change.partition('=')
+
+                    row[self.fields.index(field)] = _unescape(value)
+
+                self._rows[key] = tuple(row)
+
+        return list(self._rows.values())
+
+def render(fields, rows):
+    '''Aligned text table of ``rows`` under a header of ``fields``.'''
+
+    rows = [ list(fields) ] + [ list(_) for _ in rows ]
+
+    widths = [ max([ len(row[column]) for row in rows if column < len(row) ]) for column in range(len(fields)) ]
+
+    return '\n'.join([ '  '.join([ value.ljust(width) for value, width in zip(row, widths) ]).rstrip() for row in rows ]) + '\n'
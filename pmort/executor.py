@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import asyncio
+import contextlib
+import functools
+import logging
+import threading
+import time
+import concurrent.futures
+
+from pmort.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DURATION = REGISTRY.histogram('pmort_collector_duration_seconds', 'Seconds each collector run took.')
+ERRORS = REGISTRY.counter('pmort_collector_errors_total', 'Collector runs that raised an exception.')
+SKIPPED = REGISTRY.counter('pmort_collector_skipped_total', 'Collector runs skipped because the previous run had not finished.')
+OVERRUN = REGISTRY.counter('pmort_collector_overrun_total', 'Collector runs unfinished at their cycle\'s deadline.')
+
+class CollectorExecutor(object):
+    '''Fixed size pool of threads running collectors.
+
+    Collectors are submitted by name once per cycle.  A collector whose
+    previous invocation is still queued or running is skipped rather than
+    queued a second time; thus, a slow collector can occupy at most one worker
+    and the number of threads pmort uses never exceeds ``workers``.
+
+    Counters (cumulative since creation):
+
+    :``submitted``: Number of collector invocations accepted.
+    :``skipped``:   Number of invocations refused because the collector was
+                    still queued or running from a previous cycle.
+    :``overrun``:   Number of invocations still unfinished at the end of their
+                    cycle's deadline.
+    :``errors``:    Number of invocations that raised an exception.
+
+    Arguments
+    ---------
+
+    :``workers``: Number of threads running collectors.
+    :``write``:   Function called with a collector's name, output and the
+                  further arguments given to ``collect`` to record the
+                  output.
+
+    '''
+
+    def __init__(self, workers, write = None):
+        self.workers = workers
+        self.write = write
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers = workers)
+        self._lock = threading.Lock()
+
+        self._futures = {}
+        self._pending = {}
+
+        self.submitted = 0
+        self.skipped = 0
+        self.overrun = 0
+        self.errors = 0
+
+    @property
+    def queued(self):
+        '''Number of collectors waiting for a free worker.'''
+
+        with self._lock:
+            return len([ _ for _ in self._futures.values() if not _.running() and not _.done() ])
+
+    @property
+    def running(self):
+        '''Number of collectors currently executing.'''
+
+        with self._lock:
+            return len([ _ for _ in self._futures.values() if _.running() ])
+
+    def submit(self, name, function, *args, **kwargs):
+        '''Queue ``function`` as collector ``name`` unless it's still active.
+
+        Arguments
+        ---------
+
+        :``name``:     Name of the collector (used for skip-if-running).
+        :``function``: Callable to execute in a worker.
+
+        Any further arguments are passed to ``function``.
+
+        Returns
+        -------
+
+        True if the collector was queued; otherwise, False.
+
+        '''
+
+        with self._lock:
+            future = self._futures.get(name)
+
+            if future is not None and not future.done():
+                logger.warning('skipping %s: previous run has not finished', name)
+
+                self.skipped += 1
+
+                SKIPPED.increment(collector = name)
+
+                return False
+
+            future = self._start(name, function, *args, **kwargs)
+
+            self._futures[name] = future
+            self._pending[future] = name
+            self.submitted += 1
+
+        return True
+
+    def collect(self, name, collector, *args):
+        '''Queue ``collector`` (cf. ``submit``) and ``write`` its output.
+
+        Any further arguments (e.g. the snapshot) are passed to ``write``
+        after the name and output.  Collectors returning None have written
+        their own output; those with a true ``writes_output`` attribute (e.g.
+        script collectors) are called with the further arguments so they
+        write into the snapshot of the cycle that queued them rather than the
+        one current when they start.
+
+        '''
+
+        return self.submit(name, self._collect, name, collector, *args)
+
+    def _collect(self, name, collector, *args):
+        if getattr(collector, 'writes_output', False):
+            return collector(*args)
+
+        output = collector()
+
+        if output is not None:
+            self.write(name, output, *args)
+
+    def _start(self, name, function, *args, **kwargs):
+        return self._executor.submit(self._run, name, function, *args, **kwargs)
+
+    def _run(self, name, function, *args, **kwargs):
+        logger.info('running %s', name)
+
+        start = time.monotonic()
+
+        try:
+            return function(*args, **kwargs)
+        except Exception as e:
+            logger.warning('error in %s', name)
+            logger.exception(e)
+
+            with self._lock:
+                self.errors += 1
+
+            ERRORS.increment(collector = name)
+        finally:
+            DURATION.observe(time.monotonic() - start, collector = name)
+
+    def wait(self, timeout = None):
+        '''Wait up to ``timeout`` seconds for this cycle's collectors.
+
+        Only collectors submitted since the previous call to ``wait`` are
+        waited upon.  Collectors still queued or running when ``timeout``
+        expires are counted as overrun.  They are left to finish in the
+        background but will be skipped by ``submit`` until they do.
+
+        Arguments
+        ---------
+
+        :``timeout``: Seconds to wait; None waits indefinitely.
+
+        Returns
+        -------
+
+        Names of the collectors that overran the deadline.
+
+        '''
+
+        with self._lock:
+            futures, self._pending = self._pending, {}
+
+        done, not_done = concurrent.futures.wait(futures.keys(), timeout = timeout)
+
+        overrun = sorted([ futures[_] for _ in not_done ])
+
+        if len(overrun):
+            logger.warning('collectors overran deadline: %s', ', '.join(overrun))
+
+        with self._lock:
+            self.overrun += len(overrun)
+
+        for name in overrun:
+            OVERRUN.increment(collector = name)
+
+        return overrun
+
+    def statistics(self):
+        '''Current counters of this executor as a dictionary.'''
+
+        return {
+                'workers': self.workers,
+                'queued': self.queued,
+                'running': self.running,
+                'submitted': self.submitted,
+                'skipped': self.skipped,
+                'overrun': self.overrun,
+                'errors': self.errors,
+                }
+
+    def shutdown(self, wait = True):
+        '''Stop accepting collectors and release the workers.'''
+
+        self._executor.shutdown(wait = wait)
+
+class AsyncCollectorExecutor(CollectorExecutor):
+    '''``CollectorExecutor`` running collectors on an asyncio event loop.
+
+    The event loop runs in a single thread of its own.  Collectors with a
+    ``coroutine`` attribute (e.g. script collectors, cf.
+    ``pmort.collectors.execute.run_script_async``) are awaited on the loop;
+    thus, any number of them run concurrently without a thread each.  The
+    coroutine is passed a coroutine function writing an output; thus, it can
+    record its output and still raise.  Other
+    collectors (e.g. /proc readers) run in a pool of ``workers`` threads.
+
+    Outputs are queued to a single writer task that calls ``write`` in one
+    thread in the order they arrive; a collector is finished (cf. ``wait``)
+    once its output is written.
+
+    Arguments are the same as for ``CollectorExecutor``.
+
+    '''
+
+    def __init__(self, workers, write = None):
+        super(AsyncCollectorExecutor, self).__init__(workers, write)
+
+        self._writer = concurrent.futures.ThreadPoolExecutor(max_workers = 1)
+        self._active = set()
+
+        self.loop = asyncio.new_event_loop()
+
+        self._thread = threading.Thread(target = self._serve, name = 'collectors')
+        self._thread.daemon = True
+        self._thread.start()
+
+        self._writes = asyncio.run_coroutine_threadsafe(self._start_writer(), self.loop).result()
+
+    @property
+    def queued(self):
+        with self._lock:
+            return len([ _ for _ in self._futures.values() if not _.done() ]) - len(self._active)
+
+    @property
+    def running(self):
+        with self._lock:
+            return len(self._active)
+
+    def _serve(self):
+        asyncio.set_event_loop(self.loop)
+
+        try:
+            self.loop.run_forever()
+        finally:
+            tasks = asyncio.all_tasks(self.loop)
+
+            for task in tasks:
+                task.cancel()
+
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions = True))
+            self.loop.close()
+
+    async def _start_writer(self):
+        writes = asyncio.Queue()
+
+        self.loop.create_task(self._write_forever(writes))
+
+        return writes
+
+    async def _write_forever(self, writes):
+        while True:
+            name, output, args, written = await writes.get()
+
+            try:
+                await self.loop.run_in_executor(self._writer, functools.partial(self.write, name, output, *args))
+            except Exception as e:
+                if not written.done():
+                    written.set_exception(e)
+            else:
+                if not written.done():
+                    written.set_result(None)
+
+    async def _collect(self, name, collector, *args):
+        coroutine = getattr(collector, 'coroutine', None)
+
+        if coroutine is not None:
+            output = await coroutine(functools.partial(self._write, name, args))
+        elif getattr(collector, 'writes_output', False):
+            output = await self.loop.run_in_executor(self._executor, functools.partial(collector, *args))
+        else:
+            output = await self.loop.run_in_executor(self._executor, collector)
+
+        await self._write(name, args, output)
+
+    async def _write(self, name, args, output):
+        if output is None:
+            return
+
+        written = self.loop.create_future()
+
+        await self._writes.put(( name, output, args, written ))
+        await written
+
+    def _start(self, name, function, *args, **kwargs):
+        return asyncio.run_coroutine_threadsafe(self._run_async(name, function, *args, **kwargs), self.loop)
+
+    async def _run_async(self, name, function, *args, **kwargs):
+        logger.info('running %s', name)
+
+        start = time.monotonic()
+
+        try:
+            if asyncio.iscoroutinefunction(function):
+                with self._activity(name):
+                    return await function(*args, **kwargs)
+
+            return await self.loop.run_in_executor(self._executor, functools.partial(self._call, name, function, *args, **kwargs))
+        except Exception as e:
+            logger.warning('error in %s', name)
+            logger.exception(e)
+
+            with self._lock:
+                self.errors += 1
+
+            ERRORS.increment(collector = name)
+        finally:
+            DURATION.observe(time.monotonic() - start, collector = name)
+
+    @contextlib.contextmanager
+    def _activity(self, name):
+        with self._lock:
+            self._active.add(name)
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active.discard(name)
+
+    def _call(self, name, function, *args, **kwargs):
+        with self._activity(name):
+            return function(*args, **kwargs)
+
+    def shutdown(self, wait = True):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+        if wait:
+            self._thread.join()
+
+        self._writer.shutdown(wait = wait)
+
+        super(AsyncCollectorExecutor, self).shutdown(wait = wait)
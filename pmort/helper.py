@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import logging
+import os
+import select
+import signal
+import subprocess
+import threading
+import time
+
+from pmort.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+HELPER_RESTARTS = REGISTRY.counter('pmort_helper_restarts_total', 'Persistent collector scripts restarted after exiting or failing.')
+
+# Line sent to a helper to request a sample.
+TICK = b'tick\n'
+
+# Line a helper ends each sample with.
+TERMINATOR = b'#pmort-end\n'
+
+CHUNK_SIZE = 65536
+
+# Longest delay (seconds) before restarting a failing helper.
+MAXIMUM_RESTART_DELAY = 300.0
+
+# Seconds a closed helper is given to exit before it's killed.
+EXIT_TIMEOUT = 1.0
+
+class Helper(object):
+    '''Long-running collector script that emits a sample per tick.
+
+    The script is started once and kept running.  For every sample, pmort
+    writes ``TICK`` to the script's standard input; the script answers on its
+    standard output with the sample followed by ``TERMINATOR`` on a line of
+    its own.  A shell script keeping a connection open looks like::
+
+        #!/bin/bash
+        # pmort: mode=persistent
+
+        while read tick; do
+            mysqladmin processlist
+            echo '#pmort-end'
+        done
+
+    A helper that exits, writes more than ``maximum_size`` bytes in a sample
+    or doesn't finish a sample within ``timeout`` seconds is killed (with
+    its session) and restarted at the next sample; consecutive failures
+    double the delay before restarting (from ``restart_delay`` up to
+    ``MAXIMUM_RESTART_DELAY``).  Closing standard input asks it to exit.
+
+    Arguments
+    ---------
+
+    :``script``:        Command line to execute.
+    :``timeout``:       Seconds to wait for a sample; None waits forever.
+    :``maximum_size``:  Bytes of a sample recorded before the helper is
+                        killed; None never kills it.
+    :``restart_delay``: Seconds before the first restart after a failure.
+    :``clock``:         Function returning monotonic seconds.  Default:
+                        ``time.monotonic``.
+
+    '''
+
+    def __init__(self, script, timeout = None, maximum_size = None, restart_delay = 1.0, clock = time.monotonic):
+        self.script = script
+        self.timeout = timeout
+        self.maximum_size = maximum_size
+        self.restart_delay = restart_delay
+        self.clock = clock
+
+        self.process = None
+        self.failures = 0
+        self.restarts = 0
+
+        self._retry = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        if self._retry is not None and self.clock() < self._retry:
+            return False
+
+        if self.failures:
+            logger.warning('restarting %s', self.script)
+
+            self.restarts += 1
+
+            HELPER_RESTARTS.increment(script = ' '.join(self.script))
+        else:
+            logger.info('starting %s', self.script)
+
+        self.process = subprocess.Popen(self.script, stdin = subprocess.PIPE, stdout = subprocess.PIPE, start_new_session = True)
+
+        return True
+
+    def _fail(self):
+        '''Kill the helper and delay its restart.'''
+
+        self._kill()
+
+        self.failures += 1
+        self._retry = self.clock() + min(self.restart_delay * 2 ** ( self.failures - 1 ), MAXIMUM_RESTART_DELAY)
+
+    def _kill(self):
+        if self.process is None:
+            return
+
+        if self.process.poll() is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+        for _ in ( self.process.stdin, self.process.stdout ):
+            try:
+                _.close()
+            except OSError:
+                pass
+
+        self.process.wait()
+
+        self.process = None
+
+    def _read(self):
+        '''Read a sample; returns ( status, sample ).'''
+
+        data = b''
+        deadline = self.clock() + self.timeout if self.timeout is not None else None
+
+        while True:
+            _ = ( b'\n' + data ).find(b'\n' + TERMINATOR)
+
+            if _ != -1:
+                if len(data) > _ + len(TERMINATOR):
+                    logger.warning('discarding output of %s after its sample', self.script)
+
+                return 'ok', data[:_]
+
+            if self.maximum_size is not None and len(data) > self.maximum_size:
+                logger.warning('killing %s after %s bytes of output', self.script, self.maximum_size)
+
+                return 'truncated', data[:self.maximum_size]
+
+            remaining = deadline - self.clock() if deadline is not None else None
+
+            if remaining is not None and remaining <= 0:
+                logger.warning('killing %s after %s seconds', self.script, self.timeout)
+
+                return 'timeout', data
+
+            readable, _, _ = select.select([ self.process.stdout ], [], [], remaining)
+
+            if not len(readable):
+                continue
+
+            chunk = os.read(self.process.stdout.fileno(), CHUNK_SIZE)
+
+            if not len(chunk):
+                logger.warning('%s exited with status %s', self.script, self.process.wait())
+
+                return 'error', data
+
+            data += chunk
+
+    def sample(self):
+        '''Request a sample from the helper (starting it if necessary).
+
+        Returns
+        -------
+
+        ( status, sample bytes ) where status is 'ok', 'error' (the helper
+        exited or couldn't be started), 'timeout', 'truncated' or 'waiting'
+        (a failed helper's restart delay hasn't passed).
+
+        '''
+
+        with self._lock:
+            if self.process is None:
+                try:
+                    if not self._start():
+                        return 'waiting', b''
+                except OSError as e:
+                    logger.warning('could not start %s', self.script)
+                    logger.exception(e)
+
+                    self._fail()
+
+                    return 'error', b''
+
+            try:
+                self.process.stdin.write(TICK)
+                self.process.stdin.flush()
+            except OSError as e:
+                logger.warning('%s is not reading ticks: %s', self.script, e)
+
+                self._fail()
+
+                return 'error', b''
+
+            status, data = self._read()
+
+            if status == 'ok':
+                self.failures = 0
+                self._retry = None
+            else:
+                self._fail()
+
+            return status, data
+
+    def close(self):
+        '''Ask the helper to exit (closing its input) and kill it if it doesn't.'''
+
+        with self._lock:
+            if self.process is None:
+                return
+
+            logger.info('stopping %s', self.script)
+
+            try:
+                self.process.stdin.close()
+                self.process.wait(EXIT_TIMEOUT)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+
+            self._kill()
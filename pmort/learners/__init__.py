@@ -9,9 +9,8 @@ __all__ = [
 
 import logging
 import os
-import itertools
-import importlib
 
+from pmort.manifest import LazyRegistry
 from pmort.parameters import PARAMETERS
 
 logger = logging.getLogger(__name__)
@@ -19,7 +18,7 @@ logger = logging.getLogger(__name__)
 PARAMETERS.add_parameter(
         options = [ '--active', ],
         group = 'learner',
-        default = 'linear', # TODO Switch to predictive.
+        default = 'predictive',
         help = \
                 'The learner algorithm to utilize for determining inter-run ' \
                 'timings.  Default %(default)s'
@@ -28,56 +27,26 @@ PARAMETERS.add_parameter(
 PARAMETERS.add_parameter(
         options = [ '--minimum-interval', ],
         group = 'learner',
-        default = 1,
-        type = int,
+        default = 1.0,
+        type = float,
         help = \
                 'Set the minimum time between collections by %(prog)s.  This ' \
-                'specifies the minimum number of seconds between ' \
-                'collections.  Default %(default)s'
+                'specifies the minimum number of seconds (fractions ' \
+                'allowed) between collections.  Default %(default)s'
         )
 
 PARAMETERS.add_parameter(
         options = [ '--maximum-interval', ],
         group = 'learner',
-        default = 600,
-        type = int,
+        default = 600.0,
+        type = float,
         help = \
                 'Set the maximum time between collections by %(prog)s.  This ' \
-                'specifies the maximum number of seconds between ' \
-                'collections.  Default %(default)s'
+                'specifies the maximum number of seconds (fractions ' \
+                'allowed) between collections.  Default %(default)s'
         )
 
-LEARNERS = {}
+# Learners (name → learner); modules are imported when first looked up.
+LEARNERS = LazyRegistry('LEARNERS')
 
-module_basename = __name__
-logger.info('loading submodules of %s', module_basename)
-
-directory = os.path.dirname(__file__)
-logger.info('loading learners from %s', directory)
-
-filenames = itertools.chain(*[ [ os.path.join(_[0], filename) for filename in _[2] ] for _ in os.walk(directory) if len(_[2]) ])
-
-module_names = []
-for filename in filenames:
-    if filename.endswith('.py'):
-        _ = filename
-
-        _ = _.replace(directory + '/', '')
-        _ = _.replace('__init__.py', '')
-        _ = _.replace('.py', '')
-
-        if len(_):
-            module_names.append(module_basename + '.' + _)
-
-logger.debug('modules found: %s', list(module_names))
-
-for module_name in module_names:
-    logger.info('loading learner %s', module_name)
-
-    try:
-        importlib.import_module(module_name)
-    except ImportError as e:
-        logger.warning('failed loading %s', module_name)
-        logger.exception(e)
-    else:
-        logger.info('successfully loaded %s', module_name)
+LEARNERS.scan(__name__, os.path.dirname(__file__), lazy = True)
@@ -12,18 +12,44 @@ from pmort.learners import LEARNERS
 logger = logging.getLogger(__name__)
 
 class LinearLearner(object):
+    '''Scale the interval with the load against its all time maximum.
+
+    Arguments
+    ---------
+
+    :``loadavg``:    Function returning the load averages.  Default:
+                     ``os.getloadavg``.
+    :``persistent``: If False, the learned maximum is neither read from nor
+                     written to the cache directory (e.g. for replays).
+
+    '''
+
+    def __init__(self, loadavg = None, persistent = True):
+        self.loadavg = loadavg
+        self.persistent = persistent
+
+        self.anomaly = False
+
+        self._maximum_load = None if persistent else 0.0
+
     @property
     def cache_file_name(self):
         return os.path.join(PARAMETERS['pmort.cache_directory'], 'learned', 'maximum_one_minute_load.txt')
 
     @property
     def learned_maximum_load(self):
-        maximum_load = 0.0
+        '''Learned maximum load (read from the cache file once).'''
 
-        with open(self.cache_file_name, 'r') as max_one_minute_load_fh:
-            maximum_load = float(max_one_minute_load_fh.read().strip())
+        if self._maximum_load is None:
+            self._maximum_load = 0.0
 
-        return maximum_load
+            try:
+                with open(self.cache_file_name, 'r') as max_one_minute_load_fh:
+                    self._maximum_load = float(max_one_minute_load_fh.read().strip())
+            except (IOError, OSError, ValueError) as e:
+                logger.info('no learned maximum load: %s', e)
+
+        return self._maximum_load
 
     def learn(self):
         '''Record the current system items required to make a future decision.
@@ -39,14 +65,30 @@ class LinearLearner(object):
 
         logger.info('learn maximum one minute load')
 
-        current_loadavg = os.getloadavg()[0]
+        current_loadavg = ( self.loadavg or os.getloadavg )()[0]
 
-        logger.debug('current one minute load: %s')
-        logger.debug('learned maximum load: %s')
+        logger.debug('current one minute load: %s', current_loadavg)
+        logger.debug('learned maximum load: %s', self.learned_maximum_load)
 
         if current_loadavg > self.learned_maximum_load:
+            self.anomaly = True
+            self._maximum_load = current_loadavg
+
+            if not self.persistent:
+                return
+
+            if not os.path.isdir(os.path.dirname(self.cache_file_name)):
+                os.makedirs(os.path.dirname(self.cache_file_name))
+
             with open(self.cache_file_name, 'w') as max_one_minute_load_fh:
-                max_one_minute_load_fh.write(current_loadavg)
+                max_one_minute_load_fh.write(str(current_loadavg))
+
+    def anomalous(self):
+        '''True if a new maximum load was learned since the last call.'''
+
+        anomaly, self.anomaly = self.anomaly, False
+
+        return anomaly
 
     def time(self):
         '''Return the calculated amount of time to sleep.
@@ -63,7 +105,7 @@ class LinearLearner(object):
 
         self.learn()
 
-        scale = - os.getloadavg()[0] / self.learned_maximum_load
+        scale = - ( self.loadavg or os.getloadavg )()[0] / ( self.learned_maximum_load or 1.0 )
 
         logger.debug('linear scale: %s', scale)
 
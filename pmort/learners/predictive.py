@@ -0,0 +1,181 @@
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import collections
+import logging
+import os
+import time
+
+from pmort.parameters import PARAMETERS
+from pmort.learners import LEARNERS
+from pmort.learners.statistical import StatisticalLearner
+from pmort.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PARAMETERS.add_parameter(
+        options = [ '--prediction-horizon', ],
+        group = 'learner',
+        metavar = 'MINUTES',
+        default = 1.0,
+        type = float,
+        help = \
+                'Minutes ahead the predictive learner predicts the load ' \
+                'for.  Default: %(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--history', ],
+        group = 'learner',
+        default = 8,
+        type = int,
+        help = \
+                'Number of recent load averages the predictive learner ' \
+                'fits its prediction to.  Default: %(default)s'
+        )
+
+# Coefficients ( t², t, 1 ) of the parabola through the 1, 5 and 15 minute
+# load averages at t = 1, 5 and 15 (minutes ago), as rows of L1, L5 and L15.
+PARABOLA = (
+        ( 1 / 56.0, - 1 / 40.0, 1 / 140.0 ),
+        ( - 5 / 14.0, 4 / 10.0, - 3 / 70.0 ),
+        ( 225 / 168.0, - 3 / 8.0, 1 / 28.0 ),
+        )
+
+# Weight of each older entry of the history relative to the next newer one.
+HISTORY_DECAY = 0.5
+
+def coefficients(loads):
+    '''Parabola coefficients for every ( L1, L5, L15 ) in ``loads``.
+
+    Uses numpy (one matrix product) if it's installed.
+
+    Returns
+    -------
+
+    List of ( a, b, c ) with a·t² + b·t + c through the load averages at t =
+    1, 5 and 15.
+
+    '''
+
+    if numpy is not None:
+        return numpy.dot(numpy.asarray(loads, dtype = float), numpy.asarray(PARABOLA).T).tolist()
+
+    return [ tuple([ sum([ row[_] * load[_] for _ in range(3) ]) for row in PARABOLA ]) for load in loads ]
+
+def predict(loads, horizon = 1.0, decay = HISTORY_DECAY):
+    '''Predicted one minute load ``horizon`` minutes from now.
+
+    The parabola through each entry's 1, 5 and 15 minute load averages (as
+    in scripts/load_predictor) is fitted; the coefficients are averaged with
+    weights decaying by ``decay`` per entry from the newest, and the
+    resulting parabola is extrapolated to t = -``horizon``.
+
+    Arguments
+    ---------
+
+    :``loads``:   ( L1, L5, L15 ) tuples, oldest first.
+    :``horizon``: Minutes ahead.
+    :``decay``:   Relative weight of each older entry.
+
+    '''
+
+    weights = [ decay ** _ for _ in range(len(loads) - 1, -1, -1) ]
+    total = sum(weights)
+
+    if numpy is not None:
+        a, b, c = numpy.dot(numpy.asarray(weights) / total, numpy.asarray(coefficients(loads))).tolist()
+    else:
+        a, b, c = [ sum([ weight * _[column] for weight, _ in zip(weights, coefficients(loads)) ]) / total for column in range(3) ]
+
+    t = - horizon
+
+    return max(a * t ** 2 + b * t + c, 0.0)
+
+class PredictiveLearner(StatisticalLearner):
+    '''Shorten the interval ahead of a predicted rise in load.
+
+    Learns like ``StatisticalLearner`` but scales the interval by the higher
+    of the current and the predicted (cf. ``predict``) one minute load; thus,
+    collection speeds up before the load arrives.
+
+    Every prediction is checked against the load observed once its horizon
+    has passed; the mean absolute error (``error``) and the signed mean
+    (``bias``) of these are kept as an exponentially weighted average (same
+    time constant as the statistics).
+
+    Arguments are the same as for ``StatisticalLearner``.
+
+    '''
+
+    def __init__(self, clock = time.monotonic, loadavg = None, persistent = True):
+        super(PredictiveLearner, self).__init__(clock, loadavg, persistent)
+
+        self.prediction = None
+
+        self.error = None
+        self.bias = None
+        self.checked = 0
+
+        self._history = None
+        self._pending = collections.deque()
+
+    @property
+    def cache_file_name(self):
+        return os.path.join(PARAMETERS['pmort.cache_directory'], 'learned', 'predictive.json')
+
+    def _check(self, now):
+        while len(self._pending) and self._pending[0][0] <= now:
+            _, predicted = self._pending.popleft()
+
+            error = predicted - self.load
+
+            if self.error is None:
+                self.error, self.bias = abs(error), error
+            else:
+                alpha = min(1.0, PARAMETERS['learner.prediction_horizon'] * 60 / ( PARAMETERS['learner.smoothing'] or 1.0 ))
+
+                self.error += alpha * ( abs(error) - self.error )
+                self.bias += alpha * ( error - self.bias )
+
+            self.checked += 1
+
+            logger.debug('predicted load %s; observed %s; mean absolute error: %s', predicted, self.load, self.error)
+
+    def learn(self):
+        '''Observe the load averages and predict the load.'''
+
+        super(PredictiveLearner, self).learn()
+
+        now = self.clock()
+
+        if self._history is None or self._history.maxlen != PARAMETERS['learner.history']:
+            self._history = collections.deque(self._history or [], maxlen = max(PARAMETERS['learner.history'], 1))
+
+        self._history.append(tuple(self.loads[:3]))
+
+        self._check(now)
+
+        horizon = PARAMETERS['learner.prediction_horizon']
+
+        self.prediction = predict(list(self._history), horizon)
+        self._pending.append(( now + horizon * 60, self.prediction ))
+
+        logger.debug('predicted load in %s minutes: %s', horizon, self.prediction)
+
+    def scale(self, load = None):
+        if load is None:
+            load = max(self.load, self.prediction)
+
+        return super(PredictiveLearner, self).scale(load)
+
+LEARNERS['predictive'] = PredictiveLearner()
+
+REGISTRY.gauge('pmort_prediction_error', 'Mean absolute error of the predictive learner\'s load predictions.', lambda: LEARNERS['predictive'].error)
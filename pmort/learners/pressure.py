@@ -0,0 +1,182 @@
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import logging
+import os
+import time
+
+from pmort.parameters import PARAMETERS
+from pmort.learners import LEARNERS
+from pmort.procfs import PROC
+from pmort.procfs import ProcFile
+from pmort.procfs import parse_meminfo
+from pmort.procfs import parse_vmstat
+from pmort.procfs import parse_diskstats
+from pmort.procfs import parse_pressure
+
+logger = logging.getLogger(__name__)
+
+PARAMETERS.add_parameter(
+        options = [ '--pressure-weights', ],
+        group = 'learner',
+        default = 'cpu=1, memory=2, io=2, available=1, swap=2, queue=1',
+        help = \
+                'Gain of each signal of the pressure learner: cpu, memory ' \
+                'and io (pressure stall information), available (fraction ' \
+                'of memory in use), swap (swapping rate) and queue (disk ' \
+                'queue depth).  The interval is shortest once any signal ' \
+                'times its gain reaches one; zero ignores a signal.  ' \
+                'Default: %(default)s'
+        )
+
+# Pages swapped in and out per second considered full pressure.
+SWAP_SATURATION = 1024.0
+
+# Average number of requests in flight on a disk considered full pressure.
+QUEUE_SATURATION = 8.0
+
+def parse_weights(text):
+    '''Parse a learner.pressure_weights value into {signal: weight}.'''
+
+    weights = {}
+
+    for entry in text.replace(',', ' ').split():
+        name, _, weight = entry.partition('=')
+
+        try:
+            weights[name.strip()] = float(weight)
+        except ValueError:
+            logger.warning('ignoring malformed weight: %s', entry)
+
+    return weights
+
+class PressureLearner(object):
+    '''Shorten the interval as the system comes under any kind of pressure.
+
+    The load average misses memory pressure and I/O stalls that don't
+    queue runnable tasks.  This learner measures, each as a fraction from 0
+    (none) to 1 (saturated):
+
+    :cpu, memory, io: Share of the last ten seconds some task stalled on the
+                      resource (/proc/pressure; skipped if unavailable).
+    :available:       Share of memory not available (/proc/meminfo).
+    :swap:            Pages swapped in and out per second relative to
+                      ``SWAP_SATURATION`` (/proc/vmstat).
+    :queue:           Average requests in flight on the busiest disk relative
+                      to ``QUEUE_SATURATION`` (/proc/diskstats).
+
+    The urgency is the highest signal times its weight (cf.
+    learner.pressure_weights) capped at one, and the interval shrinks from
+    the maximum (no urgency) to the minimum (urgency of one) linearly.  An
+    urgency of one is reported by ``anomalous``.
+
+    Arguments
+    ---------
+
+    :``clock``:   Function returning monotonic seconds.
+    :``signals``: Function returning the signals (as ``measure`` does) to
+                  use instead of measuring them (e.g. for replays).
+
+    '''
+
+    def __init__(self, clock = time.monotonic, signals = None):
+        self.clock = clock
+        self.source = signals or self.measure
+
+        self.signals = {}
+        self.urgency = 0.0
+
+        self._pressure = dict([ ( _, ProcFile(os.path.join(PROC, 'pressure', _)) ) for _ in ( 'cpu', 'memory', 'io' ) ])
+        self._meminfo = ProcFile(os.path.join(PROC, 'meminfo'))
+        self._vmstat = ProcFile(os.path.join(PROC, 'vmstat'))
+        self._diskstats = ProcFile(os.path.join(PROC, 'diskstats'))
+
+        self._unavailable = set()
+        self._previous = None
+
+    def _read(self, name, proc_file):
+        if name in self._unavailable:
+            return None
+
+        try:
+            return proc_file.read()
+        except (IOError, OSError) as e:
+            logger.info('pressure learner ignoring %s: %s', name, e)
+
+            self._unavailable.add(name)
+
+            return None
+
+    def measure(self):
+        '''Current signals as {name: fraction}.'''
+
+        signals = {}
+
+        for name, proc_file in self._pressure.items():
+            _ = self._read(name, proc_file)
+
+            if _ is not None:
+                signals[name] = parse_pressure(_).get('some', {}).get('avg10', 0.0) / 100.0
+
+        _ = self._read('available', self._meminfo)
+
+        if _ is not None:
+            meminfo = parse_meminfo(_)
+
+            if meminfo.get('MemTotal'):
+                signals['available'] = 1.0 - float(meminfo.get('MemAvailable', meminfo.get('MemFree', 0))) / meminfo['MemTotal']
+
+        now = self.clock()
+
+        swapped = weighted = None
+
+        _ = self._read('swap', self._vmstat)
+
+        if _ is not None:
+            vmstat = parse_vmstat(_)
+            swapped = vmstat.get('pswpin', 0) + vmstat.get('pswpout', 0)
+
+        _ = self._read('queue', self._diskstats)
+
+        if _ is not None:
+            weighted = dict([ ( device, fields[10] ) for device, fields in parse_diskstats(_).items() ])
+
+        if self._previous is not None and now > self._previous[0]:
+            elapsed = now - self._previous[0]
+
+            if swapped is not None and self._previous[1] is not None:
+                signals['swap'] = ( swapped - self._previous[1] ) / elapsed / SWAP_SATURATION
+
+            if weighted is not None and self._previous[2] is not None:
+                signals['queue'] = max([ 0 ] + [ ( _ - self._previous[2].get(device, _) ) / 1000.0 / elapsed for device, _ in weighted.items() ]) / QUEUE_SATURATION
+
+        self._previous = ( now, swapped, weighted )
+
+        return dict([ ( name, min(max(_, 0.0), 1.0) ) for name, _ in signals.items() ])
+
+    def learn(self):
+        '''Measure the signals and compute the urgency.'''
+
+        self.signals = self.source()
+
+        weights = parse_weights(PARAMETERS['learner.pressure_weights'])
+
+        self.urgency = min(max([ 0.0 ] + [ _ * weights.get(name, 0.0) for name, _ in self.signals.items() ]), 1.0)
+
+        logger.debug('pressure signals: %s; urgency: %s', self.signals, self.urgency)
+
+    def anomalous(self):
+        '''True if the last urgency was at its maximum.'''
+
+        return self.urgency >= 1.0
+
+    def time(self):
+        '''Return the calculated amount of time to sleep.'''
+
+        self.learn()
+
+        return PARAMETERS['learner.maximum_interval'] - self.urgency * ( PARAMETERS['learner.maximum_interval'] - PARAMETERS['learner.minimum_interval'] )
+
+LEARNERS['pressure'] = PressureLearner()
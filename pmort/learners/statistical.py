@@ -0,0 +1,359 @@
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import json
+import logging
+import math
+import os
+import time
+
+from pmort.parameters import PARAMETERS
+from pmort.learners import LEARNERS
+
+logger = logging.getLogger(__name__)
+
+PARAMETERS.add_parameter(
+        options = [ '--smoothing', ],
+        group = 'learner',
+        metavar = 'SECONDS',
+        default = 900.0,
+        type = float,
+        help = \
+                'Time constant of the statistical learner\'s moving ' \
+                'average and variance of the load.  Default: %(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--half-life', ],
+        group = 'learner',
+        metavar = 'SECONDS',
+        default = 86400.0,
+        type = float,
+        help = \
+                'Seconds in which the statistical learner\'s maximum load ' \
+                'decays halfway to the current load.  Default: %(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--checkpoint-interval', ],
+        group = 'learner',
+        metavar = 'SECONDS',
+        default = 300.0,
+        type = float,
+        help = \
+                'Seconds between saves of the statistical learner\'s state ' \
+                'to the cache directory.  Default: %(default)s'
+        )
+
+QUANTILE = 0.99
+
+class P2Quantile(object):
+    '''Streaming quantile estimate in constant space (the P² algorithm).
+
+    Five markers track the minimum, the p/2, p and (1 + p)/2 quantiles and
+    the maximum; each observation moves them with a piecewise parabolic
+    interpolation rather than keeping the observations (Jain and Chlamtac,
+    1985).
+
+    Arguments
+    ---------
+
+    :``p``: Quantile estimated (e.g. 0.99).
+
+    '''
+
+    def __init__(self, p):
+        self.p = p
+
+        self.heights = []
+        self.positions = [ 1, 2, 3, 4, 5 ]
+        self.desired = [ 1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5 ]
+        self.increments = [ 0, p / 2, p, ( 1 + p ) / 2, 1 ]
+
+    def add(self, value):
+        '''Observe ``value``.'''
+
+        heights, positions = self.heights, self.positions
+
+        if len(heights) < 5:
+            heights.append(value)
+            heights.sort()
+
+            return
+
+        if value < heights[0]:
+            heights[0] = value
+            k = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            k = 3
+        else:
+            k = max([ i for i in range(4) if heights[i] <= value ])
+
+        for i in range(k + 1, 5):
+            positions[i] += 1
+
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in range(1, 4):
+            d = self.desired[i] - positions[i]
+
+            if ( d >= 1 and positions[i + 1] - positions[i] > 1 ) or ( d <= -1 and positions[i - 1] - positions[i] < -1 ):
+                d = 1 if d > 0 else -1
+
+                height = heights[i] + d / float(positions[i + 1] - positions[i - 1]) * (
+                        ( positions[i] - positions[i - 1] + d ) * ( heights[i + 1] - heights[i] ) / float(positions[i + 1] - positions[i]) +
+                        ( positions[i + 1] - positions[i] - d ) * ( heights[i] - heights[i - 1] ) / float(positions[i] - positions[i - 1])
+                        )
+
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + d * ( heights[i + d] - heights[i] ) / float(positions[i + d] - positions[i])
+
+                heights[i] = height
+                positions[i] += d
+
+    def value(self):
+        '''Current estimate (None before any observation).'''
+
+        if not len(self.heights):
+            return None
+
+        if len(self.heights) < 5:
+            return self.heights[min(int(self.p * len(self.heights)), len(self.heights) - 1)]
+
+        return self.heights[2]
+
+    def state(self):
+        return { 'p': self.p, 'heights': self.heights, 'positions': self.positions, 'desired': self.desired }
+
+    @classmethod
+    def from_state(cls, state):
+        quantile = cls(state['p'])
+
+        quantile.heights = list(state['heights'])
+        quantile.positions = list(state['positions'])
+        quantile.desired = list(state['desired'])
+
+        return quantile
+
+class RunningStatistics(object):
+    '''Constant space, time weighted statistics of a series (e.g. the load).
+
+    :mean:     Exponentially weighted moving average with time constant
+               ``smoothing`` seconds.
+    :variance: Exponentially weighted moving variance (same time constant).
+    :maximum:  Maximum that decays halfway towards the current value every
+               ``half_life`` seconds.
+    :quantile: ``P2Quantile`` estimate of the ``QUANTILE`` over all
+               observations.
+
+    Arguments
+    ---------
+
+    :``smoothing``: Time constant (seconds) of mean and variance.
+    :``half_life``: Half-life (seconds) of the maximum.
+
+    '''
+
+    def __init__(self, smoothing = 900.0, half_life = 86400.0):
+        self.smoothing = smoothing
+        self.half_life = half_life
+
+        self.count = 0
+        self.mean = 0.0
+        self.variance = 0.0
+        self.maximum = 0.0
+
+        self.quantile = P2Quantile(QUANTILE)
+
+    def add(self, value, elapsed):
+        '''Observe ``value`` ``elapsed`` seconds after the previous one.'''
+
+        self.quantile.add(value)
+
+        if not self.count:
+            self.count = 1
+            self.mean = self.maximum = value
+
+            return
+
+        self.count += 1
+
+        alpha = 1 - math.exp(- elapsed / self.smoothing) if self.smoothing > 0 else 1.0
+
+        difference = value - self.mean
+
+        self.mean += alpha * difference
+        self.variance = ( 1 - alpha ) * ( self.variance + alpha * difference ** 2 )
+
+        decay = 0.5 ** ( elapsed / self.half_life ) if self.half_life > 0 else 0.0
+
+        self.maximum = max(value, value + ( self.maximum - value ) * decay)
+
+    @property
+    def deviation(self):
+        return math.sqrt(max(self.variance, 0.0))
+
+    def state(self):
+        return {
+                'count': self.count,
+                'mean': self.mean,
+                'variance': self.variance,
+                'maximum': self.maximum,
+                'quantile': self.quantile.state(),
+                }
+
+    def restore(self, state):
+        self.count = state['count']
+        self.mean = state['mean']
+        self.variance = state['variance']
+        self.maximum = state['maximum']
+        self.quantile = P2Quantile.from_state(state['quantile'])
+
+class StatisticalLearner(object):
+    '''Learn the typical load from running statistics kept in memory.
+
+    Every ``time`` call observes the one minute load (cf.
+    ``RunningStatistics``) and maps it between the moving average (typical
+    load: maximum interval) and the decayed maximum or the number of CPUs,
+    whichever is higher (high load: minimum interval).  Thus, the interval
+    follows the recent behaviour of the system rather than an all time
+    maximum.
+
+    The statistics are kept in memory and saved to the cache directory every
+    learner.checkpoint_interval seconds (and read back on the first call) so
+    they survive restarts.
+
+    ``anomalous`` reports a load above both the learned 99th percentile and
+    three standard deviations above the average.
+
+    Arguments
+    ---------
+
+    :``clock``:      Function returning monotonic seconds.
+    :``loadavg``:    Function returning the load averages.  Default:
+                     ``os.getloadavg``.
+    :``persistent``: If False, the statistics are neither restored from nor
+                     saved to the cache directory (e.g. for replays).
+
+    '''
+
+    def __init__(self, clock = time.monotonic, loadavg = None, persistent = True):
+        self.clock = clock
+        self.loadavg = loadavg
+        self.persistent = persistent
+
+        self.statistics = None
+        self.loads = None
+        self.load = None
+
+        self._observed = None
+        self._checkpointed = None
+
+    @property
+    def cache_file_name(self):
+        return os.path.join(PARAMETERS['pmort.cache_directory'], 'learned', 'statistical.json')
+
+    def _restore(self):
+        self.statistics = RunningStatistics(PARAMETERS['learner.smoothing'], PARAMETERS['learner.half_life'])
+
+        self._checkpointed = self.clock()
+
+        if not self.persistent:
+            return
+
+        try:
+            with open(self.cache_file_name, 'r') as state_fh:
+                self.statistics.restore(json.load(state_fh))
+        except (IOError, OSError, ValueError, KeyError, TypeError) as e:
+            logger.info('starting statistical learner afresh: %s', e)
+        else:
+            logger.info('restored statistical learner from %s', self.cache_file_name)
+
+    def checkpoint(self):
+        '''Save the statistics to the cache directory (atomically).'''
+
+        path = self.cache_file_name
+        temporary = '{0}.{1}'.format(path, os.getpid())
+
+        logger.info('saving statistical learner to %s', path)
+
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+
+            with open(temporary, 'w') as state_fh:
+                json.dump(self.statistics.state(), state_fh)
+
+            os.rename(temporary, path)
+        except (IOError, OSError) as e:
+            logger.warning('could not save statistical learner')
+            logger.exception(e)
+
+        self._checkpointed = self.clock()
+
+    def learn(self):
+        '''Observe the current one minute load.'''
+
+        if self.statistics is None:
+            self._restore()
+
+        now = self.clock()
+
+        self.loads = ( self.loadavg or os.getloadavg )()
+        self.load = self.loads[0]
+
+        self.statistics.add(self.load, now - self._observed if self._observed is not None else 0.0)
+        self._observed = now
+
+        logger.debug('load: %s; mean: %s; deviation: %s; maximum: %s; p%s: %s', self.load, self.statistics.mean, self.statistics.deviation, self.statistics.maximum, int(QUANTILE * 100), self.statistics.quantile.value())
+
+        if self.persistent and now - self._checkpointed >= PARAMETERS['learner.checkpoint_interval']:
+            self.checkpoint()
+
+    def scale(self, load = None):
+        '''Position of ``load`` (default: the last load) between typical (0)
+        and high (1).
+
+        Typical is the mean load but never more than the number of CPUs;
+        thus, sustained overload never becomes the baseline that earns the
+        relaxed interval.
+
+        '''
+
+        if load is None:
+            load = self.load
+
+        cpus = float(os.cpu_count() or 1)
+
+        low = min(self.statistics.mean, cpus)
+        high = max(self.statistics.maximum, cpus)
+
+        if high <= low:
+            return 1.0 if load > low else 0.0
+
+        return min(max(( load - low ) / ( high - low ), 0.0), 1.0)
+
+    def anomalous(self):
+        '''True if the last load observed is unusually high.'''
+
+        if self.statistics is None or self.statistics.count < 5:
+            return False
+
+        return self.load > self.statistics.quantile.value() and self.load > self.statistics.mean + 3 * self.statistics.deviation
+
+    def time(self):
+        '''Return the calculated amount of time to sleep.'''
+
+        self.learn()
+
+        scale = self.scale()
+
+        logger.debug('statistical scale: %s', scale)
+
+        return PARAMETERS['learner.maximum_interval'] - scale * ( PARAMETERS['learner.maximum_interval'] - PARAMETERS['learner.minimum_interval'] )
+
+LEARNERS['statistical'] = StatisticalLearner()
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import collections.abc
+import importlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+def module_names(module_basename, directory):
+    '''( module name, filename ) of the python modules below ``directory``.
+
+    Packages' ``__init__`` modules are skipped.
+
+    Arguments
+    ---------
+
+    :``module_basename``: Module name prefix (empty for top level modules).
+    :``directory``:       Directory to recursively search.
+
+    '''
+
+    names = []
+
+    for path, directories, filenames in os.walk(directory):
+        directories.sort()
+
+        for filename in sorted(filenames):
+            if not filename.endswith('.py') or filename == '__init__.py':
+                continue
+
+            _ = os.path.relpath(os.path.join(path, filename), directory)[:-len('.py')].replace(os.path.sep, '.')
+
+            names.append(( '.'.join([ _ for _ in ( module_basename, _ ) if len(_) ]), os.path.join(path, filename) ))
+
+    return names
+
+def _stamp(path):
+    '''Modification time (ns) and size of path (None if it's gone).'''
+
+    try:
+        _ = os.stat(path)
+    except OSError:
+        return None
+
+    return [ _.st_mtime_ns, _.st_size ]
+
+class LazyRegistry(collections.abc.MutableMapping):
+    '''Dictionary of objects registered by modules that are imported on use.
+
+    Modules register by assigning to the registry
+    (``COLLECTORS['free'] = free_collector``).  Rather than importing every
+    module up front, ``scan`` reads the modules' source for those
+    assignments and builds a manifest (name → module); a module is imported
+    the first time one of its names is looked up.  Membership tests and
+    listing names use the manifest alone; iterating over values or items
+    imports everything.
+
+    Modules mentioning one of the ``markers`` without a literal name (e.g.
+    appending to ``GENERATORS``) are only imported by ``load``.
+
+    What a module registers is remembered with its modification time and
+    size; an unchanged module isn't read again.  ``read_cache`` and
+    ``write_cache`` keep that between runs.
+
+    Arguments
+    ---------
+
+    :``variable``: Name modules assign to (e.g. COLLECTORS).
+    :``markers``:  Other names that make a module part of the manifest.
+
+    '''
+
+    def __init__(self, variable, markers = ()):
+        self.variable = variable
+        self.markers = ( variable, ) + tuple(markers)
+
+        self._pattern = re.compile(r'^\s*' + re.escape(variable) + r'\[\s*[\'"]([^\'"]+)[\'"]\s*\]\s*=', re.MULTILINE)
+
+        self._objects = {}
+        self._manifest = collections.OrderedDict()
+        self._modules = collections.OrderedDict()
+        self._imported = set()
+
+        self._deferred = []
+        self._cache = {}
+        self._cache_changed = False
+
+        self._lock = threading.RLock()
+
+    def scan(self, module_basename, directory, update_path = False, lazy = False):
+        '''Add the modules below ``directory`` to the manifest (not importing
+        them).
+
+        Arguments
+        ---------
+
+        :``module_basename``: Module name prefix of the found modules.
+        :``directory``:       Directory to recursively scan.
+        :``update_path``:     If True, ``directory`` is added to the system
+                              path while importing its modules.
+        :``lazy``:            If True, ``directory`` is only scanned when
+                              the registry is first used.
+
+        '''
+
+        if lazy:
+            with self._lock:
+                self._deferred.append(( module_basename, directory, update_path ))
+
+            return
+
+        logger.info('scanning %s for %s', directory, self.variable)
+
+        for module_name, filename in module_names(module_basename, directory):
+            stamp = _stamp(filename)
+
+            with self._lock:
+                cached = self._cache.get(filename)
+
+            if cached is not None and stamp is not None and cached[0] == stamp:
+                marked, names = cached[1], cached[2]
+            else:
+                try:
+                    with open(filename, encoding = 'utf-8', errors = 'replace') as module_fh:
+                        source = module_fh.read()
+                except IOError as e:
+                    logger.warning('could not scan %s', filename)
+                    logger.exception(e)
+
+                    continue
+
+                marked = any([ _ in source for _ in self.markers ])
+                names = self._pattern.findall(source)
+
+                with self._lock:
+                    self._cache[filename] = [ stamp, marked, names ]
+                    self._cache_changed = True
+
+            if not marked:
+                continue
+
+            logger.debug('manifest of %s: %s', module_name, names)
+
+            with self._lock:
+                self._modules[module_name] = directory if update_path else None
+
+                for name in names:
+                    self._manifest.setdefault(name, module_name)
+
+    def _scan_deferred(self):
+        with self._lock:
+            deferred, self._deferred = self._deferred, []
+
+            for _ in deferred:
+                self.scan(*_)
+
+    def read_cache(self, path):
+        '''Reuse what the modules cached in ``path`` (cf. ``write_cache``)
+        register if they haven't changed since.'''
+
+        try:
+            with open(path, 'r') as cache_fh:
+                cache = json.load(cache_fh)
+        except (IOError, OSError, ValueError) as e:
+            logger.info('could not read manifest cache %s: %s', path, e)
+
+            return
+
+        if not isinstance(cache, dict):
+            return
+
+        with self._lock:
+            for filename, entry in cache.items():
+                if isinstance(entry, list) and len(entry) == 3:
+                    self._cache.setdefault(filename, entry)
+
+    def write_cache(self, path):
+        '''Save what the scanned modules register to ``path`` (if it changed).'''
+
+        with self._lock:
+            if not self._cache_changed:
+                return
+
+            cache = dict(self._cache)
+
+            self._cache_changed = False
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+
+            with open(path + '.tmp', 'w') as cache_fh:
+                json.dump(cache, cache_fh)
+
+            os.replace(path + '.tmp', path)
+        except (IOError, OSError) as e:
+            logger.info('could not write manifest cache %s: %s', path, e)
+
+    def _import(self, module_name):
+        with self._lock:
+            if module_name in self._imported:
+                return
+
+            self._imported.add(module_name)
+
+            directory = self._modules.get(module_name)
+
+            if directory is not None and directory not in sys.path:
+                sys.path.append(directory)
+            else:
+                directory = None
+
+            logger.info('loading %s', module_name)
+
+            try:
+                importlib.import_module(module_name)
+            except ImportError as e:
+                logger.warning('failed loading %s', module_name)
+                logger.exception(e)
+            else:
+                logger.info('successfully loaded %s', module_name)
+            finally:
+                if directory is not None:
+                    sys.path.remove(directory)
+
+    def load(self):
+        '''Import every module in the manifest.
+
+        Names in the manifest that weren't registered after all (e.g. the
+        module failed to import) are dropped.
+
+        Returns
+        -------
+
+        This registry.
+
+        '''
+
+        self._scan_deferred()
+
+        for module_name in list(self._modules.keys()):
+            self._import(module_name)
+
+        with self._lock:
+            for name in [ _ for _ in self._manifest.keys() if _ not in self._objects ]:
+                logger.warning('%s was not registered by %s', name, self._manifest[name])
+
+                del self._manifest[name]
+
+        return self
+
+    def loaded(self):
+        '''Dictionary of the objects registered so far (nothing is imported).'''
+
+        with self._lock:
+            return dict(self._objects)
+
+    def __getitem__(self, name):
+        self._scan_deferred()
+
+        with self._lock:
+            if name not in self._objects and name in self._manifest:
+                self._import(self._manifest[name])
+
+            if name not in self._objects:
+                self.load()
+
+            return self._objects[name]
+
+    def __setitem__(self, name, value):
+        with self._lock:
+            self._objects[name] = value
+
+    def __delitem__(self, name):
+        with self._lock:
+            del self._objects[name]
+
+            self._manifest.pop(name, None)
+
+    def __contains__(self, name):
+        self._scan_deferred()
+
+        with self._lock:
+            return name in self._objects or name in self._manifest
+
+    def __iter__(self):
+        self._scan_deferred()
+
+        with self._lock:
+            names = list(self._manifest.keys()) + [ _ for _ in self._objects.keys() if _ not in self._manifest ]
+
+        return iter(names)
+
+    def __len__(self):
+        return len(list(iter(self)))
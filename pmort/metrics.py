@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import bisect
+import http.server
+import logging
+import os
+import socket
+import socketserver
+import stat
+import threading
+
+from pmort.parameters import PARAMETERS
+
+logger = logging.getLogger(__name__)
+
+PARAMETERS.add_parameter(
+        options = [ '--listen', ],
+        group = 'metrics',
+        metavar = 'ADDRESS',
+        default = '',
+        help = \
+                'Address pmort serves its own metrics (Prometheus text ' \
+                'format, /metrics) on: HOST:PORT or the path of a Unix ' \
+                'socket.  Empty disables the endpoint.  Default: ' \
+                '%(default)s'
+        )
+
+# Upper bounds (seconds) of the collector duration histogram buckets.
+DURATION_BUCKETS = ( 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0 )
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(labels, extra = ()):
+    _ = list(labels) + list(extra)
+
+    if not len(_):
+        return ''
+
+    return '{' + ','.join([ '{0}="{1}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key, value in _ ]) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric(object):
+    '''Base of the metrics kept in a ``Registry`` (one per name).
+
+    Each metric holds a value per distinct set of labels (keyword arguments
+    of the updating methods).
+
+    Arguments
+    ---------
+
+    :``name``: Metric name (e.g. pmort_collector_errors_total).
+    :``help``: Description.
+
+    '''
+
+    kind = 'untyped'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self):
+        '''( name, labels, value ) tuples of the current values.'''
+
+        with self._lock:
+            return [ ( self.name, labels, value ) for labels, value in sorted(self._values.items()) ]
+
+    def render(self):
+        lines = [
+                '# HELP {0} {1}'.format(self.name, self.help),
+                '# TYPE {0} {1}'.format(self.name, self.kind),
+                ]
+
+        lines.extend([ '{0}{1} {2}'.format(name, _format_labels(labels), _format_value(value)) for name, labels, value in self.samples() ])
+
+        return '\n'.join(lines)
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def increment(self, amount = 1, **labels):
+        key = _labels(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    '''Value that goes up and down; set explicitly or read from ``function``.
+
+    Arguments
+    ---------
+
+    :``function``: Callable returning the (unlabelled) value at rendering or
+                   None.
+
+    '''
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, function = None):
+        super(Gauge, self).__init__(name, help)
+
+        self.function = function
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_labels(labels)] = value
+
+    def samples(self):
+        if self.function is None:
+            return super(Gauge, self).samples()
+
+        try:
+            value = self.function()
+        except Exception as e:
+            logger.warning('could not read %s: %s', self.name, e)
+
+            return []
+
+        return [ ( self.name, (), value ) ] if value is not None else []
+
+class Histogram(Metric):
+    '''Distribution of observations in cumulative buckets.
+
+    Arguments
+    ---------
+
+    :``buckets``: Increasing upper bounds of the buckets (+Inf is added).
+
+    '''
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets = DURATION_BUCKETS):
+        super(Histogram, self).__init__(name, help)
+
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = _labels(labels)
+
+        with self._lock:
+            counts, total = self._values.get(key, ( [ 0 ] * ( len(self.buckets) + 1 ), 0.0 ))
+
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+
+            self._values[key] = ( counts, total + value )
+
+    def samples(self):
+        with self._lock:
+            values = sorted([ ( labels, list(counts), total ) for labels, ( counts, total ) in self._values.items() ])
+
+        samples = []
+
+        for labels, counts, total in values:
+            cumulative = 0
+
+            for bound, count in zip(self.buckets + ( float('inf'), ), counts):
+                cumulative += count
+
+                samples.append(( self.name + '_bucket', labels + ( ( 'le', _format_value(float(bound)) ), ), cumulative ))
+
+            samples.append(( self.name + '_sum', labels, total ))
+            samples.append(( self.name + '_count', labels, cumulative ))
+
+        return samples
+
+class Registry(object):
+    '''Named metrics of this process.
+
+    ``counter``, ``gauge`` and ``histogram`` return the metric of the given
+    name, creating it on first use; thus, modules can declare the metrics
+    they update independently.
+
+    '''
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, help, **kwargs)
+
+            return self._metrics[name]
+
+    def counter(self, name, help):
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help, function = None):
+        _ = self._get(Gauge, name, help)
+
+        if function is not None:
+            _.function = function
+
+        return _
+
+    def histogram(self, name, help, buckets = DURATION_BUCKETS):
+        return self._get(Histogram, name, help, buckets = buckets)
+
+    def render(self):
+        '''All metrics in the Prometheus text exposition format.'''
+
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+
+        return '\n'.join([ _.render() for name, _ in metrics ]) + '\n'
+
+REGISTRY = Registry()
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    '''Serve ``REGISTRY`` at /metrics.'''
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ( '/', '/metrics' ):
+            self.send_error(404)
+
+            return
+
+        body = REGISTRY.render().encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        self.wfile.write(body)
+
+    def address_string(self):
+        return str(self.client_address or 'unix')
+
+    def log_message(self, format, *args):
+        logger.debug('metrics request: ' + format, *args)
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = self.socket.accept()
+
+        return request, None
+
+class TCPHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+class TCP6HTTPServer(TCPHTTPServer):
+    address_family = socket.AF_INET6
+
+def start_metrics():
+    '''Serve the metrics on metrics.listen (if set) in a daemon thread.
+
+    Returns
+    -------
+
+    The server (stop it with ``shutdown``) or None if disabled or the
+    address can't be bound (logged).  A file in the way of a Unix socket is
+    only replaced if it's a (stale) socket.
+
+    '''
+
+    address = PARAMETERS['metrics.listen']
+
+    if not len(address):
+        return None
+
+    try:
+        if address.startswith(os.path.sep):
+            if os.path.lexists(address):
+                if not stat.S_ISSOCK(os.lstat(address).st_mode):
+                    logger.warning('could not serve metrics on %s: not a socket', address)
+
+                    return None
+
+                os.remove(address)
+
+            server = UnixHTTPServer(address, MetricsHandler)
+        else:
+            host, _, port = address.rpartition(':')
+            host = host.strip('[]') or '127.0.0.1'
+
+            server = ( TCP6HTTPServer if ':' in host else TCPHTTPServer )(( host, int(port) ), MetricsHandler)
+    except (OSError, ValueError) as e:
+        logger.warning('could not serve metrics on %s', address)
+        logger.exception(e)
+
+        return None
+
+    thread = threading.Thread(target = server.serve_forever, name = 'metrics')
+    thread.daemon = True
+    thread.start()
+
+    logger.info('serving metrics on %s', address)
+
+    return server
@@ -9,62 +9,479 @@ import logging
 import sys
 import datetime
 import os
+import threading
+import contextlib
+import tempfile
+import time
 
 from pmort.parameters import PARAMETERS
+from pmort import compression
+from pmort import archive
+from pmort import retention
+from pmort import records as records_format
+from pmort import series
+from pmort.metrics import REGISTRY
 
 logger = logging.getLogger(__name__)
 
-def write_output(name, output):
+OUTPUT_BYTES = REGISTRY.counter('pmort_output_bytes_total', 'Bytes of output written by each collector (before compression).')
+
+SPOOL_SIZE = 1048576
+
+def snapshot_name(timestamp):
+    '''Name of the snapshot directory for ``timestamp`` (a datetime).
+
+    Cycles may be less than a second apart; thus, the microseconds are part
+    of the name unless they're zero (names still sort by time).
+
+    '''
+
+    name = timestamp.strftime('%Y%m%d%H%M%S')
+
+    if timestamp.microsecond:
+        name += timestamp.strftime('.%f')
+
+    return name
+
+def snapshot_time(name):
+    '''Datetime of the snapshot directory ``name`` (cf. ``snapshot_name``).'''
+
+    return datetime.datetime.strptime(name, '%Y%m%d%H%M%S.%f' if '.' in name else '%Y%m%d%H%M%S')
+
+_stdout_lock = threading.Lock()
+_link_lock = threading.Lock()
+
+class Snapshot(object):
+    '''All collector output from a single cycle.
+
+    A snapshot owns one timestamped directory in the output directory (for
+    example, /var/spool/pmort/20130123223723 or, for a time with a fraction
+    of a second, /var/spool/pmort/20130123223723.250000) that every collector
+    of the cycle writes into.  The directory is created once, on the first write,
+    and the current symlink is flipped to it once, by ``commit``, when the
+    cycle is finished (or by the first write after ``commit`` if a collector
+    that overran the cycle is the first to write).  Every output's size is
+    reported to retention as it's written.
+
+    Output files are compressed as they're written if a codec is selected
+    (cf. ``pmort.compression``) and carry the codec's extension (for example,
+    collector.log.gz).  ``read_output`` decompresses them transparently.
+
+    With segments storage, no directory is created; each output is instead
+    appended as one record to the ``pmort.archive.SegmentArchive`` in the
+    segments subdirectory of the output directory and ``commit`` does
+    nothing.
+
+    If the output directory is '-', output is written to standard output
+    (uncompressed) instead and ``commit`` does nothing.
+
+    Arguments
+    ---------
+
+    :``timestamp``:         Time the snapshot represents.  Default: now.
+    :``output_directory``:  Directory holding snapshots.  Default:
+                            pmort.output_directory.
+    :``codec``:             Name of the compression codec.  Default:
+                            pmort.compression.
+    :``compression_level``: Level passed to the codec.  Default:
+                            pmort.compression_level.
+    :``storage``:           'directory' or 'segments'.  Default:
+                            pmort.storage.
+
+    '''
+
+    def __init__(self, timestamp = None, output_directory = None, codec = None, compression_level = None, storage = None):
+        if timestamp is None:
+            timestamp = datetime.datetime.now()
+
+        if output_directory is None:
+            output_directory = PARAMETERS['pmort.output_directory']
+
+        if storage is None:
+            storage = PARAMETERS['pmort.storage']
+
+        if codec is None:
+            codec = PARAMETERS['pmort.compression']
+
+        if compression_level is None:
+            compression_level = PARAMETERS['pmort.compression_level']
+
+        self.timestamp = timestamp
+        self.output_directory = output_directory
+
+        self.codec = compression.codec(codec)
+        self.compression_level = compression_level or None
+
+        self.directory = None
+        self.archive = None
+
+        if output_directory.startswith('-'):
+            pass
+        elif storage == 'segments':
+            self.archive = archive.get_archive(os.path.join(output_directory, retention.SEGMENTS_DIRECTORY), PARAMETERS['pmort.segment_size'], PARAMETERS['pmort.segment_duration'])
+        elif storage == 'directory':
+            self.directory = os.path.join(output_directory, snapshot_name(timestamp))
+        else:
+            raise ValueError('unknown storage: {0}'.format(storage))
+
+        self.names = []
+
+        self._lock = threading.Lock()
+        self._created = False
+        self._committed = False
+        self._linked = False
+
+    def _create(self):
+        with self._lock:
+            if not self._created:
+                logger.info('creating %s', self.directory)
+
+                if not os.path.isdir(self.directory):
+                    os.makedirs(self.directory)
+
+                self._created = True
+
+    @contextlib.contextmanager
+    def open(self, name):
+        '''Open a binary file handle for the output of the given name.
+
+        The handle can be written to in as many pieces as desired and is
+        flushed and closed when the context exits.  Output will be written to
+        (for example) /var/spool/pmort/20130123223723/collector.log (plus the
+        codec's extension if compressed).
+
+        If writing to standard output, it is held exclusively until the caller
+        is finished with it.
+
+        Arguments
+        ---------
+
+        :``name``: Name of the item whose output we're writing.
+
+        '''
+
+        logger.info('writing %s', name)
+
+        with self._lock:
+            self.names.append(name)
+
+        if self.archive is not None:
+            with tempfile.SpooledTemporaryFile(max_size = SPOOL_SIZE) as buffer_fh:
+                with compression.compressed(buffer_fh, self.codec, self.compression_level) as writer_fh:
+                    yield writer_fh
+
+                record = self.archive.append(time.mktime(self.timestamp.timetuple()) + self.timestamp.microsecond / 1e6, name, buffer_fh, self.codec)
+
+            retention.account(record.segment, archive.record_size(record))
+
+            return
+
+        if self.directory is None:
+            output_fh = getattr(sys.stdout, 'buffer', sys.stdout)
+
+            logger.info('writing to %s', sys.stdout.name)
+
+            with _stdout_lock:
+                yield output_fh
+                output_fh.flush()
+
+            return
+
+        self._create()
+
+        file_name = name + '.log'
+        if self.codec is not None:
+            file_name += self.codec.extension
+
+        with open(os.path.join(self.directory, file_name), 'wb') as output_fh:
+            logger.info('writing to %s', output_fh.name)
+
+            with compression.compressed(output_fh, self.codec, self.compression_level) as writer_fh:
+                yield writer_fh
+
+            output_fh.flush()
+
+            size = os.fstat(output_fh.fileno()).st_size
+
+        retention.account(self.directory, size)
+
+        with self._lock:
+            late = self._committed and not self._linked
+
+        if late:
+            logger.info('%s written after its snapshot was committed', name)
+
+            self._link()
+
+    def write(self, name, output):
+        '''Write the output of the given name into this snapshot.
+
+        Arguments
+        ---------
+
+        :``name``:   Name of the item whose output we're writing.
+        :``output``: Output we're writing.
+
+        '''
+
+        with self.open(name) as output_fh:
+            output_fh.write(output.encode('utf-8'))
+
+    def append_series(self, name, records):
+        '''Append the numeric fields of ``name``'s records to its time series.
+
+        Only single record outputs are kept as series (cf.
+        ``pmort.series.SeriesWriter.append_record``); nothing is appended when
+        writing to standard output.
+
+        '''
+
+        if self.output_directory.startswith('-') or len(records) != 1:
+            return
+
+        try:
+            series.get_writer(self.output_directory).append_record(name, time.mktime(self.timestamp.timetuple()) + self.timestamp.microsecond / 1e6, records[0])
+        except (IOError, OSError) as e:
+            logger.warning('could not append series of %s', name)
+            logger.exception(e)
+
+    def commit(self):
+        '''Point the current symlink at this snapshot.
+
+        The symlink is replaced atomically (a new link is renamed over the
+        old one); thus, readers never find current missing or half written.
+        Snapshots that were never written to are left alone until their first
+        (late) write; outputs are accounted to retention as they're written.
+
+        '''
+
+        if self.directory is None:
+            return
+
+        with self._lock:
+            self._committed = True
+
+            if not self._created:
+                return
+
+        self._link()
+
+    def _link(self):
+        target = os.path.join(self.output_directory, 'current')
+        temporary = '{0}.{1}.{2}'.format(target, os.getpid(), threading.get_ident())
+
+        with _link_lock:
+            # A late write must not move current back from a newer snapshot.
+            if os.path.lexists(target) and os.path.basename(os.readlink(target)) > os.path.basename(self.directory):
+                return
+
+            logger.info('%s → %s', self.directory, target)
+
+            if os.path.lexists(temporary):
+                os.remove(temporary)
+
+            os.symlink(self.directory, temporary)
+            os.rename(temporary, target)
+
+        with self._lock:
+            self._linked = True
+
+_snapshot = None
+
+def begin_snapshot(timestamp = None, snapshot = None):
+    '''Start a new cycle's snapshot and make it the current one.
+
+    Arguments
+    ---------
+
+    :``timestamp``: Time the snapshot represents.  Default: now.
+    :``snapshot``:  Snapshot (e.g. a ``pmort.ring.RingSnapshot``) to make
+                    current instead of a new ``Snapshot``.
+
+    Returns
+    -------
+
+    The new ``Snapshot``.  The caller is responsible for calling its
+    ``commit`` method once the cycle is finished.
+
+    '''
+
+    global _snapshot
+
+    if snapshot is None:
+        snapshot = Snapshot(timestamp)
+
+    _snapshot = snapshot
+
+    return _snapshot
+
+def current_snapshot():
+    '''The snapshot started by the last ``begin_snapshot`` (or None).'''
+
+    return _snapshot
+
+@contextlib.contextmanager
+def open_output(name, snapshot = None):
+    '''Open a binary file handle for the output of the given name.
+
+    Output goes to ``snapshot``, if given, or the current snapshot (cf.
+    ``begin_snapshot``).  If there is no current snapshot (e.g. a collector
+    run on its own), a snapshot is created for this output alone and
+    committed as soon as it's written.
+
+    Arguments
+    ---------
+
+    :``name``:     Name of the item whose output we're writing.
+    :``snapshot``: ``Snapshot`` to write into.  Default: current snapshot.
+
+    '''
+
+    if snapshot is None:
+        snapshot = current_snapshot()
+
+    if snapshot is None:
+        snapshot = Snapshot()
+
+        with snapshot.open(name) as output_fh:
+            yield output_fh
+
+        snapshot.commit()
+
+        return
+
+    with snapshot.open(name) as output_fh:
+        yield output_fh
+
+def write_output(name, output, snapshot = None):
     '''Write the output of the given name to the appropriate location.
 
-    Execute the following list of items around a given collection source:
+    Convenience wrapper around ``open_output`` for collectors that have their
+    entire output in hand.
 
-    * record output in logging directory
-    * flush the output from this collector
-    * create a current symlink if logging directory isn't '-'
+    Arguments
+    ---------
+
+    :``name``:     Name of the item whose output we're writing.
+    :``output``:   Output (text or bytes) we're writing.
+    :``snapshot``: ``Snapshot`` to write into.  Default: current snapshot.
+
+    '''
+
+    data = output if isinstance(output, bytes) else output.encode('utf-8')
+
+    with open_output(name, snapshot) as output_fh:
+        output_fh.write(data)
+
+    OUTPUT_BYTES.increment(len(data), collector = name)
+
+def write_records(name, records, snapshot = None):
+    '''Write structured output (records) of the given name.
+
+    The records are serialized as pmort.record_format (cf.
+    ``pmort.records.encode``) so readers don't have to parse text; numeric
+    fields are also appended to time series (cf. ``Snapshot.append_series``).
+
+    Arguments
+    ---------
+
+    :``name``:     Name of the item whose output we're writing.
+    :``records``:  Dictionary or sequence of dictionaries.
+    :``snapshot``: ``Snapshot`` to write into.  Default: current snapshot.
+
+    '''
+
+    records = records_format.normalize(records)
+
+    data = records_format.encode(records, PARAMETERS['pmort.record_format'])
+
+    with open_output(name, snapshot) as output_fh:
+        output_fh.write(data)
+
+    if snapshot is None:
+        snapshot = current_snapshot()
 
-    The directory that will be written to is configurable but the collector name
-    and current datetime are added as subdirectories to hold specific run
-    information.  Output will be written to (for example)
-    /var/spool/pmort/20130123223723/collector.log.
+    if hasattr(snapshot, 'append_series'):
+        snapshot.append_series(name, records)
+
+    OUTPUT_BYTES.increment(len(data), collector = name)
+
+def find_output(directory, name):
+    '''Path of the output of the given name in a snapshot directory.
 
     Arguments
     ---------
 
-    :``name``:   Name of the item whose output we're writing.
-    :``output``: Output we're writing.
+    :``directory``: Snapshot directory (e.g. /var/spool/pmort/current).
+    :``name``:      Name of the item whose output we're finding.
+
+    Returns
+    -------
+
+    Path to the (possibly compressed) output file or None if not found.
 
     '''
 
-    logging.info('writing %s', name)
+    path = os.path.join(directory, name + '.log')
+
+    for extension in [ '' ] + [ _.extension for _ in compression.CODECS.values() ]:
+        if os.path.exists(path + extension):
+            return path + extension
 
-    output_fh = sys.stdout
-    if not PARAMETERS['pmort.output_directory'].startswith('-'):
-        now = datetime.datetime.now()
+    return None
 
-        output_directory = os.path.join(PARAMETERS['pmort.output_directory'], now.strftime('%Y%m%d%H%M%S'))
+def read_output(directory, name):
+    '''Read the output of the given name from a snapshot directory.
 
-        if not os.access(output_directory, os.W_OK):
-            os.mkdir(output_directory)
+    Compressed output is decompressed transparently.
 
-        output_fh = open(os.path.join(output_directory, name + '.log'), 'w')
+    Arguments
+    ---------
+
+    :``directory``: Snapshot directory (e.g. /var/spool/pmort/current).
+    :``name``:      Name of the item whose output we're reading.
 
-    logger.info('writing to %s', output_fh.name)
+    Returns
+    -------
 
-    output_fh.write(output)
-    output_fh.flush()
+    Output as a string.
 
-    if output_fh != sys.stdout:
-        output_fh.close()
+    Raises
+    ------
 
-        logging.info('create current symlink')
+    IOError if there is no output of the given name.
+
+    '''
 
-        target = os.path.join(output_directory.rsplit('/', 1)[0], 'current')
-        source = output_directory
+    path = find_output(directory, name)
+
+    if path is None:
+        raise IOError('no output for {0} in {1}'.format(name, directory))
+
+    with compression.open_decompressed(path) as output_fh:
+        return output_fh.read().decode('utf-8', 'replace')
+
+def read_records(directory, name):
+    '''Read the records (cf. ``write_records``) of the given name from a
+    snapshot directory.
+
+    Returns
+    -------
+
+    List of records (dictionaries).
+
+    Raises
+    ------
+
+    IOError if there is no output of the given name; ValueError if it isn't
+    records.
+
+    '''
 
-        logging.info('%s → %s', source, target)
+    path = find_output(directory, name)
 
-        if os.access(target, os.W_OK):
-            os.remove(target)
+    if path is None:
+        raise IOError('no output for {0} in {1}'.format(name, directory))
 
-        os.symlink(source, target)
+    with compression.open_decompressed(path) as output_fh:
+        return records_format.decode(output_fh.read())
@@ -4,10 +4,11 @@
 # See COPYING or http://www.opensource.org/licenses/mit-license.php.
 
 import os
-import sys
 
 from crumbs import Parameters
 
+from pmort import information
+
 CONFIGURATION_DIRECTORY = os.path.join(os.path.sep, 'etc', 'pmort')
 
 PARAMETERS = Parameters(conflict_handler = 'resolve')
@@ -26,7 +27,7 @@ PARAMETERS.add_parameter(
         options = [ '--output-directory', '-o' ],
         group = 'pmort',
         metavar = 'DIR',
-        default = os.path.join(os.path.sep, 'var', 'spool', sys.argv[0]),
+        default = os.path.join(os.path.sep, 'var', 'spool', information.NAME),
         help = \
                 'Specifies the output directory that the collection output ' \
                 'is collected into.'
@@ -36,12 +37,80 @@ PARAMETERS.add_parameter(
         options = [ '--cache-directory' ],
         group = 'pmort',
         metavar = 'DIR',
-        default = os.path.join(os.path.sep, 'var', 'cache', sys.argv[0]),
+        default = os.path.join(os.path.sep, 'var', 'cache', information.NAME),
         help = \
                 'Specifies the output directory for any learned ' \
                 'information.  Default: %(default)s'
         )
 
+PARAMETERS.add_parameter(
+        options = [ '--compression' ],
+        group = 'pmort',
+        metavar = 'CODEC',
+        default = 'none',
+        help = \
+                'Compression applied to collection output as it is ' \
+                'written (none, gzip, bzip2, xz or, if zstandard is ' \
+                'installed, zstd).  Default: %(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--compression-level' ],
+        group = 'pmort',
+        metavar = 'LEVEL',
+        default = 0,
+        type = int,
+        help = \
+                'Compression level passed to the compression codec.  Zero ' \
+                'selects the codec\'s usual level.  Default: %(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--storage' ],
+        group = 'pmort',
+        metavar = 'BACKEND',
+        default = 'directory',
+        help = \
+                'How collection output is stored in the output directory: ' \
+                'directory (a directory per collection and a file per ' \
+                'collector) or segments (records appended to rotating ' \
+                'segment files in the segments subdirectory).  Default: ' \
+                '%(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--segment-size' ],
+        group = 'pmort',
+        metavar = 'BYTES',
+        default = 67108864,
+        type = int,
+        help = \
+                'Size in bytes after which a new segment is started (only ' \
+                'used with segments storage).  Default: %(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--segment-duration' ],
+        group = 'pmort',
+        metavar = 'SECONDS',
+        default = 3600,
+        type = int,
+        help = \
+                'Age in seconds after which a new segment is started (only ' \
+                'used with segments storage).  Default: %(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--record-format' ],
+        group = 'pmort',
+        metavar = 'FORMAT',
+        default = 'json',
+        help = \
+                'Serialization of collectors\' structured output: json ' \
+                '(one JSON object per line) or, if msgpack is installed, ' \
+                'msgpack.  Default: %(default)s'
+        )
+
 PARAMETERS.add_parameter(
         options = [ '--configuration-file-path' ],
         group = 'logging',
@@ -51,6 +120,22 @@ PARAMETERS.add_parameter(
                 'Specifies the file path for the logging configuration file. ' \
         )
 
-PARAMETERS.parse(only_known = True)
+def early_parameter(name):
+    '''Value of the parameter ``name`` before ``PARAMETERS.parse``.
+
+    The command line is parsed for the parameters added so far; thus, this
+    finds the parameters deciding what else to import (e.g. the collectors
+    directory) without the (slow) unparsed lookup.
+
+    '''
+
+    PARAMETERS.parse(only_known = True)
+
+    parsed, PARAMETERS.parsed = PARAMETERS.parsed, True
+
+    try:
+        return PARAMETERS[name]
+    finally:
+        PARAMETERS.parsed = parsed
 
-PARAMETERS.add_configuration_file(PARAMETERS['pmort.configuration_file_path'])
+PARAMETERS.add_configuration_file(early_parameter('pmort.configuration_file_path'))
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import logging
+import os
+import platform
+import threading
+import ctypes
+import ctypes.util
+
+logger = logging.getLogger(__name__)
+
+IOPRIO_CLASS_NONE = 0
+IOPRIO_CLASS_RT = 1
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_IDLE = 3
+
+IOPRIO_WHO_PROCESS = 1
+
+IOPRIO_CLASS_SHIFT = 13
+
+SYS_IOPRIO_SET = {
+        'x86_64': 251,
+        'i386': 289,
+        'i686': 289,
+        'aarch64': 30,
+        'armv7l': 314,
+        'ppc64': 273,
+        'ppc64le': 273,
+        's390x': 282,
+        }
+
+SYS_IOPRIO_GET = {
+        'x86_64': 252,
+        'i386': 290,
+        'i686': 290,
+        'aarch64': 31,
+        'armv7l': 315,
+        'ppc64': 274,
+        'ppc64le': 274,
+        's390x': 283,
+        }
+
+_libc = None
+
+def _syscall(numbers, *args):
+    global _libc
+
+    number = numbers.get(platform.machine())
+
+    if number is None:
+        raise OSError('ioprio not supported on {0}'.format(platform.machine()))
+
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+
+    result = _libc.syscall(number, *args)
+
+    if result < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+    return result
+
+def set_io_priority(ioprio_class, level = 0, tid = 0):
+    '''Set the I/O scheduling class and level of a thread (ionice).
+
+    Arguments
+    ---------
+
+    :``ioprio_class``: One of the IOPRIO_CLASS_* constants.
+    :``level``:        Priority within the class (0 highest, 7 lowest).
+    :``tid``:          Thread (or process) ID; zero for the calling thread.
+
+    Returns
+    -------
+
+    True if the priority was set; otherwise, False (logged).
+
+    '''
+
+    try:
+        _syscall(SYS_IOPRIO_SET, IOPRIO_WHO_PROCESS, tid, ( ioprio_class << IOPRIO_CLASS_SHIFT ) | level)
+    except (OSError, AttributeError) as e:
+        logger.warning('could not set I/O priority')
+        logger.exception(e)
+
+        return False
+
+    logger.info('I/O priority: class %s level %s', ioprio_class, level)
+
+    return True
+
+def get_io_priority(tid = 0):
+    '''I/O scheduling class and level of a thread as a tuple (or None).'''
+
+    try:
+        _ = _syscall(SYS_IOPRIO_GET, IOPRIO_WHO_PROCESS, tid)
+    except (OSError, AttributeError) as e:
+        logger.info('could not get I/O priority: %s', e)
+
+        return None
+
+    return ( _ >> IOPRIO_CLASS_SHIFT, _ & ( ( 1 << IOPRIO_CLASS_SHIFT ) - 1 ) )
+
+def set_thread_nice(value):
+    '''Set the nice value of the calling thread only (Linux).
+
+    Linux schedules threads individually; thus, setting the priority of the
+    thread's own ID leaves the rest of the process alone.  Threads without an
+    explicit I/O priority also derive their best effort I/O level from this.
+
+    Returns
+    -------
+
+    True if the nice value was set; otherwise, False (logged).
+
+    '''
+
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), value)
+    except (OSError, AttributeError) as e:
+        logger.warning('could not set nice value')
+        logger.exception(e)
+
+        return False
+
+    return True
+
+def _thread_ids():
+    try:
+        return [ int(_) for _ in os.listdir('/proc/self/task') ]
+    except OSError:
+        return [ threading.get_native_id() ]
+
+def lower_priority(nice = 19, ioprio_class = IOPRIO_CLASS_IDLE):
+    '''Lower the CPU and I/O priority of every thread of the process.
+
+    Threads started afterwards inherit the priority of the thread starting
+    them.
+
+    Returns
+    -------
+
+    Dictionary of the previous priorities ({tid: ( nice, io priority )})
+    for ``restore_priority``.
+
+    '''
+
+    previous = {}
+
+    for tid in _thread_ids():
+        try:
+            previous[tid] = ( os.getpriority(os.PRIO_PROCESS, tid), get_io_priority(tid) )
+
+            os.setpriority(os.PRIO_PROCESS, tid, max(nice, previous[tid][0]))
+        except (OSError, AttributeError) as e:
+            logger.info('could not lower priority of thread %s: %s', tid, e)
+
+            continue
+
+        set_io_priority(ioprio_class, tid = tid)
+
+    return previous
+
+def restore_priority(previous):
+    '''Restore priorities returned by ``lower_priority``.
+
+    Raising priorities again requires privileges (CAP_SYS_NICE); failures
+    are logged.  Threads that exited are skipped.
+
+    '''
+
+    for tid, ( nice, io_priority ) in previous.items():
+        try:
+            os.setpriority(os.PRIO_PROCESS, tid, nice)
+        except ProcessLookupError:
+            continue
+        except (OSError, AttributeError) as e:
+            logger.warning('could not restore nice value of thread %s: %s', tid, e)
+
+        if io_priority is not None:
+            set_io_priority(io_priority[0], io_priority[1], tid)
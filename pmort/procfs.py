@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+PROC = '/proc'
+
+class ProcFile(object):
+    '''A /proc file kept open and re-read from its start on every ``read``.
+
+    Opening a file is a path lookup, a permission check and a file descriptor
+    allocation; seeking an open /proc file back to zero regenerates its
+    contents without any of that.  The file is (re)opened on the first read
+    and after a failed one.
+
+    Arguments
+    ---------
+
+    :``path``: Path of the file.
+
+    '''
+
+    def __init__(self, path):
+        self.path = path
+
+        self._fh = None
+        self._lock = threading.Lock()
+
+    def read(self):
+        '''Current contents of the file as a string.'''
+
+        with self._lock:
+            if self._fh is None:
+                self._fh = open(self.path, 'rb', 0)
+
+            try:
+                self._fh.seek(0)
+
+                return self._fh.read().decode('utf-8', 'replace')
+            except (IOError, OSError):
+                self._close()
+                raise
+
+    def fstat(self):
+        '''``os.fstat`` of the open file (opening it if necessary).'''
+
+        with self._lock:
+            if self._fh is None:
+                self._fh = open(self.path, 'rb', 0)
+
+            return os.fstat(self._fh.fileno())
+
+    def _close(self):
+        if self._fh is not None:
+            self._fh.close()
+
+        self._fh = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+def parse_meminfo(text):
+    '''/proc/meminfo as {field: KiB}.'''
+
+    meminfo = {}
+
+    for line in text.splitlines():
+        name, _, value = line.partition(':')
+
+        _ = value.split()
+        if len(_):
+            meminfo[name.strip()] = int(_[0])
+
+    return meminfo
+
+def parse_stat(text):
+    '''/proc/stat as {field: [ int, … ]} (cpu lines are keyed by cpu name).'''
+
+    stat = {}
+
+    for line in text.splitlines():
+        _ = line.split()
+
+        if len(_) > 1:
+            try:
+                stat[_[0]] = [ int(value) for value in _[1:] ]
+            except ValueError:
+                pass
+
+    return stat
+
+def parse_vmstat(text):
+    '''/proc/vmstat as {field: int}.'''
+
+    return dict([ ( _[0], int(_[1]) ) for _ in [ line.split() for line in text.splitlines() ] if len(_) == 2 ])
+
+def parse_diskstats(text):
+    '''/proc/diskstats as {device: [ int, … ]} of the fields after the name.'''
+
+    diskstats = {}
+
+    for line in text.splitlines():
+        _ = line.split()
+
+        if len(_) >= 14:
+            diskstats[_[2]] = [ int(value) for value in _[3:] ]
+
+    return diskstats
+
+def parse_net_dev(text):
+    '''/proc/net/dev as {interface: [ int, … ]} (eight receive then transmit).'''
+
+    interfaces = {}
+
+    for line in text.splitlines()[2:]:
+        name, _, values = line.partition(':')
+
+        interfaces[name.strip()] = [ int(_) for _ in values.split() ]
+
+    return interfaces
+
+def parse_net_snmp(text):
+    '''/proc/net/snmp (or netstat) as [ ( protocol, [ ( name, value ), … ] ) ].
+
+    These files pair a line of field names with a line of values for every
+    protocol.
+
+    '''
+
+    protocols = []
+
+    lines = text.splitlines()
+
+    for names, values in zip(lines[::2], lines[1::2]):
+        protocol, _, names = names.partition(':')
+        values = values.partition(':')[2]
+
+        protocols.append(( protocol, list(zip(names.split(), values.split())) ))
+
+    return protocols
+
+def parse_pressure(text):
+    '''/proc/pressure/* as {'some': {field: float}, 'full': {…}}.'''
+
+    pressure = {}
+
+    for line in text.splitlines():
+        _ = line.split()
+
+        if len(_):
+            pressure[_[0]] = dict([ ( key, float(value) ) for key, _, value in [ field.partition('=') for field in _[1:] ] ])
+
+    return pressure
+
+def parse_io(text):
+    '''/proc/<pid>/io as {field: int}.'''
+
+    return dict([ ( name.strip(), int(value) ) for name, _, value in [ line.partition(':') for line in text.splitlines() ] if len(value.strip()) ])
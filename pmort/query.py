@@ -0,0 +1,470 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import argparse
+import datetime
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+from pmort.parameters import PARAMETERS
+from pmort import archive
+from pmort import compression
+from pmort import delta
+from pmort import records as records_format
+from pmort import retention
+from pmort import series
+from pmort.output import snapshot_time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS samples (
+    timestamp REAL NOT NULL,
+    name TEXT NOT NULL,
+    source TEXT NOT NULL,
+    path TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS samples_timestamp ON samples (timestamp);
+CREATE INDEX IF NOT EXISTS samples_name_timestamp ON samples (name, timestamp);
+CREATE INDEX IF NOT EXISTS samples_source ON samples (source);
+CREATE TABLE IF NOT EXISTS sources (
+    source TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+'''
+
+class SpoolIndex(object):
+    '''Persistent index of the samples in an output directory.
+
+    Every sample (one collector's output from one collection) is recorded
+    with its time, collector name and location: a file in a snapshot
+    directory or a record in a segment (cf. ``pmort.archive``).  The index
+    lives in an SQLite database so time range queries don't touch the spool
+    at all.
+
+    ``update`` brings the index up to date incrementally: snapshot
+    directories already indexed are skipped (except the newest, which may
+    still have been written to), segment indexes are read from where the
+    last update stopped, and samples of evicted directories and segments are
+    dropped.
+
+    Arguments
+    ---------
+
+    :``output_directory``: Directory holding the collections.
+    :``index_path``:       Path of the SQLite database.
+
+    '''
+
+    def __init__(self, output_directory, index_path):
+        self.output_directory = output_directory
+        self.index_path = index_path
+
+        _ = os.path.dirname(index_path)
+        if len(_) and not os.path.isdir(_):
+            os.makedirs(_)
+
+        self.connection = sqlite3.connect(index_path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def update(self):
+        '''Index samples added to (and drop those removed from) the spool.'''
+
+        logger.info('updating index of %s', self.output_directory)
+
+        with self.connection:
+            sources = dict(self.connection.execute('SELECT source, position FROM sources'))
+            found = set()
+
+            newest = max([ _ for _ in sources.keys() if not _.endswith(archive.SEGMENT_EXTENSION) ] or [ '' ])
+
+            for path in retention.spool_entries(self.output_directory):
+                found.add(path)
+
+                if path.endswith(archive.SEGMENT_EXTENSION):
+                    self._update_segment(path, sources.get(path, 0))
+                elif path not in sources or path >= newest:
+                    self._update_directory(path, path in sources)
+
+            for source in set(sources.keys()) - found:
+                logger.info('dropping %s from index', source)
+
+                self.connection.execute('DELETE FROM samples WHERE source = ?', ( source, ))
+                self.connection.execute('DELETE FROM sources WHERE source = ?', ( source, ))
+
+    def _update_directory(self, directory, indexed):
+        logger.debug('indexing %s', directory)
+
+        if indexed:
+            self.connection.execute('DELETE FROM samples WHERE source = ?', ( directory, ))
+
+        _ = snapshot_time(os.path.basename(directory))
+
+        timestamp = time.mktime(_.timetuple()) + _.microsecond / 1e6
+
+        rows = []
+
+        for filename in os.listdir(directory):
+            name = filename
+
+            _ = compression.codec_for(name)
+            if _ is not None:
+                name = name[:-len(_.extension)]
+
+            if not name.endswith('.log'):
+                continue
+
+            path = os.path.join(directory, filename)
+
+            rows.append(( timestamp, name[:-len('.log')], directory, path, 0, os.path.getsize(path) ))
+
+        self.connection.executemany('INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?)', rows)
+        self.connection.execute('INSERT OR REPLACE INTO sources VALUES (?, ?)', ( directory, 0 ))
+
+    def _update_segment(self, segment, position):
+        index = segment[:-len(archive.SEGMENT_EXTENSION)] + archive.INDEX_EXTENSION
+
+        if not os.path.exists(index) or os.path.getsize(index) == position:
+            return
+
+        logger.debug('indexing %s from %s', segment, position)
+
+        rows = []
+
+        with open(index, 'r') as index_fh:
+            index_fh.seek(position)
+
+            while True:
+                line = index_fh.readline()
+
+                if not line.endswith('\n'):
+                    break
+
+                _ = line.rstrip('\n').split('\t', 3)
+
+                if len(_) == 4:
+                    rows.append(( float(_[0]), _[3], segment, segment, int(_[1]), int(_[2]) ))
+
+                position = index_fh.tell()
+
+        self.connection.executemany('INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?)', rows)
+        self.connection.execute('INSERT OR REPLACE INTO sources VALUES (?, ?)', ( segment, position ))
+
+    def names(self):
+        '''Names of all indexed collectors.'''
+
+        return [ _[0] for _ in self.connection.execute('SELECT DISTINCT name FROM samples ORDER BY name') ]
+
+    def samples(self, start = None, end = None, names = None):
+        '''Samples between ``start`` and ``end`` (seconds since the epoch).
+
+        Arguments
+        ---------
+
+        :``start``: Earliest time included; None for no limit.
+        :``end``:   Latest time included; None for no limit.
+        :``names``: Collector names included; None for all.
+
+        Returns
+        -------
+
+        List of ``pmort.archive.Record`` ordered by time and name; records in
+        snapshot directories have an offset of zero and their file as
+        segment.
+
+        '''
+
+        query = 'SELECT timestamp, name, path, offset, length FROM samples WHERE 1'
+        parameters = []
+
+        if start is not None:
+            query += ' AND timestamp >= ?'
+            parameters.append(start)
+
+        if end is not None:
+            query += ' AND timestamp <= ?'
+            parameters.append(end)
+
+        if names:
+            query += ' AND name IN ({0})'.format(', '.join([ '?' ] * len(names)))
+            parameters.extend(names)
+
+        query += ' ORDER BY timestamp, name'
+
+        return [ archive.Record(*_) for _ in self.connection.execute(query, parameters) ]
+
+    def cycle_size(self):
+        '''Average bytes of all samples taken at one time (None if empty).'''
+
+        total, cycles = self.connection.execute('SELECT SUM(length), COUNT(DISTINCT timestamp) FROM samples').fetchone()
+
+        return total // cycles if cycles else None
+
+def read_sample(record):
+    '''Output (bytes) of a sample returned by ``SpoolIndex.samples``.'''
+
+    if record.segment.endswith(archive.SEGMENT_EXTENSION):
+        return archive.read_record(record)
+
+    with compression.open_decompressed(record.segment) as output_fh:
+        return output_fh.read()
+
+def read_samples(index, records):
+    '''Output of each of ``records`` with delta encoded tables reconstructed.
+
+    Delta encoded samples (cf. ``pmort.delta``) only hold the differences
+    from the sample before; thus, each collector's earlier samples are read
+    back to its latest keyframe (even if it's before the first of
+    ``records``) and decoded forward.  Reconstructed tables are rendered as
+    aligned text and structured samples (cf. ``pmort.records``) as one JSON
+    object per line.
+
+    Arguments
+    ---------
+
+    :``index``:   ``SpoolIndex`` ``records`` came from.
+    :``records``: Records ordered by time (as ``SpoolIndex.samples``
+                  returns).
+
+    Returns
+    -------
+
+    Generator of ( record, bytes ) pairs; samples that can't be read or
+    reconstructed (because a sample before them is missing) are left out
+    (logged).
+
+    '''
+
+    decoders = {}
+
+    for record in records:
+        try:
+            output = read_sample(record)
+        except (IOError, OSError, archive.ArchiveError) as e:
+            logger.warning('could not read %s at %s', record.name, record.timestamp)
+            logger.exception(e)
+
+            decoders.pop(record.name, None)
+
+            continue
+
+        if records_format.is_records(output):
+            try:
+                yield record, records_format.render(records_format.decode(output)).encode('utf-8')
+            except ValueError as e:
+                logger.warning('could not decode %s at %s: %s', record.name, record.timestamp, e)
+
+            continue
+
+        if not delta.is_encoded(output):
+            yield record, output
+            continue
+
+        decoder = decoders.get(record.name)
+
+        if decoder is None:
+            decoder = decoders[record.name] = delta.DeltaDecoder()
+
+            earlier = []
+
+            for _ in reversed(index.samples(end = record.timestamp, names = [ record.name ])):
+                if _ == record:
+                    continue
+
+                try:
+                    _ = read_sample(_)
+                except (IOError, OSError, archive.ArchiveError):
+                    break
+
+                if not delta.is_encoded(_):
+                    break
+
+                earlier.append(_)
+
+                if _.split(b'\t', 2)[1:2] == [ delta.KEYFRAME.encode('utf-8') ]:
+                    break
+
+            for _ in reversed(earlier):
+                decoder.decode(_)
+
+        rows = decoder.decode(output)
+
+        if rows is None:
+            logger.warning('could not reconstruct %s at %s', record.name, record.timestamp)
+            continue
+
+        yield record, delta.render(decoder.fields, rows).encode('utf-8')
+
+TIME_FORMATS = (
+        '%Y%m%d%H%M%S',
+        '%Y-%m-%d %H:%M:%S',
+        '%Y-%m-%d %H:%M',
+        '%Y-%m-%dT%H:%M:%S',
+        '%Y-%m-%dT%H:%M',
+        '%Y-%m-%d',
+        )
+
+CLOCK_FORMATS = (
+        '%H:%M:%S',
+        '%H:%M',
+        )
+
+def parse_time(value, now = None):
+    '''Seconds since the epoch of a (local) time given on the command line.
+
+    Accepts full timestamps (e.g. 20130123223723 or 2013-01-23 22:37) or a
+    time of day (e.g. 03:10), which is taken to be today.
+
+    Raises
+    ------
+
+    ValueError if ``value`` isn't in a known format.
+
+    '''
+
+    if now is None:
+        now = datetime.datetime.now()
+
+    for _ in TIME_FORMATS:
+        try:
+            return time.mktime(datetime.datetime.strptime(value, _).timetuple())
+        except ValueError:
+            pass
+
+    for _ in CLOCK_FORMATS:
+        try:
+            clock = datetime.datetime.strptime(value, _)
+        except ValueError:
+            continue
+
+        return time.mktime(now.replace(hour = clock.hour, minute = clock.minute, second = clock.second, microsecond = 0).timetuple())
+
+    raise ValueError('unknown time format: {0}'.format(value))
+
+def _format_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+def show_series(metrics, start, end, list_only = False):
+    '''Write the samples of ``metrics`` (cf. ``pmort.series``) to standard
+    output as tab separated time, metric and value lines.
+
+    Returns
+    -------
+
+    0 on success; otherwise, 1.
+
+    '''
+
+    if list_only:
+        sys.stdout.write(''.join([ _ + '\n' for _ in series.metrics(PARAMETERS['pmort.output_directory']) ]))
+
+        return 0
+
+    for metric in metrics:
+        try:
+            timestamps, values = series.read_series(PARAMETERS['pmort.output_directory'], metric, start, end)
+        except (IOError, OSError, ValueError) as e:
+            sys.stderr.write('pmort-query: {0}\n'.format(e))
+
+            return 1
+
+        sys.stdout.write(''.join([ '{0}\t{1}\t{2}\n'.format(_format_time(timestamp), metric, value) for timestamp, value in zip(timestamps, values) ]))
+
+    return 0
+
+def main():
+    '''Query the output directory for samples in a time range.
+
+    Returns
+    -------
+
+    0 on success; otherwise, 1.
+
+    '''
+
+    parser = argparse.ArgumentParser(
+            prog = 'pmort-query',
+            description = 'Show collected output between two times.  Other ' \
+                    'pmort options (e.g. -o) select the output directory.'
+            )
+    parser.add_argument(
+            '--start', '-s',
+            metavar = 'TIME',
+            help = 'Earliest time shown (e.g. 03:10 or 2013-01-23 03:10)'
+            )
+    parser.add_argument(
+            '--end', '-e',
+            metavar = 'TIME',
+            help = 'Latest time shown (e.g. 03:25 or 2013-01-23 03:25)'
+            )
+    parser.add_argument(
+            '--name', '-n',
+            metavar = 'COLLECTOR',
+            action = 'append',
+            help = 'Collector whose output is shown (may be repeated)'
+            )
+    parser.add_argument(
+            '--list', '-l',
+            action = 'store_true',
+            help = 'Only list the matching samples'
+            )
+    parser.add_argument(
+            '--series',
+            metavar = 'METRIC',
+            action = 'append',
+            help = 'Time series shown instead of samples (e.g. ' \
+                    'load_average.load1; may be repeated); with --list, ' \
+                    'the available series are listed'
+            )
+    parser.add_argument(
+            '--index',
+            metavar = 'FILE',
+            default = os.path.join(PARAMETERS['pmort.cache_directory'], 'index.sqlite'),
+            help = 'Index database.  Default: %(default)s'
+            )
+    arguments, _ = parser.parse_known_args()
+
+    try:
+        start = arguments.start and parse_time(arguments.start)
+        end = arguments.end and parse_time(arguments.end)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if arguments.series is not None:
+        return show_series(arguments.series, start, end, arguments.list)
+
+    index = SpoolIndex(PARAMETERS['pmort.output_directory'], arguments.index)
+
+    try:
+        index.update()
+
+        output_fh = getattr(sys.stdout, 'buffer', sys.stdout)
+
+        records = index.samples(start, end, arguments.name)
+
+        if arguments.list:
+            for record in records:
+                output_fh.write('{0} {1}\n'.format(_format_time(record.timestamp), record.name).encode('utf-8'))
+
+            return 0
+
+        for record, output in read_samples(index, records):
+            output_fh.write('==> {0} {1} <==\n'.format(_format_time(record.timestamp), record.name).encode('utf-8'))
+            output_fh.write(output)
+            output_fh.write(b'\n')
+    finally:
+        index.close()
+
+    return 0
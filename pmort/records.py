@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import io
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+except ImportError:
+    logger.info('could not load msgpack—msgpack records unavailable')
+
+    msgpack = None
+
+MAGIC = '#pmort-records'
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+
+def is_records(output):
+    '''True if ``output`` (bytes or string) was written by ``encode``.'''
+
+    if isinstance(output, bytes):
+        return output.startswith(MAGIC.encode('utf-8'))
+
+    return output.startswith(MAGIC)
+
+def is_structured(output):
+    '''True if a collector's return value is records rather than text.
+
+    A dictionary is a single record; a list or tuple is a sequence of them.
+
+    '''
+
+    return isinstance(output, ( dict, list, tuple ))
+
+def normalize(output):
+    '''List of records from a collector's structured return value.'''
+
+    if isinstance(output, dict):
+        return [ output ]
+
+    return list(output)
+
+def encode(records, format = JSON):
+    '''Serialize ``records`` (dictionaries) with a self-describing header.
+
+    ::
+
+        #pmort-records	json
+        {"load1":0.1,"load15":0.3,"load5":0.2}
+
+    JSON records are one compact object per line; msgpack records are packed
+    one after another.  Values that can't be serialized are written as
+    strings.  If msgpack isn't installed, JSON is written instead.
+
+    Returns
+    -------
+
+    Bytes of the encoded records.
+
+    '''
+
+    if format == MSGPACK and msgpack is None:
+        logger.warning('msgpack is not installed: writing json records')
+
+        format = JSON
+
+    header = '{0}\t{1}\n'.format(MAGIC, format).encode('utf-8')
+
+    if format == MSGPACK:
+        return header + b''.join([ msgpack.packb(_, default = str, use_bin_type = True) for _ in records ])
+
+    if format != JSON:
+        raise ValueError('unknown record format: {0}'.format(format))
+
+    return header + ''.join([ json.dumps(_, default = str, sort_keys = True, separators = ( ',', ':' )) + '\n' for _ in records ]).encode('utf-8')
+
+def decode(output):
+    '''Records (list of dictionaries) from the output of ``encode``.
+
+    Raises
+    ------
+
+    ValueError if ``output`` isn't encoded records (or uses a format that
+    can't be read here).
+
+    '''
+
+    if isinstance(output, str):
+        output = output.encode('utf-8')
+
+    if not is_records(output):
+        raise ValueError('not pmort records')
+
+    header, _, body = output.partition(b'\n')
+
+    format = header.decode('utf-8').partition('\t')[2].strip()
+
+    if format == JSON:
+        return [ json.loads(line) for line in body.decode('utf-8').splitlines() if len(line.strip()) ]
+
+    if format == MSGPACK:
+        if msgpack is None:
+            raise ValueError('msgpack records require msgpack')
+
+        return list(msgpack.Unpacker(io.BytesIO(body), raw = False))
+
+    raise ValueError('unknown record format: {0}'.format(format))
+
+def render(records):
+    '''Records as text (one JSON object per line) for display.'''
+
+    return ''.join([ json.dumps(_, default = str, sort_keys = True) + '\n' for _ in records ])
@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import argparse
+import bisect
+import collections
+import csv
+import inspect
+import logging
+import os
+import sys
+
+from pmort.parameters import PARAMETERS
+from pmort.learners import LEARNERS
+from pmort import archive
+from pmort import query
+from pmort import records
+
+logger = logging.getLogger(__name__)
+
+# Pressure signals (cf. ``pmort.learners.pressure.PressureLearner``) a trace
+# may carry besides the load averages.
+SIGNALS = ( 'cpu', 'memory', 'io', 'available', 'swap', 'queue' )
+
+DEFAULT_SAMPLE_SIZE = 65536
+
+TraceRow = collections.namedtuple('TraceRow', [ 'time', 'loads', 'signals', 'incident' ])
+
+Incident = collections.namedtuple('Incident', [ 'start', 'end' ])
+
+Result = collections.namedtuple('Result', [ 'learner', 'samples', 'bytes', 'incidents', 'caught', 'flagged', 'delays' ])
+
+class Trace(object):
+    '''Recorded system behaviour a learner can be replayed against.
+
+    Arguments
+    ---------
+
+    :``rows``: ``TraceRow`` tuples: time (seconds), loads (one, five and
+               fifteen minute load averages), signals ({name: fraction} of
+               ``SIGNALS``) and incident (True, False or None if unknown).
+
+    '''
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key = lambda _: _.time)
+        self.times = [ _.time for _ in self.rows ]
+
+        self.now = self.times[0] if len(self.times) else 0.0
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def start(self):
+        return self.times[0]
+
+    @property
+    def end(self):
+        return self.times[-1]
+
+    def at(self, timestamp):
+        '''Row in effect at ``timestamp`` (the last one not after it).'''
+
+        return self.rows[max(bisect.bisect_right(self.times, timestamp) - 1, 0)]
+
+    def clock(self):
+        '''Simulated time (the time of the replay).'''
+
+        return self.now
+
+    def loadavg(self):
+        '''Load averages at the simulated time (cf. ``os.getloadavg``).'''
+
+        return self.at(self.now).loads
+
+    def signals(self):
+        '''Pressure signals at the simulated time (cf. ``PressureLearner.measure``).'''
+
+        return dict(self.at(self.now).signals)
+
+    def incidents(self, load_threshold):
+        '''Incidents in the trace.
+
+        Consecutive rows marked as incidents (or, for rows without a mark,
+        with a one minute load above ``load_threshold``) form one incident
+        lasting until the next row that isn't one.
+
+        Returns
+        -------
+
+        List of ``Incident``.
+
+        '''
+
+        incidents = []
+        start = None
+
+        for row in self.rows:
+            incident = row.incident if row.incident is not None else row.loads[0] > load_threshold
+
+            if incident and start is None:
+                start = row.time
+            elif not incident and start is not None:
+                incidents.append(Incident(start, row.time))
+
+                start = None
+
+        if start is not None:
+            incidents.append(Incident(start, self.end))
+
+        return incidents
+
+def _number(value):
+    value = ( value or '' ).strip()
+
+    return float(value) if len(value) else None
+
+def read_csv(csv_fh):
+    '''Trace from CSV with a header row.
+
+    Columns (all but time and load1 optional):
+
+    :time:               Seconds (e.g. since the epoch).
+    :load1, load5, load15: Load averages; missing ones repeat load1.
+    :cpu … queue:        Pressure signals (cf. ``SIGNALS``) as fractions.
+    :incident:           1 while an incident is ongoing; otherwise, 0.
+
+    Raises
+    ------
+
+    ValueError if a required column or a row's time or load1 is missing or
+    a value isn't a number.
+
+    '''
+
+    reader = csv.DictReader(csv_fh)
+
+    if not { 'time', 'load1' }.issubset(reader.fieldnames or []):
+        raise ValueError('trace requires time and load1 columns')
+
+    rows = []
+
+    for number, line in enumerate(reader, 1):
+        timestamp = _number(line['time'])
+
+        if timestamp is None:
+            raise ValueError('row {0}: missing time'.format(number))
+
+        load1 = _number(line['load1'])
+
+        if load1 is None:
+            raise ValueError('row {0}: missing load1'.format(number))
+        load5 = _number(line.get('load5'))
+        load15 = _number(line.get('load15'))
+
+        signals = dict([ ( name, _number(line[name]) ) for name in SIGNALS if _number(line.get(name)) is not None ])
+
+        incident = _number(line.get('incident'))
+
+        rows.append(TraceRow(
+            timestamp,
+            ( load1, load1 if load5 is None else load5, load1 if load15 is None else load15 ),
+            signals,
+            None if incident is None else bool(incident),
+            ))
+
+    return Trace(rows)
+
+def read_spool(index):
+    '''Trace from the load_average samples in a ``pmort.query.SpoolIndex``.
+
+    Both records (cf. ``pmort.records``) and the older "L1, L5, L15" text
+    are read.
+
+    '''
+
+    rows = []
+
+    for record in index.samples(names = [ 'load_average' ]):
+        try:
+            output = query.read_sample(record)
+
+            if records.is_records(output):
+                _ = records.decode(output)[0]
+                loads = ( _['load1'], _['load5'], _['load15'] )
+            else:
+                loads = tuple([ float(_) for _ in output.decode('utf-8').split(',') ])
+        except (IOError, OSError, ValueError, KeyError, IndexError, archive.ArchiveError) as e:
+            logger.warning('skipping load_average at %s: %s', record.timestamp, e)
+
+            continue
+
+        rows.append(TraceRow(record.timestamp, loads, {}, None))
+
+    return Trace(rows)
+
+def create_learner(name, trace):
+    '''New learner of the same kind as ``LEARNERS[name]`` reading ``trace``.
+
+    The learner gets whichever of the trace's clock, load averages and
+    signals its constructor accepts and doesn't touch the cache directory.
+
+    '''
+
+    sources = {
+            'clock': trace.clock,
+            'loadavg': trace.loadavg,
+            'signals': trace.signals,
+            'persistent': False,
+            }
+
+    learner_class = type(LEARNERS[name])
+
+    arguments = inspect.signature(learner_class.__init__).parameters
+
+    return learner_class(**dict([ ( key, value ) for key, value in sources.items() if key in arguments ]))
+
+def replay(name, trace, incidents, sample_size):
+    '''Replay ``trace`` through a new learner ``name`` (in simulated time).
+
+    Collections happen at the start of the trace and then whenever the
+    learner's interval has passed; at each one, the learner's ``anomalous``
+    (if it has one) is consulted as the anomaly trigger would.
+
+    Arguments
+    ---------
+
+    :``name``:        Key of the learner in ``LEARNERS``.
+    :``trace``:       ``Trace`` replayed.
+    :``incidents``:   ``Incident`` list (cf. ``Trace.incidents``).
+    :``sample_size``: Bytes written by one collection.
+
+    Returns
+    -------
+
+    ``Result`` with the number of collections, the bytes they wrote, the
+    number of incidents with a collection during them (caught) and with an
+    anomaly reported during them (flagged), and the seconds from the start
+    of each caught incident to its first collection (delays).
+
+    '''
+
+    learner = create_learner(name, trace)
+
+    samples = []
+    anomalies = []
+
+    trace.now = trace.start
+
+    while trace.now <= trace.end:
+        interval = learner.time()
+
+        samples.append(trace.now)
+
+        if getattr(learner, 'anomalous', lambda: False)():
+            anomalies.append(trace.now)
+
+        trace.now += max(interval, PARAMETERS['learner.minimum_interval'], 0.001)
+
+    delays = []
+    flagged = 0
+
+    for incident in incidents:
+        _ = samples[bisect.bisect_left(samples, incident.start):bisect.bisect_right(samples, incident.end)]
+
+        if len(_):
+            delays.append(_[0] - incident.start)
+
+        if bisect.bisect_right(anomalies, incident.end) > bisect.bisect_left(anomalies, incident.start):
+            flagged += 1
+
+    return Result(name, len(samples), len(samples) * sample_size, len(incidents), len(delays), flagged, delays)
+
+def format_results(results):
+    '''Table of ``Result`` tuples (one line per learner).'''
+
+    lines = [ ( 'LEARNER', 'SAMPLES', 'BYTES', 'INCIDENTS', 'CAUGHT', 'FLAGGED', 'MEAN DELAY', 'MAX DELAY' ) ]
+
+    for result in results:
+        lines.append((
+            result.learner,
+            str(result.samples),
+            str(result.bytes),
+            str(result.incidents),
+            str(result.caught),
+            str(result.flagged),
+            '{0:.1f}'.format(sum(result.delays) / len(result.delays)) if len(result.delays) else '-',
+            '{0:.1f}'.format(max(result.delays)) if len(result.delays) else '-',
+            ))
+
+    widths = [ max([ len(line[column]) for line in lines ]) for column in range(len(lines[0])) ]
+
+    return '\n'.join([ ' '.join([ line[0].ljust(widths[0]) ] + [ _.rjust(width) for _, width in zip(line[1:], widths[1:]) ]) for line in lines ])
+
+def main():
+    '''Replay a recorded trace through the learners and compare them.
+
+    Returns
+    -------
+
+    0 on success; otherwise, 1.
+
+    '''
+
+    parser = argparse.ArgumentParser(
+            prog = 'pmort-replay',
+            description = 'Replay load (and pressure) traces through the ' \
+                    'learners in simulated time and report how many ' \
+                    'collections each would make and how soon each caught ' \
+                    'the incidents in the trace.  Without --csv, the ' \
+                    'load_average samples in the output directory are ' \
+                    'replayed.  Other pmort options (e.g. ' \
+                    '--learner-minimum-interval) apply.'
+            )
+    parser.add_argument(
+            '--csv',
+            metavar = 'FILE',
+            help = 'Trace with time and load1 (optionally load5, load15, ' \
+                    'cpu, memory, io, available, swap, queue and incident) ' \
+                    'columns'
+            )
+    parser.add_argument(
+            '--learner', '-L',
+            metavar = 'LEARNER',
+            action = 'append',
+            help = 'Learner replayed (may be repeated).  Default: all'
+            )
+    parser.add_argument(
+            '--sample-size',
+            metavar = 'BYTES',
+            type = int,
+            help = 'Bytes written per collection.  Default: the average of ' \
+                    'the output directory or {0}'.format(DEFAULT_SAMPLE_SIZE)
+            )
+    parser.add_argument(
+            '--incident-load',
+            metavar = 'LOAD',
+            type = float,
+            default = 2.0 * ( os.cpu_count() or 1 ),
+            help = 'One minute load above which an unmarked row is part ' \
+                    'of an incident.  Default: %(default)s'
+            )
+    parser.add_argument(
+            '--index',
+            metavar = 'FILE',
+            default = os.path.join(PARAMETERS['pmort.cache_directory'], 'index.sqlite'),
+            help = 'Index database.  Default: %(default)s'
+            )
+    arguments, sys.argv[1:] = parser.parse_known_args()
+
+    PARAMETERS.parse() # the remaining (pmort) options; avoids slow unparsed lookups
+
+    names = arguments.learner or sorted(LEARNERS.keys())
+
+    for name in names:
+        if name not in LEARNERS:
+            parser.error('unknown learner: {0}'.format(name))
+
+    sample_size = arguments.sample_size
+
+    try:
+        if arguments.csv is not None:
+            with open(arguments.csv, 'r') as csv_fh:
+                trace = read_csv(csv_fh)
+        else:
+            index = query.SpoolIndex(PARAMETERS['pmort.output_directory'], arguments.index)
+
+            try:
+                index.update()
+
+                trace = read_spool(index)
+
+                if sample_size is None:
+                    sample_size = index.cycle_size()
+            finally:
+                index.close()
+    except (IOError, OSError, ValueError) as e:
+        sys.stderr.write('pmort-replay: {0}\n'.format(e))
+
+        return 1
+
+    if not len(trace):
+        sys.stderr.write('pmort-replay: empty trace\n')
+
+        return 1
+
+    incidents = trace.incidents(arguments.incident_load)
+
+    results = [ replay(name, trace, incidents, sample_size or DEFAULT_SAMPLE_SIZE) for name in names ]
+
+    sys.stdout.write(format_results(results) + '\n')
+
+    return 0
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import heapq
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+
+from pmort.parameters import PARAMETERS
+from pmort import priority
+from pmort import archive
+from pmort import series
+from pmort.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+PARAMETERS.add_parameter(
+        options = [ '--maximum-size' ],
+        group = 'retention',
+        metavar = 'BYTES',
+        default = 1073741824,
+        type = int,
+        help = \
+                'Maximum number of bytes kept in the output directory.  ' \
+                'The oldest collections are removed to stay below this.  ' \
+                'Zero disables the limit.  Default: %(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--maximum-age' ],
+        group = 'retention',
+        metavar = 'SECONDS',
+        default = 86400,
+        type = int,
+        help = \
+                'Maximum age in seconds of collections kept in the output ' \
+                'directory.  Zero disables the limit.  Default: %(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--interval' ],
+        group = 'retention',
+        metavar = 'SECONDS',
+        default = 60.0,
+        type = float,
+        help = \
+                'Seconds between checks of the output directory against ' \
+                'the retention limits.  Default: %(default)s'
+        )
+
+SEGMENTS_DIRECTORY = 'segments'
+
+SNAPSHOT_PATTERN = re.compile(r'^\d{14}(\.\d{6})?$')
+SEGMENT_PATTERN = re.compile(r'^(\d{20}(?:_\d{4})?)\.(seg|idx)$')
+
+_tracker = None
+
+def account(path, size, timestamp = None):
+    '''Report ``size`` bytes written under ``path`` to the running tracker.
+
+    Does nothing if retention isn't running (cf. ``RetentionTracker``).
+
+    Arguments
+    ---------
+
+    :``path``:      Snapshot directory or segment file that grew.
+    :``size``:      Number of bytes it grew by.
+    :``timestamp``: Seconds since the epoch of the newest data in ``path``.
+                    Default: now.
+
+    '''
+
+    if _tracker is not None:
+        _tracker.account(path, size, timestamp)
+
+class RetentionTracker(threading.Thread):
+    '''Background thread enforcing size and age limits on the output directory.
+
+    The output directory is walked once, when the thread starts, to learn the
+    size and age of every snapshot directory and segment (cf.
+    ``pmort.archive``).  Afterwards, the output layer reports what it writes
+    through ``account``; thus, the total size is known without walking the
+    tree again.
+
+    Every ``interval`` seconds, the oldest entries are removed, one at a time,
+    until the total is below ``maximum_size`` and nothing is older than
+    ``maximum_age``.  The newest entry (the one being written) is never
+    removed.  Days of time series (cf. ``pmort.series``) are removed once
+    they're older than ``maximum_age``.  The thread runs with idle I/O
+    priority and the lowest CPU priority so eviction doesn't compete with the
+    system being observed.
+
+    Arguments
+    ---------
+
+    :``output_directory``: Directory to enforce limits on.
+    :``maximum_size``:     Bytes allowed (zero for no limit).
+    :``maximum_age``:      Seconds allowed (zero for no limit).
+    :``interval``:         Seconds between checks.
+
+    '''
+
+    def __init__(self, output_directory, maximum_size, maximum_age, interval = 60.0):
+        super(RetentionTracker, self).__init__(name = 'pmort.retention')
+
+        self.daemon = True
+
+        self.output_directory = output_directory
+        self.maximum_size = maximum_size
+        self.maximum_age = maximum_age
+        self.interval = interval
+
+        self.total = 0
+        self.evicted = 0
+
+        self._lock = threading.Lock()
+        self._entries = {}
+
+        # ( timestamp, path ) of the entries, oldest first; entries whose
+        # timestamp changed are pushed again and stale items skipped.
+        self._heap = []
+
+        self._stopping = threading.Event()
+
+    def account(self, path, size, timestamp = None):
+        '''Record ``size`` bytes written under ``path`` (cf. ``account``).'''
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self._lock:
+            entry = self._entries.get(path)
+
+            if entry is None:
+                entry = self._entries[path] = [ timestamp, 0 ]
+
+                self._push(path, timestamp)
+            elif timestamp > entry[0]:
+                entry[0] = timestamp
+
+                self._push(path, timestamp)
+
+            entry[1] += size
+
+            self.total += size
+
+    def _push(self, path, timestamp):
+        heapq.heappush(self._heap, ( timestamp, path ))
+
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._rebuild()
+
+    def _rebuild(self):
+        self._heap = [ ( entry[0], path ) for path, entry in self._entries.items() ]
+
+        heapq.heapify(self._heap)
+
+    def scan(self):
+        '''Walk the output directory and (re)learn every entry's size.'''
+
+        logger.info('scanning %s', self.output_directory)
+
+        entries = {}
+
+        for path in spool_entries(self.output_directory):
+            if os.path.isdir(path):
+                size = 0
+                for dirpath, dirnames, filenames in os.walk(path):
+                    size += sum([ _size(os.path.join(dirpath, _)) for _ in filenames ])
+            else:
+                size = _size(path)
+
+                index = path[:-4] + '.idx'
+                if os.path.exists(index):
+                    size += _size(index)
+
+            entries[path] = [ _timestamp(path), size ]
+
+        with self._lock:
+            for path, entry in self._entries.items():
+                entries.setdefault(path, entry)
+
+            self._entries = entries
+            self.total = sum([ _[1] for _ in entries.values() ])
+
+            self._rebuild()
+
+        logger.info('output directory size: %s bytes', self.total)
+
+    def _oldest(self):
+        with self._lock:
+            if len(self._entries) < 2:
+                return None
+
+            while True:
+                timestamp, path = self._heap[0]
+
+                entry = self._entries.get(path)
+
+                if entry is not None and entry[0] == timestamp:
+                    break
+
+                heapq.heappop(self._heap)
+
+            if self.maximum_size and self.total > self.maximum_size:
+                return path
+
+            if self.maximum_age and time.time() - timestamp > self.maximum_age:
+                return path
+
+        return None
+
+    def evict(self):
+        '''Remove the oldest entries until the limits are met.
+
+        Returns
+        -------
+
+        Number of entries removed.
+
+        '''
+
+        removed = 0
+
+        while not self._stopping.is_set():
+            path = self._oldest()
+
+            if path is None:
+                break
+
+            logger.info('evicting %s', path)
+
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    archive.get_archive(os.path.dirname(path)).remove_segment(path)
+            except OSError as e:
+                logger.warning('could not evict %s', path)
+                logger.exception(e)
+
+            with self._lock:
+                entry = self._entries.pop(path, None)
+
+                if entry is not None:
+                    self.total -= entry[1]
+
+            removed += 1
+
+        self.evicted += removed
+
+        return removed
+
+    def run(self):
+        priority.set_io_priority(priority.IOPRIO_CLASS_IDLE)
+        priority.set_thread_nice(19)
+
+        self.scan()
+
+        while not self._stopping.is_set():
+            try:
+                _ = self.evict()
+
+                if _:
+                    logger.info('evicted %s entries; output directory size: %s bytes', _, self.total)
+
+                if self.maximum_age:
+                    series.expire(self.output_directory, self.maximum_age)
+            except Exception as e:
+                logger.warning('retention failed')
+                logger.exception(e)
+
+            self._stopping.wait(self.interval)
+
+    def stop(self):
+        '''Ask the thread to stop (after its current removal).'''
+
+        self._stopping.set()
+
+def start_retention():
+    '''Start a ``RetentionTracker`` from the parameters (if any limit is set).
+
+    Returns
+    -------
+
+    The started ``RetentionTracker`` or None if retention is disabled or
+    output goes to standard output.
+
+    '''
+
+    global _tracker
+
+    if PARAMETERS['pmort.output_directory'].startswith('-'):
+        return None
+
+    if not PARAMETERS['retention.maximum_size'] and not PARAMETERS['retention.maximum_age']:
+        return None
+
+    _tracker = RetentionTracker(
+            PARAMETERS['pmort.output_directory'],
+            PARAMETERS['retention.maximum_size'],
+            PARAMETERS['retention.maximum_age'],
+            PARAMETERS['retention.interval'],
+            )
+    _tracker.start()
+
+    REGISTRY.gauge('pmort_spool_bytes', 'Bytes in the output directory.', lambda: _tracker.total)
+    REGISTRY.gauge('pmort_spool_evicted', 'Entries removed from the output directory since start.', lambda: _tracker.evicted)
+
+    return _tracker
+
+def spool_entries(output_directory):
+    '''Snapshot directories and segments in ``output_directory``.
+
+    Only the top level of the output directory and its segments
+    subdirectory are listed; the entries themselves aren't examined.
+
+    '''
+
+    paths = []
+
+    if not os.path.isdir(output_directory):
+        return paths
+
+    for name in os.listdir(output_directory):
+        if SNAPSHOT_PATTERN.match(name):
+            paths.append(os.path.join(output_directory, name))
+
+    segments_directory = os.path.join(output_directory, SEGMENTS_DIRECTORY)
+
+    if os.path.isdir(segments_directory):
+        for name in os.listdir(segments_directory):
+            _ = SEGMENT_PATTERN.match(name)
+
+            if _ is not None and _.group(2) == 'seg':
+                paths.append(os.path.join(segments_directory, name))
+
+    return paths
+
+def _timestamp(path):
+    '''Seconds since the epoch of the newest data in ``path``.'''
+
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0.0
+
+def _size(path):
+    try:
+        return os.lstat(path).st_size
+    except OSError:
+        return 0
@@ -0,0 +1,489 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import collections
+import contextlib
+import datetime
+import errno
+import io
+import logging
+import os
+import signal
+import threading
+import time
+
+from pmort.parameters import PARAMETERS
+from pmort.learners import LEARNERS
+from pmort import delta
+from pmort import output
+from pmort import records
+from pmort.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+PARAMETERS.add_parameter(
+        options = [ '--duration', ],
+        group = 'ring',
+        metavar = 'SECONDS',
+        default = 0.0,
+        type = float,
+        help = \
+                'Seconds of collector output kept in memory instead of ' \
+                'being written out.  The buffered output is only written ' \
+                '(to the output directory) when a trigger fires.  Zero ' \
+                'writes all output as it\'s collected.  Default: %(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--maximum-size', ],
+        group = 'ring',
+        metavar = 'BYTES',
+        default = 67108864,
+        type = int,
+        help = \
+                'Maximum number of bytes of output kept in memory.  The ' \
+                'oldest output is dropped to stay below this.  Default: ' \
+                '%(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--linger', ],
+        group = 'ring',
+        metavar = 'SECONDS',
+        default = 300.0,
+        type = float,
+        help = \
+                'Seconds output keeps being written out after a trigger ' \
+                'fires (later triggers extend this).  Default: %(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--triggers', ],
+        group = 'ring',
+        default = 'load, oom, signal, anomaly',
+        help = \
+                'Triggers that write out the buffered output: load (one ' \
+                'minute load above load_threshold), oom (the OOM killer ' \
+                'ran), signal (SIGUSR1) and anomaly (a learner found the ' \
+                'system behaving unusually).  Default: %(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--load-threshold', ],
+        group = 'ring',
+        default = 0.0,
+        type = float,
+        help = \
+                'One minute load above which the load trigger fires.  Zero ' \
+                'uses twice the number of CPUs.  Default: %(default)s'
+        )
+
+OOM_MESSAGES = ( 'Out of memory', 'oom-kill', 'Killed process' )
+
+class RingBuffer(object):
+    '''Bounded in-memory buffer of collector output.
+
+    Output is kept in order of arrival; the oldest is dropped once it's more
+    than ``duration`` seconds old or the buffer holds more than
+    ``maximum_size`` bytes.
+
+    Delta encoded tables (cf. ``pmort.delta``) depend on the ones before
+    them; thus, the dropped tables of an output are decoded and its oldest
+    table left is rewritten as a keyframe.
+
+    Arguments
+    ---------
+
+    :``duration``:     Seconds of output kept.
+    :``maximum_size``: Bytes of output kept.
+
+    '''
+
+    def __init__(self, duration, maximum_size):
+        self.duration = duration
+        self.maximum_size = maximum_size
+
+        self.size = 0
+        self.dropped = 0
+
+        self._entries = collections.deque()
+        self._decoders = {}
+        self._stale = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def append(self, timestamp, name, data):
+        '''Add the output (bytes) of ``name`` for the snapshot at ``timestamp``.'''
+
+        oldest = datetime.datetime.now() - datetime.timedelta(seconds = self.duration)
+
+        with self._lock:
+            self._entries.append(( timestamp, name, data ))
+            self.size += len(data)
+
+            while len(self._entries) and ( self.size > self.maximum_size or self._entries[0][0] < oldest ):
+                _, dropped_name, dropped_data = self._entries.popleft()
+
+                self.size -= len(dropped_data)
+                self.dropped += 1
+
+                if delta.is_encoded(dropped_data):
+                    self._decoders.setdefault(dropped_name, delta.DeltaDecoder()).decode(dropped_data)
+
+                    self._stale.add(dropped_name)
+
+            for _ in list(self._stale):
+                self._rekey(_)
+
+    def _rekey(self, name):
+        '''Rewrite the oldest delta table of ``name`` as a keyframe.'''
+
+        for index, ( timestamp, entry_name, data ) in enumerate(self._entries):
+            if entry_name != name:
+                continue
+
+            self._stale.discard(name)
+
+            if delta.header(data) is None or delta.header(data)[0] != delta.DELTA:
+                return
+
+            decoder = self._decoders[name]
+
+            rows = decoder.decode(data)
+
+            if rows is None:
+                logger.warning('buffered tables of %s can\'t be decoded until its next keyframe', name)
+
+                return
+
+            data, old = delta.keyframe(decoder.fields, rows, decoder.sequence).encode('utf-8'), data
+
+            self._entries[index] = ( timestamp, entry_name, data )
+            self.size += len(data) - len(old)
+
+            return
+
+    def drain(self):
+        '''Remove and return all buffered ( timestamp, name, bytes ), oldest first.'''
+
+        with self._lock:
+            entries = list(self._entries)
+
+            self._entries.clear()
+            self._decoders.clear()
+            self._stale.clear()
+            self.size = 0
+
+        return entries
+
+class RingSnapshot(object):
+    '''Snapshot (cf. ``pmort.output.Snapshot``) whose output goes to a ring.
+
+    Each output is collected in memory and added to ``ring`` when it's
+    complete; ``commit`` does nothing.
+
+    Arguments
+    ---------
+
+    :``ring``:      ``RingBuffer`` receiving the output.
+    :``timestamp``: Time the snapshot represents.  Default: now.
+
+    '''
+
+    def __init__(self, ring, timestamp = None):
+        if timestamp is None:
+            timestamp = datetime.datetime.now()
+
+        self.ring = ring
+        self.timestamp = timestamp
+
+        self.names = []
+
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def open(self, name):
+        '''Open a binary file handle for the output of the given name.'''
+
+        logger.info('buffering %s', name)
+
+        with self._lock:
+            self.names.append(name)
+
+        buffer_fh = io.BytesIO()
+
+        yield buffer_fh
+
+        self.ring.append(self.timestamp, name, buffer_fh.getvalue())
+
+    def write(self, name, output):
+        with self.open(name) as output_fh:
+            output_fh.write(output.encode('utf-8'))
+
+    def commit(self):
+        pass
+
+class TriggerMonitor(object):
+    '''Decide whether buffered output should be written out.
+
+    ``check`` is called every cycle and reports the first of the enabled
+    triggers that fired:
+
+    :load:    One minute load above ``load_threshold``.
+    :oom:     The OOM killer ran since the last check (read from /dev/kmsg
+              or, if that's not readable, the oom_kill count in /proc/vmstat).
+    :signal:  SIGUSR1 was received (cf. ``signal``).
+    :anomaly: The ``anomalous`` method of a learner in use returned True.
+
+    Arguments
+    ---------
+
+    :``triggers``:       Names of the enabled triggers.
+    :``load_threshold``: Load above which the load trigger fires.
+
+    '''
+
+    def __init__(self, triggers, load_threshold):
+        self.triggers = set(triggers)
+        self.load_threshold = load_threshold
+
+        self._signalled = threading.Event()
+
+        self._kmsg = None
+        self._oom_kills = None
+
+        if 'oom' in self.triggers:
+            self._open_kmsg()
+
+    def _open_kmsg(self):
+        try:
+            self._kmsg = os.open('/dev/kmsg', os.O_RDONLY | os.O_NONBLOCK)
+        except OSError as e:
+            logger.info('could not open /dev/kmsg (%s): using /proc/vmstat oom_kill', e)
+
+            self._oom_kills = self._read_oom_kills()
+
+            return
+
+        os.lseek(self._kmsg, 0, os.SEEK_END)
+
+    def _read_oom_kills(self):
+        try:
+            with open('/proc/vmstat', 'r') as vmstat_fh:
+                for line in vmstat_fh:
+                    if line.startswith('oom_kill '):
+                        return int(line.split()[1])
+        except (IOError, OSError):
+            pass
+
+        return None
+
+    def signal(self, *args):
+        '''Fire the signal trigger (usable directly as a signal handler).'''
+
+        self._signalled.set()
+
+    def _oom(self):
+        if self._kmsg is None:
+            previous, self._oom_kills = self._oom_kills, self._read_oom_kills()
+
+            return previous is not None and self._oom_kills is not None and self._oom_kills > previous
+
+        found = False
+
+        while True:
+            try:
+                record = os.read(self._kmsg, 8192)
+            except OSError as e:
+                if e.errno == errno.EPIPE: # records overwritten before read
+                    continue
+
+                if e.errno != errno.EAGAIN:
+                    logger.warning('could not read /dev/kmsg')
+                    logger.exception(e)
+
+                break
+
+            if not len(record):
+                break
+
+            message = record.decode('utf-8', 'replace').partition(';')[2]
+
+            if any([ _ in message for _ in OOM_MESSAGES ]):
+                logger.warning('kernel: %s', message.strip())
+
+                found = True
+
+        return found
+
+    def check(self):
+        '''Name of the trigger that fired (or None).'''
+
+        if 'signal' in self.triggers and self._signalled.is_set():
+            self._signalled.clear()
+
+            return 'signal'
+
+        if 'oom' in self.triggers and self._oom():
+            return 'oom'
+
+        if 'load' in self.triggers and os.getloadavg()[0] > self.load_threshold:
+            return 'load'
+
+        if 'anomaly' in self.triggers:
+            for name, learner in LEARNERS.loaded().items():
+                if getattr(learner, 'anomalous', lambda: False)():
+                    logger.warning('learner %s found an anomaly', name)
+
+                    return 'anomaly'
+
+        return None
+
+    def close(self):
+        if self._kmsg is not None:
+            os.close(self._kmsg)
+
+        self._kmsg = None
+
+class RingCapture(object):
+    '''Keep collector output in memory until something goes wrong.
+
+    Every cycle's output goes into a ``RingBuffer`` rather than the output
+    directory.  When a trigger fires (cf. ``TriggerMonitor``), the buffered
+    output is written out through ``pmort.output`` (each buffered cycle as
+    the snapshot it would have been) and, for ``linger`` seconds afterwards,
+    output is written out as it's collected.  Thus, the minutes before (and
+    after) a problem are kept while nothing is written the rest of the time.
+
+    Arguments
+    ---------
+
+    :``ring``:    ``RingBuffer`` output is kept in.
+    :``monitor``: ``TriggerMonitor`` consulted every cycle.
+    :``linger``:  Seconds output is written out after a trigger.
+    :``clock``:   Function returning monotonic seconds.
+
+    '''
+
+    def __init__(self, ring, monitor, linger, clock = time.monotonic):
+        self.ring = ring
+        self.monitor = monitor
+        self.linger = linger
+        self.clock = clock
+
+        self.flushes = 0
+
+        self._buffering = False
+        self._linger_until = None
+
+    def begin_snapshot(self, timestamp = None):
+        '''Start a cycle (cf. ``pmort.output.begin_snapshot``).
+
+        Checks the triggers first; if one fired, the buffered output is
+        written out.  The snapshot returned is a regular one while lingering
+        after a trigger and a ``RingSnapshot`` otherwise.
+
+        '''
+
+        reason = self.monitor.check()
+
+        if reason is not None:
+            logger.warning('%s trigger fired: writing out %s buffered outputs', reason, len(self.ring))
+
+            self.flush()
+
+            self._buffering = False
+            self._linger_until = self.clock() + self.linger
+
+        if self._linger_until is not None and self.clock() < self._linger_until:
+            return output.begin_snapshot(timestamp)
+
+        self._linger_until = None
+
+        if not self._buffering:
+            # The tables before were written out (or never made): start the
+            # buffered ones with keyframes.
+            delta.reset_encoders()
+
+            self._buffering = True
+
+        return output.begin_snapshot(timestamp, snapshot = RingSnapshot(self.ring, timestamp))
+
+    def flush(self):
+        '''Write out all buffered output; returns the number of outputs written.'''
+
+        entries = self.ring.drain()
+
+        snapshots = collections.OrderedDict()
+
+        for timestamp, name, data in entries:
+            snapshots.setdefault(timestamp, []).append(( name, data ))
+
+        for timestamp, outputs in snapshots.items():
+            snapshot = output.Snapshot(timestamp)
+
+            for name, data in outputs:
+                try:
+                    with snapshot.open(name) as output_fh:
+                        output_fh.write(data)
+                except (IOError, OSError) as e:
+                    logger.warning('could not write buffered output of %s', name)
+                    logger.exception(e)
+
+                if records.is_records(data):
+                    try:
+                        snapshot.append_series(name, records.decode(data))
+                    except ValueError as e:
+                        logger.warning('could not decode buffered records of %s: %s', name, e)
+
+            snapshot.commit()
+
+        self.flushes += 1
+
+        return len(entries)
+
+def start_ring():
+    '''Start a ``RingCapture`` from the parameters (if ring.duration is set).
+
+    Installs a SIGUSR1 handler (chaining any previous one) for the signal
+    trigger; thus, must be called from the main thread.
+
+    Returns
+    -------
+
+    The ``RingCapture`` or None if output is written as it's collected.
+
+    '''
+
+    if PARAMETERS['ring.duration'] <= 0:
+        return None
+
+    load_threshold = PARAMETERS['ring.load_threshold'] or 2.0 * ( os.cpu_count() or 1 )
+
+    monitor = TriggerMonitor([ _.strip() for _ in PARAMETERS['ring.triggers'].split(',') if len(_.strip()) ], load_threshold)
+
+    previous = signal.getsignal(signal.SIGUSR1)
+
+    def _sigusr1_handler(signum, frame):
+        monitor.signal()
+
+        if callable(previous):
+            previous(signum, frame)
+
+    signal.signal(signal.SIGUSR1, _sigusr1_handler)
+
+    logger.info('keeping %s seconds of output in memory', PARAMETERS['ring.duration'])
+
+    capture = RingCapture(RingBuffer(PARAMETERS['ring.duration'], PARAMETERS['ring.maximum_size']), monitor, PARAMETERS['ring.linger'])
+
+    REGISTRY.gauge('pmort_ring_bytes', 'Bytes of output buffered in memory.', lambda: capture.ring.size)
+    REGISTRY.gauge('pmort_ring_dropped', 'Buffered outputs dropped unwritten since start.', lambda: capture.ring.dropped)
+    REGISTRY.gauge('pmort_ring_flushes', 'Times the buffered output was written out since start.', lambda: capture.flushes)
+
+    return capture
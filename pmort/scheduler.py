@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import logging
+import math
+import heapq
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+IDLE_INTERVAL = 1.0
+
+class Scheduler(object):
+    '''Deadline based cycle timing on the monotonic clock.
+
+    Each cycle's deadline is the previous deadline plus the interval (not the
+    time the previous cycle finished plus the interval); thus, the time spent
+    collecting doesn't accumulate as drift.  Intervals may be fractions of a
+    second.
+
+    Sleeping is done with ``threading.Event.wait`` against the monotonic
+    clock and resumed until the deadline is actually reached, so signals
+    (handled or not) and wall clock changes neither shorten nor lengthen a
+    cycle.
+
+    If a cycle runs past one or more deadlines, the missed cycles are skipped
+    (and counted) rather than run back to back.
+
+    Arguments
+    ---------
+
+    :``clock``: Function returning monotonic seconds.  Default:
+                ``time.monotonic``.
+    :``wait``:  Function sleeping for up to the given seconds (returning
+                early is allowed).  Default: ``threading.Event().wait``.
+
+    '''
+
+    def __init__(self, clock = time.monotonic, wait = None):
+        self.clock = clock
+
+        self._event = threading.Event()
+
+        if wait is None:
+            wait = self._event.wait
+
+        self.wait = wait
+
+        self.deadline = self.clock()
+
+        self.lag = 0.0
+        self.missed = 0
+
+    def advance(self, interval):
+        '''Set the next deadline ``interval`` seconds after the current one.
+
+        Returns
+        -------
+
+        The new deadline (in ``clock`` seconds).
+
+        '''
+
+        self.deadline += interval
+
+        now = self.clock()
+
+        if self.deadline < now:
+            missed = int(math.ceil(( now - self.deadline ) / interval)) if interval > 0 else 0
+
+            if missed:
+                logger.warning('running %.3f seconds late: skipping %s cycles', now - self.deadline, missed)
+
+                self.missed += missed
+                self.deadline += missed * interval
+
+        return self.deadline
+
+    def remaining(self):
+        '''Seconds until the current deadline (negative if passed).'''
+
+        return self.deadline - self.clock()
+
+    def sleep(self):
+        '''Sleep until the current deadline.
+
+        Returns
+        -------
+
+        Seconds the deadline was overshot by (also kept as ``lag``).
+
+        '''
+
+        while True:
+            remaining = self.remaining()
+
+            if remaining <= 0:
+                break
+
+            self.wait(remaining)
+
+        self.lag = self.clock() - self.deadline
+
+        logger.debug('cycle lag: %.6f seconds', self.lag)
+
+        return self.lag
+
+class CollectorScheduler(Scheduler):
+    '''Heap of per collector deadlines on the monotonic clock.
+
+    Every collector has its own deadline.  ``due`` returns the collectors
+    whose deadlines have passed and ``reschedule`` sets each one's next
+    deadline ``interval`` seconds after its previous one (skipping missed
+    runs as ``Scheduler.advance`` does).  ``deadline`` is always the earliest
+    deadline; thus, ``sleep`` wakes for the next collector due.  With nothing
+    scheduled, the deadline is ``IDLE_INTERVAL`` seconds away.
+
+    Arguments are the same as for ``Scheduler``.
+
+    '''
+
+    def __init__(self, clock = time.monotonic, wait = None):
+        super(CollectorScheduler, self).__init__(clock, wait)
+
+        self._heap = []
+        self._deadlines = {}
+
+    def _update_deadline(self):
+        while len(self._heap) and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+        if len(self._heap):
+            self.deadline = self._heap[0][0]
+        else:
+            self.deadline = self.clock() + IDLE_INTERVAL
+
+    def update(self, names):
+        '''Track exactly ``names``: new ones are due now, missing ones dropped.'''
+
+        names = set(names)
+
+        for name in set(self._deadlines.keys()) - names:
+            logger.info('unscheduling %s', name)
+
+            del self._deadlines[name]
+
+        now = self.clock()
+
+        for name in names - set(self._deadlines.keys()):
+            logger.info('scheduling %s', name)
+
+            self._deadlines[name] = now
+            heapq.heappush(self._heap, ( now, name ))
+
+        self._update_deadline()
+
+    def due(self):
+        '''Names of the collectors whose deadlines have passed.
+
+        Each name returned must be given to ``reschedule`` (once it's known
+        when it should run next) or it won't be due again.
+
+        '''
+
+        now = self.clock()
+
+        names = []
+
+        while len(self._heap) and self._heap[0][0] <= now:
+            deadline, name = heapq.heappop(self._heap)
+
+            if self._deadlines.get(name) == deadline:
+                names.append(name)
+
+        return sorted(names)
+
+    def reschedule(self, name, interval):
+        '''Set the next deadline of ``name`` ``interval`` seconds later.'''
+
+        deadline = self._deadlines[name] + interval
+
+        now = self.clock()
+
+        if deadline < now and interval > 0:
+            missed = int(math.ceil(( now - deadline ) / interval))
+
+            logger.info('%s running late: skipping %s runs', name, missed)
+
+            self.missed += missed
+            deadline += missed * interval
+        elif interval <= 0:
+            deadline = max(deadline, now)
+
+        self._deadlines[name] = deadline
+        heapq.heappush(self._heap, ( deadline, name ))
+
+        self._update_deadline()
+
+        return deadline
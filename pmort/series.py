@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import array
+import datetime
+import logging
+import mmap
+import os
+import re
+import shutil
+import struct
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SERIES_DIRECTORY = 'series'
+SERIES_EXTENSION = '.series'
+
+DAY_FORMAT = '%Y%m%d'
+DAY_PATTERN = re.compile(r'^\d{8}$')
+
+# File header: magic, format version and the size of the samples that follow.
+HEADER = struct.Struct('<8sII')
+MAGIC = b'PMSERIES'
+VERSION = 1
+
+# Sample: seconds since the epoch and value.
+SAMPLE = struct.Struct('<dd')
+
+def numeric_fields(record):
+    '''( field, float ) pairs of the numeric values in ``record``.
+
+    Booleans and values that aren't int or float are skipped.
+
+    '''
+
+    return [ ( key, float(value) ) for key, value in sorted(record.items()) if isinstance(value, ( int, float )) and not isinstance(value, bool) ]
+
+class SeriesWriter(object):
+    '''Append numeric samples to one file per metric and day.
+
+    Samples are fixed width (cf. ``SAMPLE``) and appended in time order, so a
+    day of a metric is a flat array of ( timestamp, value ) pairs that
+    ``read_series`` maps into memory as is:
+
+    ::
+
+        series/20130123/load_average.load1.series
+
+    Files are kept open for appending until the day changes or ``close``.
+
+    Arguments
+    ---------
+
+    :``output_directory``: Directory the series subdirectory is created in.
+
+    '''
+
+    def __init__(self, output_directory):
+        self.directory = os.path.join(output_directory, SERIES_DIRECTORY)
+
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def _file(self, metric, day):
+        _ = self._files.get(metric)
+
+        if _ is not None and _[0] == day:
+            return _[1]
+
+        if _ is not None:
+            _[1].close()
+
+        directory = os.path.join(self.directory, day)
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        series_fh = open(os.path.join(directory, metric + SERIES_EXTENSION), 'ab')
+
+        if series_fh.tell() == 0:
+            series_fh.write(HEADER.pack(MAGIC, VERSION, SAMPLE.size))
+        elif ( series_fh.tell() - HEADER.size ) % SAMPLE.size:
+            logger.warning('truncating partial sample at the end of %s', series_fh.name)
+
+            series_fh.truncate(series_fh.tell() - ( series_fh.tell() - HEADER.size ) % SAMPLE.size)
+            series_fh.seek(0, os.SEEK_END)
+
+        self._files[metric] = ( day, series_fh )
+
+        return series_fh
+
+    def append(self, metric, timestamp, value):
+        '''Append ``value`` of ``metric`` at ``timestamp`` (seconds since the epoch).'''
+
+        day = time.strftime(DAY_FORMAT, time.localtime(timestamp))
+
+        with self._lock:
+            series_fh = self._file(metric, day)
+
+            series_fh.write(SAMPLE.pack(timestamp, value))
+            series_fh.flush()
+
+    def append_record(self, name, timestamp, record):
+        '''Append every numeric field of ``record`` as metric name.field.
+
+        Returns
+        -------
+
+        Number of samples appended.
+
+        '''
+
+        fields = numeric_fields(record)
+
+        for field, value in fields:
+            self.append('{0}.{1}'.format(name, field), timestamp, value)
+
+        return len(fields)
+
+    def close(self):
+        with self._lock:
+            for day, series_fh in self._files.values():
+                series_fh.close()
+
+            self._files = {}
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+def get_writer(output_directory):
+    '''The (shared) ``SeriesWriter`` of ``output_directory``.'''
+
+    with _writers_lock:
+        if output_directory not in _writers:
+            _writers[output_directory] = SeriesWriter(output_directory)
+
+        return _writers[output_directory]
+
+def _days(output_directory):
+    directory = os.path.join(output_directory, SERIES_DIRECTORY)
+
+    if not os.path.isdir(directory):
+        return []
+
+    return sorted([ _ for _ in os.listdir(directory) if DAY_PATTERN.match(_) ])
+
+def metrics(output_directory):
+    '''Names of all metrics with samples in ``output_directory``.'''
+
+    names = set()
+
+    for day in _days(output_directory):
+        names.update([ _[:-len(SERIES_EXTENSION)] for _ in os.listdir(os.path.join(output_directory, SERIES_DIRECTORY, day)) if _.endswith(SERIES_EXTENSION) ])
+
+    return sorted(names)
+
+def _search(view, count, timestamp, right):
+    low, high = 0, count
+
+    while low < high:
+        middle = ( low + high ) // 2
+
+        _ = view[2 * middle]
+
+        if _ < timestamp or ( right and _ == timestamp ):
+            low = middle + 1
+        else:
+            high = middle
+
+    return low
+
+def _read_file(path, start, end):
+    with open(path, 'rb') as series_fh:
+        size = os.fstat(series_fh.fileno()).st_size
+
+        if size < HEADER.size:
+            return None
+
+        magic, version, sample_size = HEADER.unpack(series_fh.read(HEADER.size))
+
+        if magic != MAGIC or version != VERSION or sample_size != SAMPLE.size:
+            raise ValueError('{0} is not a pmort series'.format(path))
+
+        count = ( size - HEADER.size ) // SAMPLE.size
+
+        if not count:
+            return None
+
+        mapped = mmap.mmap(series_fh.fileno(), HEADER.size + count * SAMPLE.size, access = mmap.ACCESS_READ)
+
+    try:
+        if numpy is not None:
+            return _slice_numpy(mapped, count, start, end)
+
+        return _slice_array(mapped, count, start, end)
+    finally:
+        mapped.close()
+
+def _slice_numpy(mapped, count, start, end):
+    samples = numpy.frombuffer(mapped, dtype = numpy.dtype([ ( 'timestamp', '<f8' ), ( 'value', '<f8' ) ]), count = count, offset = HEADER.size)
+
+    first = numpy.searchsorted(samples['timestamp'], start, 'left') if start is not None else 0
+    last = numpy.searchsorted(samples['timestamp'], end, 'right') if end is not None else count
+
+    return samples['timestamp'][first:last].copy(), samples['value'][first:last].copy()
+
+def _slice_array(mapped, count, start, end):
+    raw = memoryview(mapped)[HEADER.size:HEADER.size + count * SAMPLE.size]
+
+    try:
+        if sys.byteorder == 'little':
+            view = raw.cast('d')
+        else:
+            view = array.array('d', raw)
+            view.byteswap()
+
+        first = _search(view, count, start, False) if start is not None else 0
+        last = _search(view, count, end, True) if end is not None else count
+
+        if isinstance(view, memoryview):
+            values = array.array('d')
+            values.frombytes(raw[first * SAMPLE.size:last * SAMPLE.size])
+
+            view.release()
+        else:
+            values = view[2 * first:2 * last]
+    finally:
+        raw.release()
+
+    return values[0::2], values[1::2]
+
+def read_series(output_directory, metric, start = None, end = None):
+    '''Samples of ``metric`` between ``start`` and ``end`` (seconds since the
+    epoch; None for no limit).
+
+    Each day file in the range is mapped into memory and its samples in the
+    range located by binary search; nothing is parsed.
+
+    Returns
+    -------
+
+    ( timestamps, values ) as numpy arrays if numpy is installed; otherwise,
+    as ``array.array('d')``.
+
+    Raises
+    ------
+
+    ValueError if a file isn't a series.
+
+    '''
+
+    first_day = time.strftime(DAY_FORMAT, time.localtime(start)) if start is not None else None
+    last_day = time.strftime(DAY_FORMAT, time.localtime(end)) if end is not None else None
+
+    parts = []
+
+    for day in _days(output_directory):
+        if ( first_day is not None and day < first_day ) or ( last_day is not None and day > last_day ):
+            continue
+
+        path = os.path.join(output_directory, SERIES_DIRECTORY, day, metric + SERIES_EXTENSION)
+
+        if not os.path.exists(path):
+            continue
+
+        _ = _read_file(path, start, end)
+
+        if _ is not None:
+            parts.append(_)
+
+    if numpy is not None:
+        if not len(parts):
+            return numpy.zeros(0), numpy.zeros(0)
+
+        return numpy.concatenate([ _[0] for _ in parts ]), numpy.concatenate([ _[1] for _ in parts ])
+
+    timestamps, values = array.array('d'), array.array('d')
+
+    for _ in parts:
+        timestamps.extend(_[0])
+        values.extend(_[1])
+
+    return timestamps, values
+
+def expire(output_directory, maximum_age, now = None):
+    '''Remove the days of series that ended more than ``maximum_age`` seconds ago.
+
+    Returns
+    -------
+
+    Number of days removed.
+
+    '''
+
+    if now is None:
+        now = time.time()
+
+    removed = 0
+
+    for day in _days(output_directory):
+        end = time.mktime(( datetime.datetime.strptime(day, DAY_FORMAT) + datetime.timedelta(days = 1) ).timetuple())
+
+        if now - end <= maximum_age:
+            break
+
+        logger.info('expiring series of %s', day)
+
+        try:
+            shutil.rmtree(os.path.join(output_directory, SERIES_DIRECTORY, day))
+        except OSError as e:
+            logger.warning('could not expire series of %s', day)
+            logger.exception(e)
+
+            continue
+
+        removed += 1
+
+    return removed
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import collections
+import logging
+import resource
+import time
+
+from pmort.parameters import PARAMETERS
+from pmort import priority
+from pmort.procfs import ProcFile
+from pmort.procfs import parse_io
+from pmort.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+PARAMETERS.add_parameter(
+        options = [ '--cpu-budget', ],
+        group = 'throttle',
+        metavar = 'FRACTION',
+        default = 0.0,
+        type = float,
+        help = \
+                'Share of one CPU pmort (including its collector scripts) ' \
+                'may use.  Zero disables the budget.  Default: %(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--memory-budget', ],
+        group = 'throttle',
+        metavar = 'BYTES',
+        default = 0,
+        type = int,
+        help = \
+                'Resident memory pmort may use.  Zero disables the ' \
+                'budget.  Default: %(default)s'
+        )
+
+PARAMETERS.add_parameter(
+        options = [ '--write-budget', ],
+        group = 'throttle',
+        metavar = 'BYTES',
+        default = 0,
+        type = int,
+        help = \
+                'Bytes per second pmort may write to storage.  Zero ' \
+                'disables the budget.  Default: %(default)s'
+        )
+
+# Throttle levels: from PRIORITY_LEVEL on, pmort runs with the lowest CPU and
+# I/O priority; from DROP_LEVEL on, expensive collectors are skipped; every
+# level above DROP_LEVEL doubles the intervals.
+PRIORITY_LEVEL = 1
+DROP_LEVEL = 2
+MAXIMUM_LEVEL = 5
+
+# Minimum seconds usage is measured over before it's compared against the
+# budgets.
+MEASURE_WINDOW = 10.0
+
+# Consecutive windows under half of every budget before relaxing one level.
+RELAX_WINDOWS = 10
+
+Usage = collections.namedtuple('Usage', [ 'cpu', 'rss', 'written' ])
+
+class UsageMeter(object):
+    '''Measure pmort's own resource usage.
+
+    ``measure`` returns a ``Usage``: CPU seconds used so far by pmort and its
+    (finished) children, current resident bytes and bytes written to storage
+    so far (/proc/self/io; characters written if that's not accounted).
+
+    '''
+
+    def __init__(self):
+        self._statm = ProcFile('/proc/self/statm')
+        self._io = ProcFile('/proc/self/io')
+
+        self._page_size = resource.getpagesize()
+
+    def measure(self):
+        cpu = sum([ _.ru_utime + _.ru_stime for _ in ( resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN) ) ])
+
+        try:
+            rss = int(self._statm.read().split()[1]) * self._page_size
+        except (IOError, OSError, IndexError, ValueError):
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+        try:
+            _ = parse_io(self._io.read())
+            written = _.get('write_bytes', _.get('wchar', 0))
+        except (IOError, OSError, ValueError):
+            written = 0
+
+        return Usage(cpu, rss, written)
+
+class Throttle(object):
+    '''Keep pmort's own usage within budgets.
+
+    ``update`` is called once a cycle; once at least ``window`` seconds have
+    passed since the last comparison, it compares pmort's CPU share and write
+    rate over that window and its resident memory against the budgets (zero
+    for none).  Short cycles thus don't escalate on a burst.  If any is over
+    budget, the throttle level is raised by one:
+
+    :1:   Lowest CPU (nice 19) and idle I/O priority for all threads
+          (cf. ``pmort.priority.lower_priority``).
+    :2:   Expensive collectors are skipped (cf. ``allows``).
+    :3-5: Intervals are doubled per level (cf. ``stretch``).
+
+    After ``RELAX_WINDOWS`` consecutive windows under half of every budget,
+    the level is lowered by one.  Every change is logged with the usage that
+    caused it.
+
+    Arguments
+    ---------
+
+    :``cpu_budget``:    Share of one CPU.
+    :``memory_budget``: Resident bytes.
+    :``write_budget``:  Bytes written per second.
+    :``window``:        Minimum seconds usage is measured over.
+    :``clock``:         Function returning monotonic seconds.
+    :``measure``:       Function returning a ``Usage``.  Default:
+                        ``UsageMeter().measure``.
+
+    '''
+
+    def __init__(self, cpu_budget, memory_budget, write_budget, window = MEASURE_WINDOW, clock = time.monotonic, measure = None):
+        self.budgets = { 'cpu': cpu_budget, 'rss': memory_budget, 'write': write_budget }
+        self.window = window
+
+        self.clock = clock
+        self.measure = measure or UsageMeter().measure
+
+        self.level = 0
+        self.usage = {}
+
+        self._calm = 0
+        self._priorities = None
+        self._previous = None
+
+    def update(self):
+        '''Measure the usage and adjust the level once a window has passed.
+
+        Returns
+        -------
+
+        The throttle level.
+
+        '''
+
+        now, usage = self.clock(), self.measure()
+
+        previous = self._previous
+
+        if previous is None or now < previous[0]:
+            self._previous = ( now, usage )
+
+            return self.level
+
+        elapsed = now - previous[0]
+
+        if elapsed <= 0 or elapsed < self.window:
+            return self.level
+
+        self._previous = ( now, usage )
+
+        self.usage = {
+                'cpu': ( usage.cpu - previous[1].cpu ) / elapsed,
+                'rss': usage.rss,
+                'write': max(usage.written - previous[1].written, 0) / elapsed,
+                }
+
+        over = sorted([ name for name, budget in self.budgets.items() if budget > 0 and self.usage[name] > budget ])
+
+        if len(over):
+            self._calm = 0
+
+            if self.level < MAXIMUM_LEVEL:
+                self._set_level(self.level + 1, 'over {0} budget'.format(', '.join(over)))
+        elif all([ self.usage[name] <= budget / 2.0 for name, budget in self.budgets.items() if budget > 0 ]):
+            self._calm += 1
+
+            if self._calm >= RELAX_WINDOWS and self.level > 0:
+                self._calm = 0
+
+                self._set_level(self.level - 1, 'under half of every budget for {0} windows'.format(RELAX_WINDOWS))
+        else:
+            self._calm = 0
+
+        return self.level
+
+    def _set_level(self, level, reason):
+        logger.warning('throttle level %s -> %s (%s): cpu %.3f, rss %d bytes, write %d bytes/s', self.level, level, reason, self.usage['cpu'], self.usage['rss'], self.usage['write'])
+
+        if level >= PRIORITY_LEVEL and self._priorities is None:
+            logger.warning('throttle: lowering CPU and I/O priority')
+
+            self._priorities = priority.lower_priority()
+        elif level < PRIORITY_LEVEL and self._priorities is not None:
+            logger.warning('throttle: restoring CPU and I/O priority')
+
+            priority.restore_priority(self._priorities)
+
+            self._priorities = None
+
+        if ( level >= DROP_LEVEL ) != ( self.level >= DROP_LEVEL ):
+            logger.warning('throttle: %s expensive collectors', 'skipping' if level >= DROP_LEVEL else 'resuming')
+
+        self.level = level
+
+    def allows(self, schedule):
+        '''True unless the collector with ``schedule`` is skipped.'''
+
+        return self.level < DROP_LEVEL or schedule.cost != 'expensive'
+
+    def stretch(self, interval):
+        '''``interval`` lengthened for the current level.'''
+
+        return interval * 2 ** max(self.level - DROP_LEVEL, 0)
+
+def start_throttle():
+    '''``Throttle`` from the parameters (or None if every budget is zero).'''
+
+    budgets = ( PARAMETERS['throttle.cpu_budget'], PARAMETERS['throttle.memory_budget'], PARAMETERS['throttle.write_budget'] )
+
+    if not any(budgets):
+        return None
+
+    logger.info('throttle budgets: cpu %s, rss %s bytes, write %s bytes/s', *budgets)
+
+    throttle = Throttle(*budgets)
+
+    REGISTRY.gauge('pmort_throttle_level', 'Current throttle level (0 is unthrottled).', lambda: throttle.level)
+
+    return throttle
@@ -61,16 +61,18 @@ PARAMS['classifiers'] = [
         'Natural Language :: English',
         'Operating System :: POSIX :: Linux',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.6',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.2',
-        'Programming Language :: Python :: 3.3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Programming Language :: Python :: Implementation :: CPython',
         'Topic :: System :: Logging',
         ]
 
+PARAMS['python_requires'] = '>=3.8'
+
 PARAMS['keywords'] = [
         'pmort',
         'post-mortem',
@@ -91,6 +93,8 @@ PARAMS['test_suite'] = 'nose.collector'
 PARAMS['entry_points'] = {
         'console_scripts': [
             'pmort = pmort:main',
+            'pmort-query = pmort.query:main',
+            'pmort-replay = pmort.replay:main',
             ],
         }
 
@@ -110,9 +114,6 @@ PARAMS['data_files'] = [
         ('share/doc/{P[name]}-{P[version]}'.format(P = PARAMS), [
             'README.rst',
             ]),
-        ('share/doc/{P[name]}-{P[version]}/conf/cron.daily'.format(P = PARAMS), [
-            'conf/cron.daily/pmort.cron',
-            ]),
         ('share/doc/{P[name]}-{P[version]}/conf/init.d'.format(P = PARAMS), [
             'conf/init.d/pmort.gentoo',
             ]),
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+import os
+import shutil
+import functools
+import gzip
+
+from pmort.archive import SegmentArchive
+from pmort.archive import read_record
+from pmort.archive import record_size
+from pmort.compression import CODECS
+
+class SegmentArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = os.path.join(os.path.sep, 'tmp', 'test_pmort')
+
+        os.makedirs(self.directory)
+        self.addCleanup(functools.partial(shutil.rmtree, self.directory))
+
+        self.a = SegmentArchive(self.directory, segment_size = 64)
+        self.addCleanup(self.a.close)
+
+    def test_append(self):
+        '''SegmentArchive.append'''
+
+        self.a.append(1358980643.0, 'first', b'first output')
+        self.a.append(1358980643.0, 'second', b'')
+
+        segments = self.a.segments()
+
+        self.assertEqual(1, len(segments))
+
+        records = list(self.a.records(segments[0]))
+
+        self.assertEqual([ 'first', 'second' ], [ _.name for _ in records ])
+        self.assertEqual(b'first output', read_record(records[0]))
+        self.assertEqual(b'', read_record(records[1]))
+
+    def test_record_size(self):
+        '''record_size counts the segment and index bytes'''
+
+        records = [ self.a.append(1358980643.0, 'first', b'first output'), self.a.append(1358980643.0, 'second', b'') ]
+
+        segment = self.a.segments()[0]
+
+        self.assertEqual(os.path.getsize(segment) + os.path.getsize(segment[:-4] + '.idx'), sum([ record_size(_) for _ in records ]))
+
+    def test_append_compressed(self):
+        '''SegmentArchive.append—compressed'''
+
+        record = self.a.append(1358980643.0, 'first', gzip.compress(b'first output'), CODECS['gzip'])
+
+        self.assertEqual(b'first output', read_record(record))
+
+    def test_rotate_same_timestamp(self):
+        '''SegmentArchive rotation within one timestamp'''
+
+        for _ in range(3):
+            self.a.append(1358980643.0, 'first', b'x' * 64)
+
+        segments = self.a.segments()
+
+        self.assertEqual(3, len(segments))
+        self.assertEqual([ 1, 1, 1 ], [ len(list(self.a.records(_))) for _ in segments ])
+        self.assertTrue(segments[1].endswith('_0001.seg'))
+        self.assertTrue(segments[2].endswith('_0002.seg'))
+
+    def test_rotate(self):
+        '''SegmentArchive rotation'''
+
+        for _ in range(3):
+            self.a.append(1358980643.0 + _, 'first', b'x' * 64)
+
+        self.assertEqual(3, len(self.a.segments()))
+
+        self.a.remove_segment(self.a.segments()[0])
+
+        self.assertEqual(2, len(self.a.segments()))
+        self.assertEqual(4, len(os.listdir(self.directory)))
@@ -5,14 +5,26 @@
 # pmort is freely distributable under the terms of an MIT-style license.
 # See COPYING or http://www.opensource.org/licenses/mit-license.php.
 
+import asyncio
 import logging
 import unittest
 import stat
 import os
 import shutil
+import signal
 import functools
+import io
+import mock
+import threading
 
 from pmort.collectors.execute import find_scripts
+from pmort.collectors.execute import execute_script
+from pmort.collectors.execute import execute_script_async
+from pmort.collectors.execute import clear_scripts_cache
+from pmort.collectors.execute import run_helper
+from pmort.collectors.execute import install_sighup_handler
+from pmort.executor import CollectorExecutor
+from pmort import output
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +57,7 @@ class FindScriptsTest(unittest.TestCase):
 
         os.makedirs(self.directory)
         self.addCleanup(functools.partial(shutil.rmtree, self.directory))
+        self.addCleanup(clear_scripts_cache)
 
         for file_content in file_contents:
             file_path = os.path.join(self.directory, file_content['name'])
@@ -67,3 +80,174 @@ class FindScriptsTest(unittest.TestCase):
         '''find_scripts'''
 
         self.assertEqual(self.expected, find_scripts(self.directory))
+
+    def test_find_scripts_cached(self):
+        '''find_scripts—cached'''
+
+        self.assertEqual(self.expected, find_scripts(self.directory))
+
+        with mock.patch('pmort.collectors.execute._scan_scripts') as mock_scan_scripts:
+            self.assertEqual(self.expected, find_scripts(self.directory))
+            self.assertFalse(mock_scan_scripts.called)
+
+    def test_find_scripts_modified(self):
+        '''find_scripts—modified'''
+
+        self.assertEqual(self.expected, find_scripts(self.directory))
+
+        file_path = os.path.join(self.directory, 'found_2.sh')
+
+        with open(file_path, 'w') as fh:
+            fh.write('#!/bin/sh\necho found')
+
+        os.chmod(file_path, os.stat(file_path)[stat.ST_MODE] | 0O111)
+
+        self.expected.append([ '/bin/sh', file_path ])
+
+        self.assertEqual(sorted(self.expected), sorted(find_scripts(self.directory)))
+
+class SighupHandlerTest(unittest.TestCase):
+    def test_install_sighup_handler(self):
+        '''install_sighup_handler clears the scripts cache and chains'''
+
+        previous = mock.Mock()
+
+        self.addCleanup(signal.signal, signal.SIGHUP, signal.signal(signal.SIGHUP, previous))
+
+        install_sighup_handler()
+
+        with mock.patch('pmort.collectors.execute.clear_scripts_cache') as mock_clear_scripts_cache:
+            os.kill(os.getpid(), signal.SIGHUP)
+
+        mock_clear_scripts_cache.assert_called_once_with()
+        self.assertEqual(1, previous.call_count)
+
+class ExecuteScriptTest(unittest.TestCase):
+    def setUp(self):
+        _ = mock.patch('pmort.collectors.execute.open_output')
+        self.mock_open_output = _.start()
+        self.addCleanup(_.stop)
+
+        self.output = io.BytesIO()
+        self.mock_open_output.return_value.__enter__.return_value = self.output
+
+    def test_execute_script(self):
+        '''execute_script'''
+
+        self.assertEqual('ok', execute_script([ '/bin/sh', '-c', 'echo found' ], 5))
+        self.mock_open_output.assert_called_once_with('sh -c echo found', None)
+        self.assertEqual(b'found\n', self.output.getvalue())
+
+    def test_execute_script_error(self):
+        '''execute_script—error'''
+
+        self.assertEqual('error', execute_script([ '/bin/sh', '-c', 'echo found; exit 1' ], 5))
+        self.assertEqual(b'found\n', self.output.getvalue())
+
+    def test_execute_script_timeout(self):
+        '''execute_script—timeout'''
+
+        self.assertEqual('timeout', execute_script([ '/bin/sh', '-c', 'echo partial; sleep 30' ], 0.5))
+        self.assertEqual(b'partial\n', self.output.getvalue())
+
+    def test_execute_script_timeout_closed_output(self):
+        '''execute_script—timeout after closing output'''
+
+        self.assertEqual('timeout', execute_script([ '/bin/sh', '-c', 'echo partial; exec >&-; sleep 30' ], 0.5))
+        self.assertEqual(b'partial\n', self.output.getvalue())
+
+    def test_execute_script_truncated(self):
+        '''execute_script—truncated'''
+
+        self.assertEqual('truncated', execute_script([ '/bin/sh', '-c', 'while true; do echo yes; done' ], 5, 1000))
+        self.assertEqual(1000, len(self.output.getvalue()))
+
+class ExecuteScriptAsyncTest(unittest.TestCase):
+    def test_execute_script_async(self):
+        '''execute_script_async'''
+
+        self.assertEqual(( 'ok', b'found\n' ), asyncio.run(execute_script_async([ '/bin/sh', '-c', 'echo found' ], 5)))
+
+    def test_execute_script_async_error(self):
+        '''execute_script_async—error'''
+
+        self.assertEqual(( 'error', b'found\n' ), asyncio.run(execute_script_async([ '/bin/sh', '-c', 'echo found; exit 1' ], 5)))
+
+    def test_execute_script_async_timeout(self):
+        '''execute_script_async—timeout'''
+
+        self.assertEqual(( 'timeout', b'partial\n' ), asyncio.run(execute_script_async([ '/bin/sh', '-c', 'echo partial; sleep 30' ], 0.5)))
+
+    def test_execute_script_async_timeout_closed_output(self):
+        '''execute_script_async—timeout after closing output'''
+
+        self.assertEqual(( 'timeout', b'partial\n' ), asyncio.run(execute_script_async([ '/bin/sh', '-c', 'echo partial; exec >&-; sleep 30' ], 0.5)))
+
+    def test_execute_script_async_truncated(self):
+        '''execute_script_async—truncated'''
+
+        status, output = asyncio.run(execute_script_async([ '/bin/sh', '-c', 'while true; do echo yes; done' ], 5, 1000))
+
+        self.assertEqual('truncated', status)
+        self.assertEqual(1000, len(output))
+
+class RunHelperTest(unittest.TestCase):
+    def setUp(self):
+        _ = mock.patch('pmort.collectors.execute.open_output')
+        self.mock_open_output = _.start()
+        self.addCleanup(_.stop)
+
+        self.output = io.BytesIO()
+        self.mock_open_output.return_value.__enter__.return_value = self.output
+
+        _ = mock.patch('pmort.collectors.execute.current_snapshot')
+        self.mock_current_snapshot = _.start()
+        self.addCleanup(_.stop)
+
+        _ = mock.patch('pmort.collectors.execute.get_helper')
+        self.mock_get_helper = _.start()
+        self.addCleanup(_.stop)
+
+    def test_run_helper_snapshot(self):
+        '''run_helper records the sample in the snapshot current at its start'''
+
+        self.mock_current_snapshot.return_value = 'first'
+
+        def sample():
+            self.mock_current_snapshot.return_value = 'second'
+
+            return 'ok', b'sample\n'
+
+        self.mock_get_helper.return_value.sample.side_effect = sample
+
+        run_helper([ '/bin/sh', 'helper.sh' ])
+
+        self.mock_open_output.assert_called_once_with('sh helper.sh', 'first')
+        self.assertEqual(b'sample\n', self.output.getvalue())
+
+    def test_run_helper_queued(self):
+        '''run_helper queued across begin_snapshot records in its cycle's snapshot'''
+
+        self.mock_get_helper.return_value.sample.return_value = ( 'ok', b'sample\n' )
+
+        executor = CollectorExecutor(1)
+        self.addCleanup(executor.shutdown)
+
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        self.addCleanup(setattr, output, '_snapshot', None)
+
+        collector = functools.partial(run_helper, [ '/bin/sh', 'helper.sh' ])
+        collector.writes_output = True
+
+        executor.submit('slow', release.wait)
+        executor.collect('sh helper.sh', collector, 'first')
+
+        output.begin_snapshot(snapshot = 'second')
+        self.mock_current_snapshot.return_value = 'second'
+
+        release.set()
+        executor.wait(5)
+
+        self.mock_open_output.assert_called_once_with('sh helper.sh', 'first')
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import logging
+import unittest
+import os
+import shutil
+import functools
+import mock
+
+from pmort.collectors.proc import ProcFile
+from pmort.collectors.proc import ProcessTable
+from pmort.collectors.proc import Process
+from pmort.collectors.proc import forest
+from pmort.collectors.proc import parse_meminfo
+from pmort.collectors.proc import parse_net_snmp
+from pmort.collectors.proc import parse_process_stat
+from pmort.collectors.proc import free_collector
+from pmort.collectors.proc import vmstat_collector
+from pmort.collectors.proc import ps_collector
+
+logger = logging.getLogger(__name__)
+
+class ProcFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = os.path.join(os.path.sep, 'tmp', 'test_pmort')
+
+        os.makedirs(self.directory)
+        self.addCleanup(functools.partial(shutil.rmtree, self.directory))
+
+        self.path = os.path.join(self.directory, 'stat')
+
+        with open(self.path, 'w') as fh:
+            fh.write('first')
+
+    def test_read_reuses_file(self):
+        '''ProcFile.read re-reads the same open file'''
+
+        proc_file = ProcFile(self.path)
+        self.addCleanup(proc_file.close)
+
+        self.assertEqual('first', proc_file.read())
+
+        fileno = proc_file._fh.fileno()
+
+        with open(self.path, 'r+') as fh:
+            fh.write('again')
+
+        self.assertEqual('again', proc_file.read())
+        self.assertEqual(fileno, proc_file._fh.fileno())
+
+    def test_read_missing(self):
+        '''ProcFile.read raises for a missing file'''
+
+        proc_file = ProcFile(os.path.join(self.directory, 'missing'))
+
+        self.assertRaises(IOError, proc_file.read)
+
+class ParseTest(unittest.TestCase):
+    def test_parse_meminfo(self):
+        '''parse_meminfo'''
+
+        self.assertEqual({ 'MemTotal': 2048, 'HugePages_Total': 0 }, parse_meminfo('MemTotal:       2048 kB\nHugePages_Total:       0\n'))
+
+    def test_parse_net_snmp(self):
+        '''parse_net_snmp'''
+
+        self.assertEqual([
+            ( 'Ip', [ ( 'Forwarding', '1' ), ( 'DefaultTTL', '64' ) ] ),
+            ( 'Udp', [ ( 'InDatagrams', '7' ) ] ),
+            ], parse_net_snmp('Ip: Forwarding DefaultTTL\nIp: 1 64\nUdp: InDatagrams\nUdp: 7\n'))
+
+    def test_parse_process_stat(self):
+        '''parse_process_stat with spaces and parentheses in the command'''
+
+        _ = parse_process_stat('42 (a (b) c) S 1 42 42 0 -1 4194560 100 0 0 0 7 3 0 0 20 0 2 0 500 8192 3 18446744073709551615', 0)
+
+        self.assertEqual(42, _.pid)
+        self.assertEqual(1, _.ppid)
+        self.assertEqual('[a (b) c]', _.command)
+        self.assertEqual('S', _.state)
+        self.assertEqual(10, _.cpu_ticks)
+        self.assertEqual(2, _.threads)
+        self.assertEqual(8, _.vsz)
+
+    def test_parse_process_stat_cmdline(self):
+        '''parse_process_stat with the command line'''
+
+        _ = parse_process_stat('42 (java) S 1 42 42 0 -1 4194560 100 0 0 0 7 3 0 0 20 0 2 0 500 8192 3 18446744073709551615', 0, 'java\0-jar\0worker.jar\0')
+
+        self.assertEqual('java -jar worker.jar', _.command)
+
+    def test_forest(self):
+        '''forest orders children under their parents'''
+
+        processes = [ Process(pid, ppid, 0, 'S', 1, 0, 0, 0, 0, str(pid)) for pid, ppid in ( ( 1, 0 ), ( 2, 0 ), ( 3, 1 ), ( 4, 2 ), ( 5, 3 ) ) ]
+
+        self.assertEqual([ ( 0, 1 ), ( 1, 3 ), ( 2, 5 ), ( 0, 2 ), ( 1, 4 ) ], [ ( depth, _.pid ) for depth, _ in forest(processes) ])
+
+@unittest.skipUnless(os.path.exists('/proc/self/stat'), 'requires /proc')
+class ProcCollectorsTest(unittest.TestCase):
+    def test_process_table(self):
+        '''ProcessTable finds this process and keeps its stat file open'''
+
+        table = ProcessTable(maximum_handles = 4096)
+        self.addCleanup(table.close)
+
+        processes = dict([ ( _.pid, _ ) for _ in table.processes() ])
+
+        self.assertIn(os.getpid(), processes)
+        self.assertEqual(os.getuid(), processes[os.getpid()].uid)
+
+        with open('/proc/self/cmdline', 'rb') as cmdline_fh:
+            self.assertEqual(cmdline_fh.read().rstrip(b'\0').replace(b'\0', b' ').decode('utf-8', 'replace'), processes[os.getpid()].command)
+        self.assertIn(os.getpid(), table._files)
+
+        self.assertIn(os.getpid(), [ _.pid for _ in table.processes() ])
+
+    def test_process_table_reused_pid(self):
+        '''ProcessTable reopens the files of a PID whose handles failed'''
+
+        table = ProcessTable(maximum_handles = 4096)
+        self.addCleanup(table.close)
+
+        table.processes()
+
+        stale = ProcFile('/proc/self/stat')
+        stale.read = mock.Mock(side_effect = OSError(3, 'No such process'))
+
+        table._files[os.getpid()] = ( stale, table._files[os.getpid()][1] )
+
+        self.assertIn(os.getpid(), [ _.pid for _ in table.processes() ])
+        self.assertIsNot(stale, table._files[os.getpid()][0])
+
+    def test_process_table_handle_limit(self):
+        '''ProcessTable keeps no more than maximum_handles files open'''
+
+        table = ProcessTable(maximum_handles = 1)
+        self.addCleanup(table.close)
+
+        table.processes()
+
+        self.assertEqual(1, len(table._files))
+
+    def test_collectors(self):
+        '''free, vmstat and ps collectors'''
+
+        self.assertTrue(free_collector().startswith(' ' * 5))
+        self.assertIn('Mem:', free_collector())
+
+        for _ in range(2):
+            self.assertEqual([ 'r', 'b', 'swpd' ], vmstat_collector().split()[:3])
+
+        self.assertIn('\n{0}\t'.format(os.getpid()), ps_collector())
+        self.assertTrue(ps_collector().startswith('#pmort-delta\tdelta\t'))
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+
+from pmort.helper import Helper
+
+COUNTER = 'n=0; while read tick; do n=$((n + 1)); echo "sample $n"; echo "pid $$"; echo "#pmort-end"; done'
+
+class HelperTest(unittest.TestCase):
+    def helper(self, script, **kwargs):
+        _ = Helper([ '/bin/sh', '-c', script ], **kwargs)
+        self.addCleanup(_.close)
+
+        return _
+
+    def test_sample(self):
+        '''Helper samples one process per tick'''
+
+        helper = self.helper(COUNTER, timeout = 5)
+
+        status, first = helper.sample()
+        self.assertEqual('ok', status)
+        self.assertTrue(first.startswith(b'sample 1\n'))
+
+        status, second = helper.sample()
+        self.assertEqual('ok', status)
+        self.assertTrue(second.startswith(b'sample 2\n'))
+
+        self.assertEqual(first.split(b'\n')[1], second.split(b'\n')[1])
+        self.assertEqual(0, helper.restarts)
+
+    def test_restart(self):
+        '''Helper restarts an exited helper after the delay'''
+
+        now = [ 0.0 ]
+
+        helper = self.helper('read tick; echo once; echo "#pmort-end"', timeout = 5, restart_delay = 10.0, clock = lambda: now[0])
+
+        self.assertEqual(( 'ok', b'once\n' ), helper.sample())
+        self.assertEqual('error', helper.sample()[0])
+        self.assertEqual(( 'waiting', b'' ), helper.sample())
+
+        now[0] = 10.0
+
+        self.assertEqual(( 'ok', b'once\n' ), helper.sample())
+        self.assertEqual(1, helper.restarts)
+
+    def test_timeout(self):
+        '''Helper kills a helper not answering in time'''
+
+        helper = self.helper('while read tick; do echo partial; sleep 30; done', timeout = 0.5, restart_delay = 0.0)
+
+        self.assertEqual(( 'timeout', b'partial\n' ), helper.sample())
+        self.assertIsNone(helper.process)
+
+    def test_truncated(self):
+        '''Helper kills a helper writing too much'''
+
+        helper = self.helper('read tick; while true; do echo yes; done', timeout = 5, maximum_size = 1000)
+
+        status, output = helper.sample()
+
+        self.assertEqual('truncated', status)
+        self.assertEqual(1000, len(output))
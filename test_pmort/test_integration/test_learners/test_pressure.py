@@ -0,0 +1,76 @@
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+import mock
+import os
+import functools
+import shutil
+
+from pmort.learners.pressure import PressureLearner
+from pmort.learners.pressure import parse_weights
+
+class TestPressureLearner(unittest.TestCase):
+    def setUp(self):
+        self.directory = os.path.join(os.path.sep, 'tmp', 'test_pmort')
+
+        os.makedirs(os.path.join(self.directory, 'pressure'))
+        self.addCleanup(functools.partial(shutil.rmtree, self.directory))
+
+        _ = mock.patch('pmort.learners.pressure.PROC', self.directory)
+        _.start()
+        self.addCleanup(_.stop)
+
+        _ = mock.patch('pmort.learners.pressure.PARAMETERS')
+        mock_parameters = _.start()
+        self.addCleanup(_.stop)
+
+        mock_parameters.__getitem__.side_effect = lambda _: {
+                'learner.minimum_interval': 1,
+                'learner.maximum_interval': 601,
+                'learner.pressure_weights': 'cpu=1, memory=2, io=2, available=1, swap=2, queue=1',
+                }[_]
+
+        self.write('pressure/cpu', 'some avg10=10.00 avg60=0.00 avg300=0.00 total=0\n')
+        self.write('pressure/memory', 'some avg10=0.00 avg60=0.00 avg300=0.00 total=0\nfull avg10=0.00 avg60=0.00 avg300=0.00 total=0\n')
+        self.write('meminfo', 'MemTotal: 1000 kB\nMemFree: 100 kB\nMemAvailable: 800 kB\n')
+        self.write('vmstat', 'pswpin 0\npswpout 0\n')
+        self.write('diskstats', '   8       0 sda 1 0 0 0 1 0 0 0 0 0 0\n')
+
+        self.now = [ 0.0 ]
+
+        self.l = PressureLearner(clock = lambda: self.now[0])
+
+    def write(self, name, contents):
+        with open(os.path.join(self.directory, name), 'w') as fh:
+            fh.write(contents)
+
+    def test_parse_weights(self):
+        '''parse_weights'''
+
+        self.assertEqual({ 'cpu': 1.0, 'io': 0.5 }, parse_weights('cpu=1, io=0.5, bogus'))
+
+    def test_time(self):
+        '''PressureLearner follows the most urgent signal'''
+
+        self.assertEqual(481, self.l.time())
+        self.assertEqual({ 'cpu': 0.1, 'memory': 0.0, 'available': 0.2 }, dict([ ( name, round(_, 6) ) for name, _ in self.l.signals.items() ]))
+        self.assertFalse(self.l.anomalous())
+
+        self.now[0] += 10
+
+        self.write('vmstat', 'pswpin 2048\npswpout 3072\n')
+
+        self.assertEqual(1, self.l.time())
+        self.assertEqual(0.5, self.l.signals['swap'])
+        self.assertTrue(self.l.anomalous())
+
+        self.now[0] += 10
+
+        self.write('diskstats', '   8       0 sda 1 0 0 0 1 0 0 0 4 0 40000\n')
+
+        self.assertEqual(301, self.l.time())
+        self.assertEqual(0.5, self.l.signals['queue'])
+        self.assertNotIn('io', self.l.signals)
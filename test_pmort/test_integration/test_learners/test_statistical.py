@@ -0,0 +1,45 @@
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+import mock
+import os
+import functools
+import shutil
+
+from pmort.learners.statistical import StatisticalLearner
+
+class TestStatisticalCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.directory = os.path.join(os.path.sep, 'tmp', 'test_pmort')
+
+        os.makedirs(self.directory)
+        self.addCleanup(functools.partial(shutil.rmtree, self.directory))
+
+        _ = mock.patch.object(StatisticalLearner, 'cache_file_name', new_callable = mock.PropertyMock)
+        mock_cache_file_name = _.start()
+        self.addCleanup(_.stop)
+
+        mock_cache_file_name.return_value = os.path.join(self.directory, 'learned', 'statistical.json')
+
+        self.now = [ 0.0 ]
+
+    def test_checkpoint(self):
+        '''StatisticalLearner saves and restores its statistics'''
+
+        learner = StatisticalLearner(clock = lambda: self.now[0])
+
+        for _ in range(10):
+            self.now[0] += 60
+            learner.learn()
+
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'learned', 'statistical.json')))
+
+        learner.checkpoint()
+
+        restored = StatisticalLearner(clock = lambda: self.now[0])
+        restored.learn()
+
+        self.assertEqual(11, restored.statistics.count)
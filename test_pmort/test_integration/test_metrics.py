@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+import os
+import shutil
+import socket
+import functools
+import mock
+
+from pmort.metrics import start_metrics
+from pmort.executor import CollectorExecutor
+
+class MetricsEndpointTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = os.path.join(os.path.sep, 'tmp', 'test_pmort')
+
+        os.makedirs(self.directory)
+        self.addCleanup(functools.partial(shutil.rmtree, self.directory))
+
+        self.path = os.path.join(self.directory, 'metrics.sock')
+
+    def test_unix_socket(self):
+        '''start_metrics serves collector metrics on a Unix socket'''
+
+        executor = CollectorExecutor(1)
+        self.addCleanup(executor.shutdown)
+
+        def failing():
+            raise RuntimeError('failing')
+
+        executor.submit('failing', failing)
+        executor.wait()
+
+        with mock.patch('pmort.metrics.PARAMETERS', { 'metrics.listen': self.path }):
+            server = start_metrics()
+
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        client = socket.socket(socket.AF_UNIX)
+        self.addCleanup(client.close)
+
+        client.connect(self.path)
+        client.sendall(b'GET /metrics HTTP/1.0\r\n\r\n')
+
+        response = b''.join(iter(functools.partial(client.recv, 4096), b'')).decode('utf-8')
+
+        self.assertTrue(response.startswith('HTTP/1.0 200'))
+        self.assertIn('pmort_collector_errors_total{collector="failing"} 1', response)
+        self.assertIn('pmort_collector_duration_seconds_count{collector="failing"} 1', response)
+
+    def test_unix_socket_not_socket(self):
+        '''start_metrics leaves a file that isn't a socket alone'''
+
+        with open(self.path, 'w') as path_fh:
+            path_fh.write('data')
+
+        with mock.patch('pmort.metrics.PARAMETERS', { 'metrics.listen': self.path }):
+            self.assertIsNone(start_metrics())
+
+        with open(self.path, 'r') as path_fh:
+            self.assertEqual('data', path_fh.read())
+
+    def test_ipv6(self):
+        '''start_metrics serves on a bracketed IPv6 address'''
+
+        try:
+            with socket.socket(socket.AF_INET6) as probe:
+                probe.bind(( '::1', 0 ))
+        except (OSError, AttributeError):
+            self.skipTest('requires IPv6')
+
+        with mock.patch('pmort.metrics.PARAMETERS', { 'metrics.listen': '[::1]:0' }):
+            server = start_metrics()
+
+        self.assertIsNotNone(server)
+
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        self.assertEqual(socket.AF_INET6, server.socket.family)
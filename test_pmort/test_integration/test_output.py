@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+import datetime
+import os
+import shutil
+import functools
+import mock
+
+from pmort.output import Snapshot
+from pmort.output import find_output
+from pmort.output import read_output
+from pmort.output import write_records
+from pmort.output import read_records
+from pmort.output import snapshot_time
+from pmort.series import read_series
+from pmort.compression import CODECS
+from pmort.archive import read_record
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = os.path.join(os.path.sep, 'tmp', 'test_pmort')
+
+        os.makedirs(self.directory)
+        self.addCleanup(functools.partial(shutil.rmtree, self.directory))
+
+        self.s = Snapshot(datetime.datetime(2013, 1, 23, 22, 37, 23), self.directory)
+
+    def test_write(self):
+        '''Snapshot.write'''
+
+        self.s.write('first', 'first output')
+        self.s.write('second', 'second output')
+
+        self.assertEqual([ '20130123223723' ], os.listdir(self.directory))
+
+        with open(os.path.join(self.directory, '20130123223723', 'second.log'), 'r') as fh:
+            self.assertEqual('second output', fh.read())
+
+    def test_write_subsecond(self):
+        '''Snapshot.write—cycles within one second'''
+
+        self.s.write('first', 'first output')
+
+        _ = Snapshot(datetime.datetime(2013, 1, 23, 22, 37, 23, 500000), self.directory)
+        _.write('first', 'second output')
+
+        self.assertEqual([ '20130123223723', '20130123223723.500000' ], sorted(os.listdir(self.directory)))
+        self.assertEqual('first output', read_output(self.s.directory, 'first'))
+        self.assertEqual(datetime.datetime(2013, 1, 23, 22, 37, 23, 500000), snapshot_time(os.path.basename(_.directory)))
+
+    def test_commit(self):
+        '''Snapshot.commit'''
+
+        self.s.write('first', 'first output')
+
+        self.assertFalse(os.path.lexists(os.path.join(self.directory, 'current')))
+
+        self.s.commit()
+
+        self.assertEqual(os.path.join(self.directory, '20130123223723'), os.readlink(os.path.join(self.directory, 'current')))
+
+        _ = Snapshot(datetime.datetime(2013, 1, 23, 22, 37, 24), self.directory)
+        _.write('first', 'first output')
+        _.commit()
+
+        self.assertEqual(os.path.join(self.directory, '20130123223724'), os.readlink(os.path.join(self.directory, 'current')))
+        self.assertEqual([ '20130123223723', '20130123223724', 'current' ], sorted(os.listdir(self.directory)))
+
+    def test_commit_late(self):
+        '''Snapshot.commit—first write after commit'''
+
+        current = os.path.join(self.directory, 'current')
+
+        self.s.commit()
+        self.assertFalse(os.path.lexists(current))
+
+        self.s.write('late', 'late output')
+        self.assertEqual(os.path.join(self.directory, '20130123223723'), os.readlink(current))
+
+        _ = Snapshot(datetime.datetime(2013, 1, 23, 22, 37, 22), self.directory)
+        _.commit()
+        _.write('older', 'older output')
+
+        self.assertEqual(os.path.join(self.directory, '20130123223723'), os.readlink(current))
+
+    @mock.patch('pmort.output.retention.account')
+    def test_account(self, mock_account):
+        '''Snapshot accounts every write'''
+
+        self.s.write('first', 'first output')
+        self.s.commit()
+        self.s.write('late', 'late output')
+
+        self.assertEqual([ mock.call(os.path.join(self.directory, '20130123223723'), len('first output')), mock.call(os.path.join(self.directory, '20130123223723'), len('late output')) ], mock_account.call_args_list)
+
+    def test_compressed(self):
+        '''Snapshot.write—compressed'''
+
+        for codec in CODECS.keys():
+            _ = Snapshot(datetime.datetime(2013, 1, 23, 22, 37, 23), self.directory, codec)
+            _.write(codec, codec + ' output')
+
+            directory = os.path.join(self.directory, '20130123223723')
+
+            self.assertTrue(find_output(directory, codec).endswith(CODECS[codec].extension))
+            self.assertEqual(codec + ' output', read_output(directory, codec))
+
+    def test_segments(self):
+        '''Snapshot.write—segments'''
+
+        _ = Snapshot(datetime.datetime(2013, 1, 23, 22, 37, 23), self.directory, 'gzip', storage = 'segments')
+        _.write('first', 'first output')
+        _.commit()
+
+        self.assertEqual([ 'segments' ], os.listdir(self.directory))
+
+        records = list(_.archive.records(_.archive.segments()[0]))
+
+        self.assertEqual([ 'first' ], [ record.name for record in records ])
+        self.assertEqual(b'first output', read_record(records[0]))
+
+        _.archive.close()
+
+    def test_write_records(self):
+        '''write_records and read_records'''
+
+        write_records('load_average', { 'load1': 0.5, 'load5': 0.25, 'load15': 0.125 }, self.s)
+
+        directory = os.path.join(self.directory, '20130123223723')
+
+        self.assertEqual([ { 'load1': 0.5, 'load5': 0.25, 'load15': 0.125 } ], read_records(directory, 'load_average'))
+        self.assertEqual([ 0.25 ], list(read_series(self.directory, 'load_average.load5')[1]))
+
+        self.s.write('text', 'text output')
+
+        self.assertRaises(ValueError, read_records, directory, 'text')
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+import datetime
+import os
+import shutil
+import functools
+import time
+
+from pmort.output import Snapshot
+from pmort.query import SpoolIndex
+from pmort.query import read_sample
+from pmort.query import read_samples
+from pmort.delta import DeltaEncoder
+
+class SpoolIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = os.path.join(os.path.sep, 'tmp', 'test_pmort')
+
+        os.makedirs(self.directory)
+        self.addCleanup(functools.partial(shutil.rmtree, self.directory))
+
+        self.times = [ datetime.datetime(2013, 1, 23, 3, _) for _ in ( 5, 15, 30 ) ]
+
+        for timestamp in self.times:
+            _ = Snapshot(timestamp, self.directory, 'gzip', storage = 'directory')
+            _.write('load_average', timestamp.strftime('%H:%M'))
+            _.write('execute', 'ran 0 execute plugins')
+            _.commit()
+
+            _ = Snapshot(timestamp, self.directory, 'none', storage = 'segments')
+            _.write('ps', timestamp.strftime('%H:%M'))
+            _.archive.close()
+
+        self.i = SpoolIndex(self.directory, os.path.join(self.directory, 'index.sqlite'))
+        self.addCleanup(self.i.close)
+
+        self.i.update()
+
+    def test_samples(self):
+        '''SpoolIndex.samples'''
+
+        start = time.mktime(datetime.datetime(2013, 1, 23, 3, 10).timetuple())
+        end = time.mktime(datetime.datetime(2013, 1, 23, 3, 25).timetuple())
+
+        samples = self.i.samples(start, end, [ 'load_average', 'ps' ])
+
+        self.assertEqual([ 'load_average', 'ps' ], [ _.name for _ in samples ])
+        self.assertEqual([ b'03:15', b'03:15' ], [ read_sample(_) for _ in samples ])
+
+    def test_update(self):
+        '''SpoolIndex.update'''
+
+        self.assertEqual(9, len(self.i.samples()))
+
+        self.i.update()
+
+        self.assertEqual(9, len(self.i.samples()))
+
+        shutil.rmtree(os.path.join(self.directory, '20130123030500'))
+
+        self.i.update()
+
+        self.assertEqual(7, len(self.i.samples()))
+        self.assertEqual([ 'execute', 'load_average', 'ps' ], self.i.names())
+
+class ReadSamplesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = os.path.join(os.path.sep, 'tmp', 'test_pmort')
+
+        os.makedirs(self.directory)
+        self.addCleanup(functools.partial(shutil.rmtree, self.directory))
+
+        encoder = DeltaEncoder([ 'pid', 'command' ], keyframe_interval = 3)
+
+        tables = (
+                [ ( 1, 'init' ) ],
+                [ ( 1, 'init' ), ( 2, 'bash' ) ],
+                [ ( 2, 'sh' ) ],
+                [ ( 2, 'sh' ), ( 3, 'ps' ) ],
+                )
+
+        for minute, table in zip(( 5, 6, 7, 8 ), tables):
+            _ = Snapshot(datetime.datetime(2013, 1, 23, 3, minute), self.directory, 'none', storage = 'directory')
+            _.write('ps', encoder.encode(table))
+            _.commit()
+
+        self.i = SpoolIndex(self.directory, os.path.join(self.directory, 'index.sqlite'))
+        self.addCleanup(self.i.close)
+
+        self.i.update()
+
+    def test_read_samples(self):
+        '''read_samples reconstructs from the keyframe before the range'''
+
+        start = time.mktime(datetime.datetime(2013, 1, 23, 3, 7).timetuple())
+
+        self.assertEqual([
+            b'pid  command\n2    sh\n',
+            b'pid  command\n2    sh\n3    ps\n',
+            ], [ _[1] for _ in read_samples(self.i, self.i.samples(start)) ])
+
+    def test_read_samples_missing(self):
+        '''read_samples leaves out samples until a keyframe after a missing one'''
+
+        shutil.rmtree(os.path.join(self.directory, '20130123030600'))
+
+        self.i.update()
+
+        self.assertEqual([
+            b'pid  command\n1    init\n',
+            b'pid  command\n2    sh\n3    ps\n',
+            ], [ _[1] for _ in read_samples(self.i, self.i.samples()) ])
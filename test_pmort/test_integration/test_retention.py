@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+import os
+import shutil
+import functools
+import time
+
+from pmort.retention import RetentionTracker
+from pmort.retention import spool_entries
+
+class RetentionTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = os.path.join(os.path.sep, 'tmp', 'test_pmort')
+
+        os.makedirs(self.directory)
+        self.addCleanup(functools.partial(shutil.rmtree, self.directory))
+
+        now = time.time()
+
+        for age, name in enumerate([ '20130123223725', '20130123223724', '20130123223723' ]):
+            os.mkdir(os.path.join(self.directory, name))
+
+            with open(os.path.join(self.directory, name, 'collector.log'), 'w') as fh:
+                fh.write('x' * 100)
+
+            os.utime(os.path.join(self.directory, name), ( now - age * 3600, now - age * 3600 ))
+
+    def test_scan(self):
+        '''RetentionTracker.scan'''
+
+        t = RetentionTracker(self.directory, 0, 0)
+        t.scan()
+
+        self.assertEqual(300, t.total)
+
+    def test_evict_size(self):
+        '''RetentionTracker.evict—size'''
+
+        t = RetentionTracker(self.directory, 150, 0)
+        t.scan()
+
+        self.assertEqual(2, t.evict())
+        self.assertEqual([ '20130123223725' ], os.listdir(self.directory))
+        self.assertEqual(100, t.total)
+
+    def test_evict_age(self):
+        '''RetentionTracker.evict—age'''
+
+        t = RetentionTracker(self.directory, 0, 5400)
+        t.scan()
+
+        self.assertEqual(1, t.evict())
+        self.assertEqual([ '20130123223724', '20130123223725' ], sorted(os.listdir(self.directory)))
+
+    def test_account(self):
+        '''RetentionTracker.account'''
+
+        t = RetentionTracker(self.directory, 350, 0)
+        t.scan()
+
+        self.assertEqual(0, t.evict())
+
+        t.account(os.path.join(self.directory, '20130123223726'), 100)
+
+        self.assertEqual(400, t.total)
+        self.assertEqual(1, t.evict())
+        self.assertFalse(os.path.exists(os.path.join(self.directory, '20130123223723')))
+
+    def test_account_reorders(self):
+        '''RetentionTracker.account—newer writes reorder entries'''
+
+        t = RetentionTracker(self.directory, 250, 0)
+        t.scan()
+
+        for _ in range(100):
+            t.account(os.path.join(self.directory, '20130123223726'), 0)
+
+        t.account(os.path.join(self.directory, '20130123223723'), 0)
+
+        self.assertEqual(1, t.evict())
+        self.assertFalse(os.path.exists(os.path.join(self.directory, '20130123223724')))
+        self.assertLessEqual(len(t._heap), 2 * len(t._entries) + 64)
+
+    def test_spool_entries_segments(self):
+        '''spool_entries finds segments rotated within one snapshot'''
+
+        os.mkdir(os.path.join(self.directory, 'segments'))
+
+        for name in ( '20130123223723000000', '20130123223723000000_0001' ):
+            for extension in ( '.seg', '.idx' ):
+                open(os.path.join(self.directory, 'segments', name + extension), 'w').close()
+
+        self.assertEqual([ os.path.join(self.directory, 'segments', _) for _ in ( '20130123223723000000.seg', '20130123223723000000_0001.seg' ) ], sorted([ _ for _ in spool_entries(self.directory) if _.endswith('.seg') ]))
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+import datetime
+import os
+import shutil
+import functools
+import mock
+
+from pmort.ring import RingBuffer
+from pmort.ring import RingSnapshot
+from pmort.ring import RingCapture
+from pmort.ring import TriggerMonitor
+from pmort.output import Snapshot
+from pmort.output import read_output
+from pmort.delta import DeltaDecoder
+from pmort.delta import DeltaEncoder
+
+class RingBufferTest(unittest.TestCase):
+    def test_append_maximum_size(self):
+        '''RingBuffer.append drops the oldest output beyond maximum_size'''
+
+        ring = RingBuffer(60, 10)
+
+        now = datetime.datetime.now()
+
+        for name in ( 'a', 'b', 'c' ):
+            ring.append(now, name, b'12345')
+
+        self.assertEqual([ 'b', 'c' ], [ _[1] for _ in ring.drain() ])
+        self.assertEqual(0, ring.size)
+
+    def test_append_duration(self):
+        '''RingBuffer.append drops output older than duration'''
+
+        ring = RingBuffer(60, 1024)
+
+        ring.append(datetime.datetime.now() - datetime.timedelta(seconds = 120), 'old', b'old')
+        ring.append(datetime.datetime.now(), 'new', b'new')
+
+        self.assertEqual([ 'new' ], [ _[1] for _ in ring.drain() ])
+
+    def test_append_delta(self):
+        '''RingBuffer.append rewrites the oldest delta table kept as a keyframe'''
+
+        ring = RingBuffer(60, 1024)
+
+        encoder = DeltaEncoder([ 'pid', 'state' ], 100)
+        tables = [ [ ( 1, 'S' ), ( 2, 'R' ) ], [ ( 1, 'R' ), ( 2, 'R' ) ], [ ( 1, 'R' ), ( 3, 'S' ) ], [ ( 1, 'S' ), ( 3, 'S' ) ] ]
+
+        now = datetime.datetime.now()
+
+        for age, table in zip(( 300, 300, 0, 0 ), tables):
+            ring.append(now - datetime.timedelta(seconds = age), 'ps', encoder.encode(table).encode('utf-8'))
+
+        entries = ring.drain()
+
+        self.assertTrue(entries[0][2].startswith(b'#pmort-delta\tkeyframe\t2\n'))
+
+        decoder = DeltaDecoder()
+
+        self.assertEqual([ sorted([ ( str(pid), state ) for pid, state in _ ]) for _ in tables[2:] ], [ sorted(decoder.decode(_[2])) for _ in entries ])
+
+class TriggerMonitorTest(unittest.TestCase):
+    def test_check_signal(self):
+        '''TriggerMonitor.check reports a signal once'''
+
+        monitor = TriggerMonitor([ 'signal' ], 0)
+
+        self.assertIsNone(monitor.check())
+
+        monitor.signal()
+
+        self.assertEqual('signal', monitor.check())
+        self.assertIsNone(monitor.check())
+
+    def test_check_load(self):
+        '''TriggerMonitor.check reports load above the threshold'''
+
+        with mock.patch('os.getloadavg', return_value = ( 9.0, 1.0, 1.0 )):
+            self.assertEqual('load', TriggerMonitor([ 'load' ], 8.0).check())
+            self.assertIsNone(TriggerMonitor([ 'load' ], 10.0).check())
+
+class RingCaptureTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = os.path.join(os.path.sep, 'tmp', 'test_pmort')
+
+        os.makedirs(self.directory)
+        self.addCleanup(functools.partial(shutil.rmtree, self.directory))
+
+        self.now = [ 0.0 ]
+
+        self.monitor = TriggerMonitor([ 'signal' ], 0)
+        self.capture = RingCapture(RingBuffer(600, 1024), self.monitor, 10, clock = lambda: self.now[0])
+
+        self.snapshot = functools.partial(Snapshot, output_directory = self.directory, codec = 'none', storage = 'directory')
+
+    def test_capture(self):
+        '''RingCapture buffers until triggered and writes out while lingering'''
+
+        start = datetime.datetime.now().replace(microsecond = 0)
+
+        times = [ start + datetime.timedelta(seconds = _) for _ in range(4) ]
+        names = [ _.strftime('%Y%m%d%H%M%S') for _ in times ]
+
+        with mock.patch('pmort.output.Snapshot', self.snapshot):
+            _ = self.capture.begin_snapshot(times[0])
+            self.assertIsInstance(_, RingSnapshot)
+            _.write('load_average', '1.0')
+            _.commit()
+
+            _ = self.capture.begin_snapshot(times[1])
+            _.write('load_average', '2.0')
+            _.commit()
+
+            self.assertEqual([], os.listdir(self.directory))
+
+            self.monitor.signal()
+
+            _ = self.capture.begin_snapshot(times[2])
+            self.assertNotIsInstance(_, RingSnapshot)
+            _.write('load_average', '3.0')
+            _.commit()
+
+            self.now[0] = 11.0
+
+            _ = self.capture.begin_snapshot(times[3])
+            self.assertIsInstance(_, RingSnapshot)
+
+        self.assertEqual(names[:3] + [ 'current' ], sorted(os.listdir(self.directory)))
+        self.assertEqual('2.0', read_output(os.path.join(self.directory, names[1]), 'load_average'))
+
+    def test_capture_keyframes(self):
+        '''RingCapture starts buffering delta tables with keyframes'''
+
+        encoder = DeltaEncoder([ 'pid' ], 100)
+        encoder.encode([ ( 1, ) ])
+
+        with mock.patch('pmort.output.Snapshot', self.snapshot):
+            self.capture.begin_snapshot()
+
+            self.assertTrue(encoder.encode([ ( 1, ) ]).startswith('#pmort-delta\tkeyframe'))
+
+            self.capture.begin_snapshot()
+
+            self.assertTrue(encoder.encode([ ( 1, ) ]).startswith('#pmort-delta\tdelta'))
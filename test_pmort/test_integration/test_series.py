@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+import datetime
+import os
+import shutil
+import time
+import functools
+
+from pmort.series import SeriesWriter
+from pmort.series import read_series
+from pmort.series import metrics
+from pmort.series import expire
+
+class SeriesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = os.path.join(os.path.sep, 'tmp', 'test_pmort')
+
+        os.makedirs(self.directory)
+        self.addCleanup(functools.partial(shutil.rmtree, self.directory))
+
+        self.writer = SeriesWriter(self.directory)
+        self.addCleanup(self.writer.close)
+
+        self.midnight = time.mktime(datetime.datetime(2013, 1, 24).timetuple())
+
+    def test_read_series(self):
+        '''read_series returns a time range across days'''
+
+        for second in range(-30, 30):
+            self.assertEqual(2, self.writer.append_record('load_average', self.midnight + second, { 'load1': float(second), 'load5': second, 'name': 'x', 'ok': True }))
+
+        self.assertEqual([ 'load_average.load1', 'load_average.load5' ], metrics(self.directory))
+        self.assertEqual([ '20130123', '20130124' ], sorted(os.listdir(os.path.join(self.directory, 'series'))))
+
+        timestamps, values = read_series(self.directory, 'load_average.load1', self.midnight - 2, self.midnight + 2)
+
+        self.assertEqual([ self.midnight + _ for _ in range(-2, 3) ], list(timestamps))
+        self.assertEqual([ -2.0, -1.0, 0.0, 1.0, 2.0 ], list(values))
+
+        self.assertEqual(60, len(read_series(self.directory, 'load_average.load5')[1]))
+        self.assertEqual(0, len(read_series(self.directory, 'missing')[1]))
+
+    def test_partial_sample(self):
+        '''SeriesWriter drops a partially written sample'''
+
+        self.writer.append('metric', self.midnight, 1.0)
+        self.writer.close()
+
+        path = os.path.join(self.directory, 'series', '20130124', 'metric.series')
+
+        with open(path, 'ab') as fh:
+            fh.write(b'\x00' * 5)
+
+        self.writer.append('metric', self.midnight + 1, 2.0)
+
+        self.assertEqual([ 1.0, 2.0 ], list(read_series(self.directory, 'metric')[1]))
+
+    def test_expire(self):
+        '''expire removes days older than the maximum age'''
+
+        self.writer.append('metric', self.midnight - 1, 1.0)
+        self.writer.append('metric', self.midnight + 1, 2.0)
+        self.writer.close()
+
+        self.assertEqual(0, expire(self.directory, 3600, self.midnight + 1800))
+        self.assertEqual(1, expire(self.directory, 3600, self.midnight + 7200))
+
+        self.assertEqual([ 2.0 ], list(read_series(self.directory, 'metric')[1]))
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+
+from pmort.collectors import Schedule
+from pmort.collectors import schedule
+from pmort.collectors import parse_schedules
+from pmort.collectors import parse_cost_multipliers
+from pmort.collectors.execute import parse_script_options
+
+class ScheduleTest(unittest.TestCase):
+    def setUp(self):
+        def collector():
+            pass
+
+        collector.cost = 'cheap'
+
+        self.collector = collector
+
+    def test_parse_schedules(self):
+        '''parse_schedules'''
+
+        self.assertEqual({
+            'load_average': { 'interval': '5' },
+            'bash ps.sh': { 'cost': 'expensive', 'learner': 'linear' },
+            }, parse_schedules('load_average: interval=5; bash ps.sh: cost=expensive, learner=linear;'))
+
+    def test_parse_cost_multipliers(self):
+        '''parse_cost_multipliers'''
+
+        self.assertEqual({ 'cheap': 1.0, 'expensive': 5.0 }, parse_cost_multipliers('cheap=1, expensive=5'))
+
+    def test_parse_cost_multipliers_invalid(self):
+        '''parse_cost_multipliers—invalid'''
+
+        with self.assertRaisesRegex(ValueError, 'expensive'):
+            parse_cost_multipliers('cheap=1, expensive=lots')
+
+    def test_parse_schedules_invalid_interval(self):
+        '''parse_schedules—invalid interval'''
+
+        self.assertEqual({ 'x': { 'cost': 'cheap' } }, parse_schedules('x: interval=fast, cost=cheap'))
+
+    def test_parse_script_options(self):
+        '''parse_script_options'''
+
+        self.assertEqual({ 'cost': 'expensive', 'interval': '300' }, parse_script_options('# pmort: cost=expensive interval=300\n'))
+        self.assertEqual(None, parse_script_options('echo pmort: cost=expensive\n'))
+        self.assertEqual({ 'cost': 'expensive' }, parse_script_options('# pmort: cost=expensive interval=5m\n'))
+
+    def test_schedule_declared(self):
+        '''schedule—declared'''
+
+        self.assertEqual(Schedule(None, 'cheap', None), schedule('collector', self.collector, {}))
+
+    def test_schedule_overridden(self):
+        '''schedule—overridden'''
+
+        self.assertEqual(Schedule(5.0, 'cheap', 'linear'), schedule('collector', self.collector, { 'collector': { 'interval': '5', 'learner': 'linear' } }))
+
+    def test_schedule_invalid_interval(self):
+        '''schedule—invalid interval'''
+
+        self.collector.interval = '5m'
+
+        self.assertEqual(Schedule(None, 'cheap', None), schedule('collector', self.collector, {}))
+        self.assertEqual(Schedule(None, 'cheap', None), schedule('collector', self.collector, { 'collector': { 'interval': '-1' } }))
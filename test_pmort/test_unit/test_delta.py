@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+
+from pmort.delta import DeltaEncoder
+from pmort.delta import DeltaDecoder
+from pmort.delta import is_encoded
+
+class DeltaTest(unittest.TestCase):
+    def setUp(self):
+        self.encoder = DeltaEncoder([ 'pid', 'state', 'command' ], keyframe_interval = 3)
+        self.decoder = DeltaDecoder()
+
+        self.tables = [
+                [ ( 1, 'S', 'init' ), ( 42, 'R', 'bash' ) ],
+                [ ( 1, 'S', 'init' ), ( 42, 'S', 'bash' ), ( 43, 'R', 'a\tb\\n' ) ],
+                [ ( 42, 'S', 'bash' ), ( 43, 'S', 'a\tb\\n' ) ],
+                [ ( 42, 'S', 'bash' ) ],
+                ]
+
+    def rows(self, table):
+        return [ tuple([ str(_) for _ in row ]) for row in table ]
+
+    def test_encode(self):
+        '''DeltaEncoder.encode writes keyframes every keyframe_interval'''
+
+        encoded = [ self.encoder.encode(_) for _ in self.tables ]
+
+        self.assertTrue(all([ is_encoded(_) for _ in encoded ]))
+        self.assertEqual([ 'keyframe', 'delta', 'delta', 'keyframe' ], [ _.split('\t')[1] for _ in encoded ])
+        self.assertEqual('#pmort-delta\tdelta\t1\n~\t42\tstate=S\n+\t43\tR\ta\\tb\\\\n\n', encoded[1])
+        self.assertEqual('#pmort-delta\tdelta\t2\n~\t43\tstate=S\n-\t1\n', encoded[2])
+
+    def test_decode(self):
+        '''DeltaDecoder.decode reconstructs every table'''
+
+        for table in self.tables:
+            self.assertEqual(sorted(self.rows(table)), sorted(self.decoder.decode(self.encoder.encode(table).encode('utf-8'))))
+
+    def test_decode_missing(self):
+        '''DeltaDecoder.decode waits for a keyframe after a missing table'''
+
+        encoded = [ self.encoder.encode(_) for _ in self.tables ]
+
+        self.assertIsNone(self.decoder.decode(encoded[1]))
+
+        self.decoder.decode(encoded[0])
+
+        self.assertIsNone(self.decoder.decode(encoded[2]))
+        self.assertEqual(self.rows(self.tables[3]), self.decoder.decode(encoded[3]))
+
+    def test_decode_invalid(self):
+        '''DeltaDecoder.decode raises ValueError for other output'''
+
+        self.assertRaises(ValueError, self.decoder.decode, 'USER PID')
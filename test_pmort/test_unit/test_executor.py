@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+import threading
+
+from pmort.executor import AsyncCollectorExecutor
+from pmort.executor import CollectorExecutor
+
+class CollectorExecutorTest(unittest.TestCase):
+    def setUp(self):
+        self.e = CollectorExecutor(2)
+        self.addCleanup(self.e.shutdown)
+
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def test_skip_if_running(self):
+        '''CollectorExecutor skips running collectors'''
+
+        self.assertTrue(self.e.submit('slow', self.release.wait))
+        self.assertFalse(self.e.submit('slow', self.release.wait))
+
+        self.assertEqual(1, self.e.skipped)
+
+    def test_overrun(self):
+        '''CollectorExecutor counts overruns'''
+
+        self.e.submit('slow', self.release.wait)
+        self.e.submit('fast', lambda: None)
+
+        self.assertEqual([ 'slow' ], self.e.wait(0.1))
+        self.assertEqual(1, self.e.overrun)
+
+    def test_errors(self):
+        '''CollectorExecutor counts errors'''
+
+        self.e.submit('broken', lambda: 1 / 0)
+        self.e.wait(1)
+
+        self.assertEqual(1, self.e.errors)
+
+    def test_collect(self):
+        '''CollectorExecutor writes collected output'''
+
+        written = []
+
+        self.e.write = lambda *args: written.append(args)
+
+        self.e.collect('text', lambda: 'output', 'snapshot')
+        self.e.collect('none', lambda: None, 'snapshot')
+        self.e.wait(1)
+
+        self.assertEqual([ ( 'text', 'output', 'snapshot' ) ], written)
+
+    def test_collect_snapshot(self):
+        '''CollectorExecutor gives queued collectors their cycle's snapshot'''
+
+        snapshots = []
+        done = threading.Event()
+
+        def collector(snapshot):
+            snapshots.append(snapshot)
+            done.set()
+
+        collector.writes_output = True
+
+        for _ in range(2):
+            self.e.submit('slow {0}'.format(_), self.release.wait)
+
+        self.e.collect('script', collector, 'first')
+
+        self.release.set()
+
+        self.assertTrue(done.wait(5))
+        self.assertEqual([ 'first' ], snapshots)
+
+class AsyncCollectorExecutorTest(CollectorExecutorTest):
+    def setUp(self):
+        self.written = []
+
+        self.e = AsyncCollectorExecutor(2, lambda *args: self.written.append(args))
+        self.addCleanup(self.e.shutdown)
+
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def test_collect_coroutine(self):
+        '''AsyncCollectorExecutor awaits collectors\' coroutines'''
+
+        async def coroutine(write):
+            return b'output'
+
+        def collector():
+            raise AssertionError('collector called instead of its coroutine')
+
+        collector.coroutine = coroutine
+
+        for _ in range(100):
+            self.e.collect('coroutine {0}'.format(_), collector, 'snapshot')
+
+        self.assertEqual([], self.e.wait(5))
+
+        self.assertEqual(0, self.e.errors)
+        self.assertEqual(100, len(self.written))
+        self.assertEqual(( 'coroutine 0', b'output', 'snapshot' ), sorted(self.written)[0])
+
+    def test_collect_coroutine_write(self):
+        '''AsyncCollectorExecutor lets coroutines write and raise'''
+
+        async def coroutine(write):
+            await write(b'output')
+
+            raise RuntimeError('failed')
+
+        collector = lambda: None
+        collector.coroutine = coroutine
+
+        self.e.collect('failing', collector, 'snapshot')
+
+        self.assertEqual([], self.e.wait(5))
+
+        self.assertEqual(1, self.e.errors)
+        self.assertEqual([ ( 'failing', b'output', 'snapshot' ) ], self.written)
+
+    def test_running(self):
+        '''AsyncCollectorExecutor counts running and queued collectors'''
+
+        for _ in range(3):
+            self.e.submit('slow {0}'.format(_), self.release.wait)
+
+        self.e.wait(0.1)
+
+        self.assertEqual(2, self.e.running)
+        self.assertEqual(1, self.e.queued)
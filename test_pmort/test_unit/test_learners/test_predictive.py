@@ -0,0 +1,103 @@
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+import mock
+
+from pmort.learners import predictive
+from pmort.learners.predictive import PredictiveLearner
+from pmort.learners.predictive import coefficients
+from pmort.learners.predictive import predict
+
+class PredictTest(unittest.TestCase):
+    def test_coefficients(self):
+        '''coefficients of the parabola through the load averages'''
+
+        for a, b, c in coefficients([ ( 4.0, 2.0, 1.0 ) ]):
+            for t, load in ( ( 1, 4.0 ), ( 5, 2.0 ), ( 15, 1.0 ) ):
+                self.assertAlmostEqual(load, a * t ** 2 + b * t + c)
+
+    def test_predict_steady(self):
+        '''predict a steady load'''
+
+        self.assertAlmostEqual(2.0, predict([ ( 2.0, 2.0, 2.0 ) ] * 3))
+
+    def test_predict_rising(self):
+        '''predict a rising load above the current one'''
+
+        self.assertGreater(predict([ ( 4.0, 2.0, 1.0 ) ]), 4.0)
+        self.assertEqual(0.0, predict([ ( 0.0, 2.0, 4.0 ) ]))
+
+    def test_predict_history(self):
+        '''predict weighs the newest load averages most'''
+
+        loads = [ ( 1.0, 1.0, 1.0 ), ( 4.0, 2.0, 1.0 ) ]
+
+        self.assertGreater(predict(loads[::-1]), predict(loads[:1]))
+        self.assertLess(predict(loads), predict(loads[1:]))
+
+    @unittest.skipIf(predictive.numpy is None, 'requires numpy')
+    def test_predict_numpy(self):
+        '''predict with and without numpy agree'''
+
+        loads = [ ( 1.0, 1.5, 3.0 ), ( 4.0, 2.0, 1.0 ) ]
+
+        expected = predict(loads)
+
+        with mock.patch.object(predictive, 'numpy', None):
+            self.assertAlmostEqual(expected, predict(loads))
+
+class PredictiveLearnerTimeTest(unittest.TestCase):
+    def setUp(self):
+        _ = mock.patch('pmort.learners.statistical.os.getloadavg')
+        self.mock_load = _.start()
+        self.addCleanup(_.stop)
+
+        _ = mock.patch('pmort.learners.statistical.os.cpu_count', return_value = 4)
+        _.start()
+        self.addCleanup(_.stop)
+
+        parameters = {
+                'learner.minimum_interval': 1,
+                'learner.maximum_interval': 601,
+                'learner.smoothing': 900.0,
+                'learner.half_life': 86400.0,
+                'learner.checkpoint_interval': 86400.0,
+                'learner.prediction_horizon': 1.0,
+                'learner.history': 4,
+                'pmort.cache_directory': '/nonexistent',
+                }
+
+        for _ in ( 'pmort.learners.statistical.PARAMETERS', 'pmort.learners.predictive.PARAMETERS' ):
+            _ = mock.patch(_)
+            mock_parameters = _.start()
+            self.addCleanup(_.stop)
+
+            mock_parameters.__getitem__.side_effect = parameters.__getitem__
+
+        self.now = [ 0.0 ]
+
+        self.l = PredictiveLearner(clock = lambda: self.now[0])
+
+    def test_predictive_times(self):
+        '''Predictive Times'''
+
+        for _ in range(5):
+            self.now[0] += 30
+            self.mock_load.return_value = ( 0.5, 0.5, 0.5 )
+
+            self.assertEqual(601, self.l.time())
+
+        self.assertAlmostEqual(0.0, self.l.error)
+        self.assertEqual(3, self.l.checked)
+
+        for _ in range(4):
+            self.now[0] += 30
+            self.mock_load.return_value = ( 2.0, 0.8, 0.6 )
+
+            interval = self.l.time()
+
+        self.assertGreater(self.l.prediction, 2.0)
+        self.assertLess(interval, 601 - self.l.scale(self.l.load) * 600)
@@ -0,0 +1,138 @@
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+import random
+import mock
+
+from pmort.learners.statistical import P2Quantile
+from pmort.learners.statistical import RunningStatistics
+from pmort.learners.statistical import StatisticalLearner
+
+class P2QuantileTest(unittest.TestCase):
+    def test_value(self):
+        '''P2Quantile estimates the 99th percentile'''
+
+        generator = random.Random(0)
+
+        quantile = P2Quantile(0.99)
+
+        for _ in range(10000):
+            quantile.add(generator.uniform(0, 100))
+
+        self.assertAlmostEqual(99, quantile.value(), delta = 1)
+
+    def test_value_few(self):
+        '''P2Quantile with fewer than five observations'''
+
+        quantile = P2Quantile(0.5)
+
+        self.assertIsNone(quantile.value())
+
+        for _ in ( 3, 1, 2 ):
+            quantile.add(_)
+
+        self.assertEqual(2, quantile.value())
+
+class RunningStatisticsTest(unittest.TestCase):
+    def test_mean(self):
+        '''RunningStatistics.mean follows a level change'''
+
+        statistics = RunningStatistics(smoothing = 60, half_life = 3600)
+
+        for _ in range(100):
+            statistics.add(1.0, 10)
+
+        self.assertAlmostEqual(1.0, statistics.mean)
+        self.assertAlmostEqual(0.0, statistics.deviation)
+
+        for _ in range(100):
+            statistics.add(3.0, 10)
+
+        self.assertAlmostEqual(3.0, statistics.mean, places = 3)
+
+    def test_maximum(self):
+        '''RunningStatistics.maximum decays halfway every half_life'''
+
+        statistics = RunningStatistics(smoothing = 60, half_life = 3600)
+
+        statistics.add(1.0, 0)
+        statistics.add(9.0, 10)
+        statistics.add(1.0, 3600)
+
+        self.assertAlmostEqual(5.0, statistics.maximum)
+
+    def test_state(self):
+        '''RunningStatistics.restore of its own state'''
+
+        statistics = RunningStatistics()
+
+        for _ in range(10):
+            statistics.add(_, 1)
+
+        restored = RunningStatistics()
+        restored.restore(statistics.state())
+
+        self.assertEqual(statistics.state(), restored.state())
+
+class StatisticalLearnerTimeTest(unittest.TestCase):
+    def setUp(self):
+        _ = mock.patch('pmort.learners.statistical.os.getloadavg')
+        self.mock_load = _.start()
+        self.addCleanup(_.stop)
+
+        _ = mock.patch('pmort.learners.statistical.os.cpu_count', return_value = 2)
+        _.start()
+        self.addCleanup(_.stop)
+
+        _ = mock.patch('pmort.learners.statistical.PARAMETERS')
+        mock_parameters = _.start()
+        self.addCleanup(_.stop)
+
+        mock_parameters.__getitem__.side_effect = lambda _: {
+                'learner.minimum_interval': 1,
+                'learner.maximum_interval': 601,
+                'learner.smoothing': 900.0,
+                'learner.half_life': 86400.0,
+                'learner.checkpoint_interval': 86400.0,
+                'pmort.cache_directory': '/nonexistent',
+                }[_]
+
+        self.now = [ 0.0 ]
+
+        self.l = StatisticalLearner(clock = lambda: self.now[0])
+
+    def test_statistical_times(self):
+        '''Statistical Times'''
+
+        for _ in range(10):
+            self.now[0] += 60
+            self.mock_load.return_value = ( 0.5, )
+
+            self.assertEqual(601, self.l.time())
+
+        self.assertFalse(self.l.anomalous())
+
+        self.now[0] += 60
+        self.mock_load.return_value = ( 1.25, )
+
+        self.assertAlmostEqual(301, self.l.time(), delta = 20)
+
+        self.now[0] += 60
+        self.mock_load.return_value = ( 4.0, )
+
+        self.assertEqual(1, self.l.time())
+        self.assertTrue(self.l.anomalous())
+
+    def test_statistical_overload(self):
+        '''Statistical Times—sustained overload'''
+
+        for _ in range(600):
+            self.now[0] += 60
+            self.mock_load.return_value = ( 35.0 if _ % 2 else 45.0, )
+
+            interval = self.l.time()
+
+        self.assertLess(interval, 301)
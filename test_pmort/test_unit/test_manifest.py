@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import functools
+import mock
+import os
+import shutil
+import sys
+import unittest
+
+from pmort.manifest import LazyRegistry
+
+MODULES = {
+        'pmort_manifest_first.py': 'from pmort_manifest_registry import REGISTRY\n\nREGISTRY[\'first\'] = 1\nREGISTRY["second"] = 2\n',
+        'pmort_manifest_broken.py': 'import pmort_manifest_missing\nfrom pmort_manifest_registry import REGISTRY\n\nREGISTRY[\'broken\'] = 3\n',
+        'pmort_manifest_generator.py': 'from pmort_manifest_registry import REGISTRY\n\nGENERATED = True\n',
+        'pmort_manifest_unrelated.py': 'UNRELATED = True\n',
+        }
+
+class LazyRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = '/tmp/test_pmort'
+
+        os.makedirs(self.directory)
+        self.addCleanup(functools.partial(shutil.rmtree, self.directory))
+
+        for filename, source in MODULES.items():
+            with open(os.path.join(self.directory, filename), 'w') as module_fh:
+                module_fh.write(source)
+
+        self.registry = LazyRegistry('REGISTRY', markers = ( 'GENERATED', ))
+
+        _ = type(sys)('pmort_manifest_registry')
+        _.REGISTRY = self.registry
+
+        sys.modules['pmort_manifest_registry'] = _
+
+        def remove_modules():
+            for name in [ 'pmort_manifest_registry' ] + [ _[:-3] for _ in MODULES.keys() ]:
+                sys.modules.pop(name, None)
+
+        self.addCleanup(remove_modules)
+
+        self.registry.scan('', self.directory, update_path = True)
+
+    def test_scan_imports_nothing(self):
+        '''LazyRegistry.scan lists names without importing'''
+
+        self.assertEqual([ 'broken', 'first', 'second' ], sorted(self.registry.keys()))
+        self.assertIn('first', self.registry)
+
+        self.assertNotIn('pmort_manifest_first', sys.modules)
+        self.assertEqual({}, self.registry.loaded())
+
+    def test_lookup_imports_module(self):
+        '''LazyRegistry imports a module on its first lookup'''
+
+        self.assertEqual(2, self.registry['second'])
+        self.assertEqual({ 'first': 1, 'second': 2 }, self.registry.loaded())
+
+        self.assertNotIn('pmort_manifest_generator', sys.modules)
+        self.assertNotIn(self.directory, sys.path)
+
+    def test_load(self):
+        '''LazyRegistry.load imports everything and drops unregistered names'''
+
+        self.registry.load()
+
+        self.assertIn('pmort_manifest_generator', sys.modules)
+        self.assertNotIn('pmort_manifest_unrelated', sys.modules)
+
+        self.assertEqual({ 'first': 1, 'second': 2 }, dict(self.registry))
+
+        with self.assertRaises(KeyError):
+            self.registry['broken']
+
+    def test_scan_lazy(self):
+        '''LazyRegistry.scan with lazy scans on first use'''
+
+        registry = LazyRegistry('REGISTRY')
+        registry.scan('', self.directory, lazy = True)
+
+        with open(os.path.join(self.directory, 'pmort_manifest_late.py'), 'w') as module_fh:
+            module_fh.write('from pmort_manifest_registry import REGISTRY\n\nREGISTRY[\'late\'] = 4\n')
+
+        self.assertIn('late', registry)
+
+    def test_cache(self):
+        '''LazyRegistry doesn't read unchanged modules in its cache'''
+
+        path = os.path.join(self.directory, 'cache', 'registry.json')
+
+        self.registry.write_cache(path)
+
+        registry = LazyRegistry('REGISTRY', markers = ( 'GENERATED', ))
+        registry.read_cache(path)
+
+        with mock.patch('pmort.manifest.open', side_effect = AssertionError('module read'), create = True):
+            registry.scan('', self.directory)
+
+        self.assertEqual(sorted(self.registry.keys()), sorted(registry.keys()))
+
+        with open(os.path.join(self.directory, 'pmort_manifest_first.py'), 'a') as module_fh:
+            module_fh.write('REGISTRY[\'third\'] = 3\n')
+
+        registry = LazyRegistry('REGISTRY', markers = ( 'GENERATED', ))
+        registry.read_cache(path)
+        registry.scan('', self.directory)
+
+        self.assertIn('third', registry)
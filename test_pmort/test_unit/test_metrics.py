@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+
+from pmort.metrics import Registry
+
+class RegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter(self):
+        '''Registry.counter renders a value per label set'''
+
+        errors = self.registry.counter('errors_total', 'Errors.')
+
+        errors.increment(collector = 'ps')
+        errors.increment(2, collector = 'ps')
+        errors.increment(collector = 'a"b')
+
+        self.assertIs(errors, self.registry.counter('errors_total', 'Errors.'))
+
+        self.assertEqual('\n'.join([
+            '# HELP errors_total Errors.',
+            '# TYPE errors_total counter',
+            'errors_total{collector="a\\"b"} 1',
+            'errors_total{collector="ps"} 3',
+            '' ]), self.registry.render())
+
+    def test_gauge_function(self):
+        '''Registry.gauge reads its function when rendered'''
+
+        values = [ 1.5 ]
+
+        self.registry.gauge('lag', 'Lag.', lambda: values[0])
+        self.registry.gauge('unset', 'Unset.', lambda: None)
+
+        values[0] = 2.5
+
+        self.assertIn('\nlag 2.5\n', self.registry.render())
+        self.assertNotIn('\nunset ', self.registry.render())
+
+    def test_histogram(self):
+        '''Registry.histogram renders cumulative buckets'''
+
+        duration = self.registry.histogram('duration_seconds', 'Duration.', buckets = ( 0.1, 1.0 ))
+
+        for _ in ( 0.05, 0.1, 0.5, 5.0 ):
+            duration.observe(_, collector = 'ps')
+
+        lines = self.registry.render().splitlines()
+
+        self.assertIn('duration_seconds_bucket{collector="ps",le="0.1"} 2', lines)
+        self.assertIn('duration_seconds_bucket{collector="ps",le="1.0"} 3', lines)
+        self.assertIn('duration_seconds_bucket{collector="ps",le="+Inf"} 4', lines)
+        self.assertIn('duration_seconds_sum{collector="ps"} 5.65', lines)
+        self.assertIn('duration_seconds_count{collector="ps"} 4', lines)
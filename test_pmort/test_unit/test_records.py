@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+import mock
+
+from pmort import records
+
+class RecordsTest(unittest.TestCase):
+    def setUp(self):
+        self.records = [ { 'load1': 0.5, 'name': 'a\nb' }, { 'load1': 1.0, 'name': None } ]
+
+    def test_json(self):
+        '''encode and decode json records'''
+
+        _ = records.encode(self.records)
+
+        self.assertTrue(records.is_records(_))
+        self.assertEqual(b'#pmort-records\tjson\n{"load1":0.5,"name":"a\\nb"}\n{"load1":1.0,"name":null}\n', _)
+        self.assertEqual(self.records, records.decode(_))
+
+    @unittest.skipIf(records.msgpack is None, 'requires msgpack')
+    def test_msgpack(self):
+        '''encode and decode msgpack records'''
+
+        _ = records.encode(self.records, records.MSGPACK)
+
+        self.assertTrue(_.startswith(b'#pmort-records\tmsgpack\n'))
+        self.assertEqual(self.records, records.decode(_))
+
+    def test_msgpack_missing(self):
+        '''encode falls back to json without msgpack'''
+
+        with mock.patch.object(records, 'msgpack', None):
+            _ = records.encode(self.records, records.MSGPACK)
+
+        self.assertEqual(self.records, records.decode(_))
+        self.assertTrue(_.startswith(b'#pmort-records\tjson\n'))
+
+    def test_decode_text(self):
+        '''decode refuses plain text'''
+
+        self.assertRaises(ValueError, records.decode, b'0.1, 0.2, 0.3')
+
+    def test_normalize(self):
+        '''normalize single records and sequences'''
+
+        self.assertTrue(records.is_structured({}))
+        self.assertFalse(records.is_structured('text'))
+        self.assertEqual([ { 'a': 1 } ], records.normalize({ 'a': 1 }))
+        self.assertEqual([ { 'a': 1 } ], records.normalize(( { 'a': 1 }, )))
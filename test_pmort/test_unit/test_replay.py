@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import io
+import unittest
+import mock
+
+from pmort.parameters import PARAMETERS
+from pmort.replay import Incident
+from pmort.replay import read_csv
+from pmort.replay import replay
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        _ = mock.patch.object(PARAMETERS, 'parsed', True) # unparsed lookups inspect the stack
+        _.start()
+        self.addCleanup(_.stop)
+
+        lines = [ 'time,load1,load5,load15,memory,incident' ]
+
+        for second in range(0, 3600, 10):
+            incident = 1800 <= second < 2400
+            load = 16.0 if incident else 0.5
+
+            lines.append('{0},{1},{1},{1},{2},{3}'.format(second, load, 1.0 if incident else 0.0, int(incident)))
+
+        self.trace = read_csv(io.StringIO('\n'.join(lines)))
+
+    def test_read_csv(self):
+        '''read_csv with optional columns'''
+
+        trace = read_csv(io.StringIO('time,load1,cpu\n20,2.5,0.5\n10,1.5,\n'))
+
+        self.assertEqual([ 10.0, 20.0 ], trace.times)
+        self.assertEqual(( 1.5, 1.5, 1.5 ), trace.rows[0].loads)
+        self.assertEqual({}, trace.rows[0].signals)
+        self.assertEqual({ 'cpu': 0.5 }, trace.rows[1].signals)
+        self.assertIsNone(trace.rows[1].incident)
+
+        trace.now = 15
+        self.assertEqual(( 1.5, 1.5, 1.5 ), trace.loadavg())
+
+    def test_read_csv_missing_columns(self):
+        '''read_csv without a load1 column'''
+
+        self.assertRaises(ValueError, read_csv, io.StringIO('time,load5\n1,2\n'))
+
+    def test_read_csv_missing_time(self):
+        '''read_csv with a row without a time'''
+
+        with self.assertRaisesRegex(ValueError, 'row 1: missing time'):
+            read_csv(io.StringIO('time,load1\n,1\n5,2\n'))
+
+    def test_incidents(self):
+        '''Trace.incidents from marks and from the load'''
+
+        self.assertEqual([ Incident(1800.0, 2400.0) ], self.trace.incidents(1000.0))
+
+        trace = read_csv(io.StringIO('time,load1\n0,1\n10,9\n20,9\n30,1\n40,9\n'))
+
+        self.assertEqual([ Incident(10.0, 30.0), Incident(40.0, 40.0) ], trace.incidents(4.0))
+
+    def test_replay(self):
+        '''replay catches the incident with every learner'''
+
+        incidents = self.trace.incidents(1000.0)
+
+        for name in ( 'linear', 'statistical', 'predictive', 'pressure' ):
+            result = replay(name, self.trace, incidents, 100)
+
+            self.assertEqual(1, result.caught, name)
+            self.assertEqual(result.samples * 100, result.bytes)
+            self.assertLess(result.samples, 3600)
+            self.assertLessEqual(result.delays[0], 600.0)
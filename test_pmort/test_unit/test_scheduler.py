@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+
+from pmort.scheduler import Scheduler
+from pmort.scheduler import CollectorScheduler
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def wait(self, seconds):
+        # Wake up early (as a stray signal would) at most half way.
+        self.now += max(seconds / 2, 0.001)
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.s = Scheduler(self.clock, self.clock.wait)
+
+    def test_no_drift(self):
+        '''Scheduler deadlines don't drift'''
+
+        for cycle in range(1, 4):
+            self.clock.now += 0.3
+
+            self.assertEqual(100.0 + cycle * 0.5, self.s.advance(0.5))
+
+            self.s.sleep()
+
+            self.assertTrue(self.clock.now >= self.s.deadline)
+            self.assertTrue(self.s.lag < 0.01)
+
+    def test_missed(self):
+        '''Scheduler skips missed cycles'''
+
+        self.clock.now += 2.5
+
+        self.assertEqual(103.0, self.s.advance(1.0))
+        self.assertEqual(2, self.s.missed)
+
+class CollectorSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.s = CollectorScheduler(self.clock, self.clock.wait)
+
+    def test_independent(self):
+        '''CollectorScheduler runs collectors independently'''
+
+        self.s.update([ 'cheap', 'expensive' ])
+
+        runs = []
+
+        while self.clock.now < 110.0:
+            for name in self.s.due():
+                runs.append(name)
+
+                self.s.reschedule(name, { 'cheap': 1.0, 'expensive': 5.0 }[name])
+
+            self.s.sleep()
+
+        self.assertEqual(10, runs.count('cheap'))
+        self.assertEqual(2, runs.count('expensive'))
+
+    def test_update(self):
+        '''CollectorScheduler.update'''
+
+        self.s.update([ 'first' ])
+        self.assertEqual([ 'first' ], self.s.due())
+
+        self.s.reschedule('first', 1.0)
+        self.s.update([ 'second' ])
+
+        self.assertEqual([ 'second' ], self.s.due())
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 by Alex Brandt <alunduil@alunduil.com>
+#
+# pmort is freely distributable under the terms of an MIT-style license.
+# See COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+import unittest
+import mock
+
+from pmort.collectors import Schedule
+from pmort.throttle import Throttle
+from pmort.throttle import Usage
+from pmort.throttle import RELAX_WINDOWS
+from pmort.throttle import MAXIMUM_LEVEL
+
+class ThrottleTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.usage = Usage(0.0, 1000, 0)
+
+        self.throttle = Throttle(0.1, 2000, 100, clock = lambda: self.now, measure = lambda: self.usage)
+
+        _ = mock.patch('pmort.throttle.priority')
+        self.priority = _.start()
+        self.addCleanup(_.stop)
+
+        self.priority.lower_priority.return_value = { 1: ( 0, None ) }
+
+        self.expensive = Schedule(None, 'expensive', None)
+        self.cheap = Schedule(None, 'cheap', None)
+
+    def cycle(self, cpu = 0.0, rss = 1000, written = 0, seconds = 10.0):
+        self.now += seconds
+        self.usage = Usage(self.usage.cpu + cpu, rss, self.usage.written + written)
+
+        return self.throttle.update()
+
+    def test_escalate(self):
+        '''Throttle escalates while over budget'''
+
+        self.assertEqual(0, self.throttle.update())
+
+        self.assertEqual(1, self.cycle(cpu = 5.0))
+        self.priority.lower_priority.assert_called_once_with()
+
+        self.assertTrue(self.throttle.allows(self.expensive))
+        self.assertEqual(1, self.cycle(written = 500))
+
+        self.assertEqual(2, self.cycle(written = 5000))
+        self.assertFalse(self.throttle.allows(self.expensive))
+        self.assertTrue(self.throttle.allows(self.cheap))
+        self.assertEqual(10.0, self.throttle.stretch(10.0))
+
+        self.assertEqual(3, self.cycle(rss = 4000))
+        self.assertEqual(20.0, self.throttle.stretch(10.0))
+
+        for _ in range(10):
+            self.cycle(cpu = 5.0)
+
+        self.assertEqual(MAXIMUM_LEVEL, self.throttle.level)
+
+    def test_relax(self):
+        '''Throttle relaxes after RELAX_WINDOWS calm windows'''
+
+        self.throttle.update()
+        self.cycle(cpu = 5.0)
+
+        for _ in range(RELAX_WINDOWS - 1):
+            self.assertEqual(1, self.cycle(cpu = 0.9))
+
+        self.assertEqual(1, self.cycle(cpu = 0.9))
+
+        for _ in range(RELAX_WINDOWS - 1):
+            self.assertEqual(1, self.cycle())
+
+        self.assertEqual(0, self.cycle())
+        self.priority.restore_priority.assert_called_once_with({ 1: ( 0, None ) })
+
+    def test_window(self):
+        '''Throttle measures over at least a window'''
+
+        self.throttle.update()
+
+        self.assertEqual(0, self.cycle(cpu = 0.3, seconds = 1.0))
+        self.assertEqual(0, self.cycle(cpu = 0.3, seconds = 1.0))
+
+        for _ in range(8):
+            self.assertEqual(0, self.cycle(seconds = 1.0))
+
+        self.assertEqual(0, self.throttle.level)
+
+        for _ in range(10):
+            self.cycle(cpu = 0.3, seconds = 1.0)
+
+        self.assertEqual(1, self.throttle.level)